@@ -0,0 +1,59 @@
+from contextlib import contextmanager
+
+# assisted generation reads these from the draft model's generation_config, not from generate() kwargs
+DRAFT_CONFIG_KEYS = ("num_assistant_tokens", "num_assistant_tokens_schedule", "assistant_confidence_threshold")
+
+
+# acceptance statistics of assisted (draft-model) decoding, per agent role.
+# forward hooks count the main model's verification steps and the draft's proposal steps:
+# every draft forward proposes one token, every main forward accepts some of them plus one token of its own,
+# so accepted = generated - main steps and acceptance rate = accepted / drafted.
+class AssistStats:
+    def __init__(self):
+        self.by_role = {}
+
+    @contextmanager
+    def track(self, role, model, draft, config: dict = None):
+        counts = {"main": 0, "draft": 0}
+        def counter(name):
+            def hook(module, args, output):
+                counts[name] += 1
+            return hook
+
+        saved = {k: getattr(draft.generation_config, k) for k in DRAFT_CONFIG_KEYS}
+        for k, v in (config or {}).items():
+            setattr(draft.generation_config, k, v)
+        handles = [model.register_forward_hook(counter("main")), draft.register_forward_hook(counter("draft"))]
+        call = {"TOKENS": 0}
+        try:
+            yield call
+        finally:
+            for h in handles:
+                h.remove()
+            for k, v in saved.items():
+                setattr(draft.generation_config, k, v)
+        s = self.by_role.setdefault(role or "?", {"CALLS": 0, "TOKENS": 0, "MAIN_STEPS": 0, "DRAFTED": 0})
+        s["CALLS"] += 1
+        s["TOKENS"] += call["TOKENS"]
+        s["MAIN_STEPS"] += counts["main"]
+        s["DRAFTED"] += counts["draft"]
+
+    def summary(self) -> dict:
+        out = {}
+        for role, s in self.by_role.items():
+            accepted = max(s["TOKENS"] - s["MAIN_STEPS"], 0)
+            out[role] = {
+                **s,
+                "ACCEPTED": accepted,
+                "ACCEPTANCE_RATE": accepted / s["DRAFTED"] if s["DRAFTED"] else None,
+                "TOKENS_PER_MAIN_STEP": s["TOKENS"] / s["MAIN_STEPS"] if s["MAIN_STEPS"] else None,
+            }
+        return out
+
+    def report(self) -> str:
+        lines = []
+        for role, s in self.summary().items():
+            rate = s["ACCEPTANCE_RATE"]
+            lines.append(f"[assisted] {role}: {s['CALLS']} calls, {s['TOKENS']} tokens in {s['MAIN_STEPS']} main steps, "
+                         f"acceptance {rate:.0%}" if rate is not None else f"[assisted] {role}: {s['CALLS']} calls, no drafts")
+        return "\n".join(lines)
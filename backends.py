@@ -0,0 +1,218 @@
+import hashlib
+import json
+import urllib.error
+import urllib.request
+
+from history_compact import approx_tokens
+from setting_new_pipe import PROFILE_DEFAULT
+
+
+# Every generation backend answers the same contract:
+#   backend.generate(chats, params) -> [answer text, ...]
+# chats:  a batch of chat message lists ([{"role": ..., "content": ...}, ...])
+# params: one dict per chat (or one dict for the whole batch, or None) with
+#         max_new_tokens / do_sample / temperature / top_p / top_k / seed (the role's generation profile,
+#         see generation_params) and the per-call options
+#         stop (stop strings), stop_json (stop once the top-level JSON object is closed),
+#         schema (constrained JSON), role (which agent makes the call, e.g. "style" or "final_object",
+#         backends may configure calls per role), round, metrics (a dict the backend fills with
+#         token counts and timings, see metrics.py), thinking (False: render the chat with thinking off,
+#         see setting_new_pipe.ROLE_PROFILES) and conv_cache (HF only).
+# answers come back in the order of chats with the thinking span already removed;
+# options a backend can not honour are ignored.
+# The HF backend lives next to the transformers code it wraps (debate_rounds_new_pipe.HFBackend).
+class Backend:
+    name = "base"
+
+    def generate(self, chats: list, params=None) -> list:
+        raise NotImplementedError
+
+    # prompt token count, exact where the backend has the tokenizer
+    def count_tokens(self, text: str) -> int:
+        return approx_tokens(text)
+
+    # the prompt as the model sees it (chat template applied where the backend knows it), used as cache key
+    def render(self, chat: list) -> str:
+        return json.dumps(chat, ensure_ascii=False)
+
+
+def build_messages(system_prompt, user_prompt: str):
+    messages = []
+    if isinstance(system_prompt,str):
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": user_prompt})
+    return messages
+
+
+def per_chat_params(params, n: int) -> list:
+    if params is None or isinstance(params, dict):
+        return [dict(params or {}) for _ in range(n)]
+    return [dict(p or {}) for p in params]
+
+
+# generate kwargs of one call. A call with a role carries its profile (setting_new_pipe.ROLE_PROFILES),
+# a call without one gets PROFILE_DEFAULT; a greedy call (do_sample=False) carries no sampling keys at all
+SAMPLING_KEYS = ("temperature", "top_p", "top_k")
+
+
+def generation_params(params: dict) -> dict:
+    gen = dict(params) if params.get("role") is not None else {**PROFILE_DEFAULT, **params}
+    if gen.get("do_sample") is False:
+        gen = {k: v for k, v in gen.items() if k not in SAMPLING_KEYS}
+    return gen
+
+
+# the debate generators yield (system, user, opts) specs, run them through any backend.
+# defaults (e.g. {"seed": 42}) go to every call, its own opts win
+def run_specs(backend: Backend, specs: list, defaults: dict = None) -> list:
+    chats = [build_messages(system_prompt, user_prompt) for system_prompt, user_prompt, _ in specs]
+    return backend.generate(chats, [{**(defaults or {}), **(opts or {})} for _, _, opts in specs])
+
+
+# text backends return the raw completion: drop the thinking span and whatever follows the JSON object
+def finish_text(text: str, params: dict) -> str:
+    if "</think>" in text:
+        text = text.rsplit("</think>", 1)[-1]
+    if params.get("stop_json"):
+        from stopping import JsonScanner
+        scanner = JsonScanner()
+        for i, ch in enumerate(text):
+            if scanner.feed(ch):
+                text = text[:i + 1]
+                break
+    return text.strip()
+
+
+# vLLM offline engine (LLM.chat), continuous batching and paged attention in-process.
+# works the same with vLLM's CPU build (VLLM_TARGET_DEVICE=cpu), engine_kwargs go to vllm.LLM,
+# e.g. dtype="bfloat16" on CPU; set VLLM_CPU_KVCACHE_SPACE to size the CPU KV cache.
+class VLLMBackend(Backend):
+    name = "vllm"
+
+    def __init__(self, model_name: str, **engine_kwargs):
+        from vllm import LLM
+        self.llm = LLM(model=model_name, **engine_kwargs)
+
+    def sampling_params(self, params: dict):
+        from vllm import SamplingParams
+        params = generation_params(params)
+        kw = {"max_tokens": params.get("max_new_tokens"), "seed": params.get("seed")}
+        if params.get("do_sample") is False:
+            kw["temperature"] = 0.0
+        else:
+            kw.update({k: params[k] for k in SAMPLING_KEYS if k in params})
+        if params.get("stop"):
+            # the HF path keeps the stop string (e.g. END_OF_PROMPT) in the answer, do the same here
+            kw["stop"] = list(params["stop"])
+            kw["include_stop_str_in_output"] = True
+        if params.get("schema") is not None:
+            from vllm.sampling_params import GuidedDecodingParams
+            kw["guided_decoding"] = GuidedDecodingParams(json=params["schema"])
+        return SamplingParams(**kw)
+
+    # thinking is a chat template option of the whole llm.chat call, calls are grouped by it
+    def generate(self, chats: list, params=None) -> list:
+        params = per_chat_params(params, len(chats))
+        groups = {}
+        for i, p in enumerate(params):
+            groups.setdefault(p.get("thinking"), []).append(i)
+        outs = [None] * len(chats)
+        for thinking, idxs in groups.items():
+            kwargs = {} if thinking is None else {"chat_template_kwargs": {"enable_thinking": thinking}}
+            group = self.llm.chat([chats[i] for i in idxs], [self.sampling_params(params[i]) for i in idxs],
+                                  use_tqdm=False, **kwargs)
+            for i, o in zip(idxs, group):
+                outs[i] = o
+        for o, p in zip(outs, params):
+            if p.get("metrics") is not None:
+                p["metrics"].update({"PROMPT_TOKENS": len(o.prompt_token_ids), "NEW_TOKENS": len(o.outputs[0].token_ids),
+                                     "CACHED_TOKENS": getattr(o, "num_cached_tokens", None) or 0})
+        return [finish_text(o.outputs[0].text, p) for o, p in zip(outs, params)]
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.llm.get_tokenizer().encode(text, add_special_tokens=False))
+
+    def render(self, chat: list) -> str:
+        return self.llm.get_tokenizer().apply_chat_template(chat, tokenize=False, add_generation_prompt=True)
+
+
+# deterministic fake model: the answer only depends on the chat and its params, no torch needed.
+# JSON calls get an object (filled from schema when given), final writers keep their stop string.
+class StubBackend(Backend):
+    name = "stub"
+
+    def generate(self, chats: list, params=None) -> list:
+        return [self.answer(chat, p) for chat, p in zip(chats, per_chat_params(params, len(chats)))]
+
+    def answer(self, chat: list, params: dict) -> str:
+        key = {k: v for k, v in params.items() if k not in ("conv_cache", "role", "round", "metrics")}
+        seed = hashlib.sha256(json.dumps([chat, key], ensure_ascii=False, sort_keys=True, default=str)
+                              .encode("utf-8")).hexdigest()[:8]
+        if params.get("schema") is not None:
+            return json.dumps(stub_value(params["schema"], seed), ensure_ascii=False)
+        if params.get("stop_json"):
+            return json.dumps({"STUB": seed})
+        if params.get("stop"):
+            return f"stub {seed} {params['stop'][0]}"
+        return f"stub {seed}"
+
+
+# client of inference_server.py: the model stays resident in the server, this process never imports torch.
+# conv_cache objects can not travel over HTTP, the server still reuses its prefix cache.
+class RemoteBackend(Backend):
+    name = "remote"
+
+    def __init__(self, url: str, timeout: float = None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def generate(self, chats: list, params=None) -> list:
+        params = [{k: v for k, v in p.items() if k not in ("conv_cache", "metrics")}
+                  for p in per_chat_params(params, len(chats))]
+        body = json.dumps({"chats": chats, "params": params}, ensure_ascii=False).encode("utf-8")
+        req = urllib.request.Request(self.url + "/generate", data=body,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read().decode("utf-8"))["outputs"]
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"inference server {self.url}: {e.read().decode('utf-8', 'replace')}") from e
+
+
+def stub_value(schema: dict, seed: str):
+    if "enum" in schema:
+        return schema["enum"][int(seed, 16) % len(schema["enum"])]
+    t = schema.get("type")
+    if t == "object":
+        return {k: stub_value(v, seed) for k, v in schema.get("properties", {}).items()}
+    if t == "array":
+        n = max(schema.get("minItems", 0), 1)
+        n = min(n, schema.get("maxItems", n))
+        return [stub_value(schema.get("items", {}), seed) for _ in range(n)]
+    if t == "number":
+        return 0.5
+    if t == "integer":
+        return 1
+    if t == "boolean":
+        return True
+    if t == "null":
+        return None
+    return f"stub {seed}"
+
+
+# vllm / stub by name; the HF backend needs the transformers code of debate_rounds_new_pipe.
+# kwargs go to HFBackend.load (quant, draft_name ...) or vllm.LLM
+def make_backend(name: str, model_name: str, **kwargs) -> Backend:
+    if name == "hf":
+        from debate_rounds_new_pipe import HFBackend
+        return HFBackend.load(model_name, **kwargs)
+    if kwargs.pop("quant", None):
+        raise ValueError("--quant only applies to the hf backend")
+    if name == "vllm":
+        return VLLMBackend(model_name, **kwargs)
+    if name == "stub":
+        return StubBackend()
+    raise ValueError(f"unknown backend: {name}")
+
+
+BACKEND_NAMES = ("hf", "vllm", "stub")
@@ -0,0 +1,6 @@
+# debate prompts every benchmark case and quality check runs on
+BENCH_PROMPTS = [
+    "Fauvism, Miyazaki Hayao, a girl and a dragon in the cave",
+    "Impressionism, Ukiyo-e, a fox and a paper lantern on a misty bridge",
+    "Van Gogh, Studio Ghibli, a windmill and a bicycle under swirling stars",
+]
@@ -0,0 +1,172 @@
+"""
+end-to-end benchmark of the debate pipeline on a tiny random Qwen3 (CPU, no checkpoint, no network):
+python -m bench --rounds 1 3 --concurrency 1 4 --out bench.json
+
+compare against a stored result, regressions are listed and the exit code is 1:
+python -m bench --rounds 1 3 --concurrency 1 4 --baseline bench.json --tolerance 0.15
+
+every case with and without a draft model (assisted decoding), with the draft's acceptance rate:
+python -m bench --layers 4 --assisted
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import platform
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+from bench.case import measure_case
+from bench.quality import quality_chats
+from bench.tiny_qwen3 import build_pair, build_tiny
+from json_constrained import JsonSchemaConstraint, min_tokens
+from quantize import QUANT_MODES, apply_quant, greedy_agreement
+from setting_new_pipe import (
+    SCHEMA_OBJ_ASK, SCHEMA_OBJ_ROUND, SCHEMA_OBJECT, SCHEMA_STY_ASK, SCHEMA_STY_ROUND, SCHEMA_STYLE
+)
+
+DEFAULT_MAX_NEW_TOKENS = 32
+
+# metric -> True when higher is better
+COMPARED = {"LATENCY_S": False, "TOKENS_PER_S": True, "PEAK_RSS_MB": False}
+
+
+# fewest tokens every schema of a --constrained debate can be completed in, a smaller cap would cut its JSON
+def constrained_min_tokens(tok, vocab_size: int) -> int:
+    schemas = (SCHEMA_STYLE, SCHEMA_OBJECT, SCHEMA_STY_ASK, SCHEMA_OBJ_ASK, SCHEMA_STY_ROUND, SCHEMA_OBJ_ROUND)
+    return max(min_tokens(JsonSchemaConstraint(tok, schema, vocab_size)) for schema in schemas)
+
+
+def run_bench(args) -> dict:
+    import torch
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    def build():
+        if args.assisted:
+            return build_pair(layers=args.layers, hidden=args.hidden, vocab_size=args.vocab, draft_layers=args.draft_layers)
+        return build_tiny(layers=args.layers, hidden=args.hidden, vocab_size=args.vocab) + (None,)
+
+    tok, model, draft = build()
+    need = constrained_min_tokens(tok, model.config.vocab_size) if args.constrained else 0
+    if args.max_new_tokens is None:
+        args.max_new_tokens = max(DEFAULT_MAX_NEW_TOKENS, need)
+    elif args.max_new_tokens < need:
+        raise SystemExit(f"[bench] --max-new-tokens {args.max_new_tokens} is below {need}, "
+                         f"the fewest tokens the --constrained schemas can be completed in")
+    quality = None
+    if args.quant:
+        # same random weights before quantization, so the quality check has its reference
+        quantized = apply_quant(build()[1], args.quant)
+        quality = greedy_agreement(tok, model, quantized, quality_chats(), args.max_new_tokens)
+        del quantized
+        print(f"[bench] {args.quant}: {quality['EXACT_MATCHES']}/{quality['CHATS']} greedy outputs identical, "
+              f"prefix agreement {quality['PREFIX_AGREEMENT']:.0%}")
+
+    cases = []
+    ctx = mp.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        # the case processes load the same weights from disk (quantized on load)
+        model_dir, draft_dir = str(Path(tmp) / "model"), str(Path(tmp) / "draft")
+        tok.save_pretrained(model_dir)
+        model.save_pretrained(model_dir)
+        if draft is not None:
+            tok.save_pretrained(draft_dir)
+            draft.save_pretrained(draft_dir)
+        del model, draft
+        # with --assisted every case runs twice on the same main model, without and with the draft
+        variants = [None, draft_dir] if args.assisted else [None]
+        for rounds, concurrency, variant in itertools.product(args.rounds, args.concurrency, variants):
+            with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+                case = pool.submit(measure_case, model_dir, variant, args, rounds, concurrency).result()
+            assisted = ""
+            if case["ASSISTED"]:
+                rate = case["ACCEPTANCE_RATE"]
+                assisted = f", assisted (acceptance {rate:.0%})" if rate is not None else ", assisted (no drafts)"
+            print(f"[bench] rounds {rounds} x {concurrency} debates{assisted}: {case['LATENCY_S']:.2f}s, "
+                  f"{case['NEW_TOKENS']} tokens, {case['TOKENS_PER_S']:.1f} tok/s, peak RSS {case['PEAK_RSS_MB']:.0f} MB")
+            cases.append(case)
+
+    return {
+        "CONFIG": {k: getattr(args, k) for k in ("layers", "hidden", "vocab", "max_new_tokens", "max_batch",
+                                                 "independent_tracks", "constrained", "repeat", "threads", "quant",
+                                                 "assisted", "draft_layers")},
+        "QUALITY": quality,
+        "ENV": {"PYTHON": platform.python_version(), "TORCH": torch.__version__,
+                "THREADS": torch.get_num_threads(), "MACHINE": platform.machine()},
+        "CASES": cases,
+    }
+
+
+# every compared metric of every case also found in the baseline; worse than tolerance (relative) is a regression
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    if result["CONFIG"] != baseline.get("CONFIG"):
+        print(f"[bench] warning: baseline ran with {baseline.get('CONFIG')}")
+    base_cases = {(c["ROUNDS"], c["CONCURRENCY"], c.get("ASSISTED", False)): c for c in baseline.get("CASES", [])}
+    regressions = []
+    for case in result["CASES"]:
+        base = base_cases.get((case["ROUNDS"], case["CONCURRENCY"], case["ASSISTED"]))
+        if base is None:
+            continue
+        for key, higher_is_better in COMPARED.items():
+            old, new = base[key], case[key]
+            if not old:
+                continue
+            change = (new - old) / old
+            worse = change < -tolerance if higher_is_better else change > tolerance
+            flag = "REGRESSION" if worse else "ok"
+            assisted = " assisted" if case["ASSISTED"] else ""
+            print(f"[bench] rounds {case['ROUNDS']} x {case['CONCURRENCY']}{assisted} {key}: {old:.3f} -> {new:.3f} "
+                  f"({change:+.1%}) {flag}")
+            if worse:
+                regressions.append({"ROUNDS": case["ROUNDS"], "CONCURRENCY": case["CONCURRENCY"], "ASSISTED": case["ASSISTED"],
+                                    "METRIC": key, "BASELINE": old, "VALUE": new, "CHANGE": change})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[1, 3], help="debate rounds per case")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="debates run together per case")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, timings are the median")
+    parser.add_argument("--max-new-tokens", type=int, default=None,
+                        help=f"tokens generated by every agent call (default {DEFAULT_MAX_NEW_TOKENS}, "
+                             f"with --constrained at least what the schemas need)")
+    parser.add_argument("--max-batch", type=int, default=16, help="max agent calls per generate call")
+    parser.add_argument("--layers", type=int, default=2, help="tiny model layers")
+    parser.add_argument("--hidden", type=int, default=128, help="tiny model hidden size")
+    parser.add_argument("--vocab", type=int, default=2048, help="tiny tokenizer vocab size")
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads (default: torch's choice)")
+    parser.add_argument("--independent-tracks", action="store_true", help="run the debates with --independent-tracks")
+    parser.add_argument("--constrained", action="store_true", help="run the debates with --constrained")
+    parser.add_argument("--quant", choices=QUANT_MODES, default=None,
+                        help="benchmark the model in this CPU mode, with a greedy quality check against the unquantized model")
+    parser.add_argument("--assisted", action="store_true",
+                        help="run every case also with an early-exit draft of the tiny model (assisted decoding, ASSISTED_ROLES)")
+    parser.add_argument("--draft-layers", type=int, default=1, help="layers of the --assisted draft model")
+    parser.add_argument("--out", type=str, default=None, help="write the results JSON here")
+    parser.add_argument("--baseline", type=str, default=None, help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative slowdown that counts as a regression")
+    parser.add_argument("--verbose", action="store_true", help="keep the debate output")
+    args = parser.parse_args()
+
+    result = run_bench(args)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            result["REGRESSIONS"] = compare(result, json.load(f), args.tolerance)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    if result.get("REGRESSIONS"):
+        print(f"[bench] {len(result['REGRESSIONS'])} regressions against {args.baseline}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import contextlib
+import io
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from assisted import AssistStats
+from backends import per_chat_params
+from bench import BENCH_PROMPTS
+from debate_batch import run_debates
+from debate_rounds_new_pipe import PREFIX_CACHE, HFBackend, debate_steps
+from metrics import METRICS_FILE, peak_host_mb, rollup
+from model_loader import load_model
+from run_log import EventLog, read_events
+
+# the benchmark cases, each measured in a process of its own (python -m bench starts them)
+
+
+# the random model never closes its JSON, so every call is capped at max_new_tokens and decodes greedily
+# (do_sample=False, generation_params then drops the sampling keys): each run generates exactly the same tokens
+class BenchBackend(HFBackend):
+    def __init__(self, tok, model, max_new_tokens: int, draft=None):
+        super().__init__(tok, model, draft=draft)
+        self.max_new_tokens = max_new_tokens
+
+    def generate(self, chats: list, params=None) -> list:
+        params = [{**p, "max_new_tokens": self.max_new_tokens, "do_sample": False}
+                  for p in per_chat_params(params, len(chats))]
+        return super().generate(chats, params)
+
+
+# one timed run of `concurrency` debates of `rounds` rounds, batched across debates like debate_batch.py
+def run_case(backend, rounds: int, concurrency: int, workdir: Path, max_batch: int,
+             independent_tracks: bool, constrained: bool) -> dict:
+    PREFIX_CACHE.clear()
+    backend.assist_stats = AssistStats()
+    outdirs = [workdir / f"debate_{i}" for i in range(concurrency)]
+    logs = [EventLog(d / METRICS_FILE) for d in outdirs]
+    debates = [debate_steps(BENCH_PROMPTS[i % len(BENCH_PROMPTS)], rounds, d,
+                            independent_tracks=independent_tracks, constrained=constrained,
+                            count_tokens=backend.count_tokens) for i, d in enumerate(outdirs)]
+    t0 = time.perf_counter()
+    run_debates(backend, debates, max_batch=max_batch, metrics_logs=logs)
+    latency = time.perf_counter() - t0
+    for log in logs:
+        log.close()
+
+    records = [rec for d in outdirs for rec in read_events(d / METRICS_FILE)]
+    tokens = sum(rec.get("NEW_TOKENS") or 0 for rec in records)
+    assist = backend.assist_stats.summary()
+    drafted = sum(s["DRAFTED"] for s in assist.values())
+    return {
+        "LATENCY_S": latency,
+        "CALLS": len(records),
+        "PROMPT_TOKENS": sum(rec.get("PROMPT_TOKENS") or 0 for rec in records),
+        "NEW_TOKENS": tokens,
+        "TOKENS_PER_S": tokens / latency,
+        "STAGES_S": {role: row["WALL_S"] for role, row in rollup(records, "ROLE").items()},
+        "PREFILL_S": sum(rec.get("PREFILL_S") or 0 for rec in records),
+        "DECODE_S": sum(rec.get("DECODE_S") or 0 for rec in records),
+        "ASSISTED": backend.draft is not None,
+        "ACCEPTANCE_RATE": sum(s["ACCEPTED"] for s in assist.values()) / drafted if drafted else None,
+        "ACCEPTANCE_BY_ROLE": {role: s["ACCEPTANCE_RATE"] for role, s in assist.items()},
+    }
+
+
+# one case, run in a process of its own so its PEAK_RSS_MB (the process-wide peak) covers that case alone.
+# the model (and draft) come from model_dir / draft_dir through the shared loader, in args.quant.
+# median over repeats for the timings, the rest is identical between repeats
+def measure_case(model_dir: str, draft_dir: str, args, rounds: int, concurrency: int) -> dict:
+    import torch
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    tok, model = load_model(model_dir, quant=args.quant, warmup=False, verbose=False)
+    draft = load_model(draft_dir, quant=args.quant, warmup=False, verbose=False)[1] if draft_dir else None
+    backend = BenchBackend(tok, model, args.max_new_tokens, draft=draft)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = []
+        with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO()):
+            # first calls pay for lazy imports and allocator warm-up
+            run_case(backend, 1, 1, Path(tmp) / "warmup", args.max_batch, args.independent_tracks, args.constrained)
+            for k in range(args.repeat):
+                runs.append(run_case(backend, rounds, concurrency, Path(tmp) / f"run_{k}",
+                                     args.max_batch, args.independent_tracks, args.constrained))
+    case = dict(runs[0])
+    for key in ("LATENCY_S", "TOKENS_PER_S", "PREFILL_S", "DECODE_S"):
+        case[key] = statistics.median(run[key] for run in runs)
+    case["STAGES_S"] = {role: statistics.median(run["STAGES_S"][role] for run in runs) for role in runs[0]["STAGES_S"]}
+    case["LATENCIES_S"] = [run["LATENCY_S"] for run in runs]
+    case.update({"ROUNDS": rounds, "CONCURRENCY": concurrency, "PEAK_RSS_MB": peak_host_mb()})
+    return case
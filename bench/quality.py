@@ -0,0 +1,44 @@
+"""
+greedy quality check of a CPU quant mode against the unquantized model, on the first agent calls of the benchmark prompts:
+python -m bench.quality --quant int8
+python -m bench.quality --quant bf16 --model Qwen/Qwen3-4B-Instruct-2507 --out quality_bf16.json
+"""
+
+import argparse
+import json
+
+from backends import build_messages
+from bench import BENCH_PROMPTS
+from quantize import QUANT_MODES, apply_quant, greedy_agreement, load_kwargs
+from setting_new_pipe import MODEL_NAME, SYS_MSG_OBJ_ASK_FIRST, SYS_MSG_STY_ASK_FIRST
+
+
+# the split agents are the first calls of every debate and see the raw prompt
+def quality_chats() -> list:
+    return [build_messages(system_prompt, prompt)
+            for prompt in BENCH_PROMPTS for system_prompt in (SYS_MSG_STY_ASK_FIRST, SYS_MSG_OBJ_ASK_FIRST)]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench.quality")
+    parser.add_argument("--quant", choices=QUANT_MODES, required=True, help="CPU mode to check")
+    parser.add_argument("--model", type=str, default=MODEL_NAME, help="checkpoint, the reference runs in float32 on CPU")
+    parser.add_argument("--max-new-tokens", type=int, default=64, help="greedy tokens compared per chat")
+    parser.add_argument("--out", type=str, default=None, help="write the full report (texts included) here")
+    args = parser.parse_args()
+
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    tok = AutoTokenizer.from_pretrained(args.model)
+    ref_model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float32, device_map="cpu").eval()
+    model = apply_quant(AutoModelForCausalLM.from_pretrained(args.model, **load_kwargs(args.quant)), args.quant)
+
+    report = greedy_agreement(tok, ref_model, model, quality_chats(), args.max_new_tokens)
+    print(f"{args.quant}: {report['EXACT_MATCHES']}/{report['CHATS']} greedy outputs identical, "
+          f"prefix agreement {report['PREFIX_AGREEMENT']:.0%}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import setting_new_pipe
+
+# Qwen chat format (ChatML) without the tool / thinking branches of the real template
+CHAT_TEMPLATE = (
+    "{% for m in messages %}<|im_start|>{{ m['role'] }}\n{{ m['content'] }}<|im_end|>\n{% endfor %}"
+    "{% if add_generation_prompt %}<|im_start|>assistant\n{% endif %}"
+)
+SPECIAL_TOKENS = ["<|endoftext|>", "<|im_start|>", "<|im_end|>", "<think>", "</think>"]
+
+
+# byte-level BPE trained on the agent prompts of setting_new_pipe.py, so prompt token counts stay
+# in the same range as with the real tokenizer; built in memory, nothing is downloaded
+def build_tokenizer(vocab_size: int = 2048):
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    corpus = [v for k, v in vars(setting_new_pipe).items() if k.isupper() and isinstance(v, str)]
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=vocab_size, special_tokens=SPECIAL_TOKENS,
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet(), show_progress=False)
+    bpe.train_from_iterator(corpus, trainer)
+    tok = PreTrainedTokenizerFast(tokenizer_object=bpe, eos_token="<|im_end|>", pad_token="<|endoftext|>",
+                                  model_input_names=["input_ids", "attention_mask"])
+    tok.chat_template = CHAT_TEMPLATE
+    return tok
+
+
+# randomly initialised Qwen3ForCausalLM, same architecture as MODEL_NAME at a size that runs on a laptop CPU.
+# greedy decoding by default, so every benchmark run generates the same tokens.
+def build_model(tok, layers: int = 2, hidden: int = 128, heads: int = 4, kv_heads: int = 2, seed: int = 0):
+    import torch
+    from transformers import Qwen3Config, Qwen3ForCausalLM
+
+    torch.manual_seed(seed)
+    config = Qwen3Config(
+        vocab_size = len(tok),
+        hidden_size = hidden,
+        intermediate_size = hidden * 3,
+        num_hidden_layers = layers,
+        num_attention_heads = heads,
+        num_key_value_heads = kv_heads,
+        head_dim = hidden // heads,
+        max_position_embeddings = 32768,
+        eos_token_id = tok.eos_token_id,
+        pad_token_id = tok.pad_token_id,
+    )
+    model = Qwen3ForCausalLM(config).eval()
+    model.generation_config.eos_token_id = tok.eos_token_id
+    model.generation_config.pad_token_id = tok.pad_token_id
+    model.generation_config.do_sample = False
+    return model
+
+
+def build_tiny(layers: int = 2, hidden: int = 128, vocab_size: int = 2048, seed: int = 0):
+    tok = build_tokenizer(vocab_size)
+    return tok, build_model(tok, layers=layers, hidden=hidden, seed=seed)
+
+
+
+# early-exit draft for assisted decoding: the first `layers` layers of model plus its embeddings, final norm and lm_head,
+# so it shares the tokenizer
+def build_draft(model, layers: int = 1):
+    import copy
+    from transformers import Qwen3ForCausalLM
+
+    config = copy.deepcopy(model.config)
+    config.num_hidden_layers = layers
+    if getattr(config, "layer_types", None):
+        config.layer_types = config.layer_types[:layers]
+    draft = Qwen3ForCausalLM(config).eval()
+    draft.load_state_dict({k: v for k, v in model.state_dict().items() if k in draft.state_dict()})
+    draft.generation_config = copy.deepcopy(model.generation_config)
+    return draft
+
+
+# main model and draft sharing one tokenizer. the main model's layers above the draft's write to the residual stream
+# scaled by damping, so the draft agrees with it about as often as a small model of the same family
+# (random layers at full scale leave almost every draft token rejected).
+def build_pair(layers: int = 2, hidden: int = 128, vocab_size: int = 2048, draft_layers: int = 1,
+               damping: float = 0.2, seed: int = 0):
+    import torch
+
+    tok, model = build_tiny(layers=layers, hidden=hidden, vocab_size=vocab_size, seed=seed)
+    with torch.no_grad():
+        for layer in model.model.layers[draft_layers:]:
+            layer.self_attn.o_proj.weight.mul_(damping)
+            layer.mlp.down_proj.weight.mul_(damping)
+    return tok, model, build_draft(model, draft_layers)
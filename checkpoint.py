@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+STATE_FILE = "state.json"
+# one JSON line per finished step, next to STATE_FILE
+STEPS_FILE = "steps.jsonl"
+
+
+# write to a temp file in the same directory, fsync, then rename over path:
+# a crash leaves either the old file or the new one, never a partial write
+def write_json_atomic(path: Path, obj):
+    write_atomic(path, lambda f: json.dump(obj, f, ensure_ascii=False))
+
+
+# same for a JSONL file, one object per line
+def write_lines_atomic(path: Path, objs: list):
+    write_atomic(path, lambda f: f.writelines(json.dumps(o, ensure_ascii=False) + "\n" for o in objs))
+
+
+def write_atomic(path: Path, write):
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+# identifies one agent call by what the model is asked, so a replay notices when the debate takes another path
+def spec_key(spec) -> str:
+    system_prompt, user_prompt, opts = spec
+    opts = {k: v for k, v in (opts or {}).items() if k != "conv_cache"}
+    blob = json.dumps([system_prompt, user_prompt, opts], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+# saved state of one debate: its settings (CONFIG, state.json, written once) and the answers of every step the
+# generator yielded (steps.jsonl, one fsynced line appended per step; a line cut short by a crash is dropped on load).
+# Resuming re-runs the debate generator and answers its steps
+# from STEPS for as long as the asked calls match, which rebuilds history / history_style / history_object
+# exactly; the first step that is missing (or no longer matches) and everything after it is generated.
+class DebateState:
+    def __init__(self, path: Path, config: dict, steps: list = None):
+        self.path = Path(path)
+        self.steps_path = self.path.with_name(STEPS_FILE)
+        self.config = config
+        self.steps = steps or []
+        self.replayed = 0
+
+    @classmethod
+    def load(cls, path: Path):
+        with Path(path).open(encoding="utf-8") as f:
+            config = json.load(f)["CONFIG"]
+        state = cls(path, config)
+        lines = state.steps_path.read_text(encoding="utf-8").splitlines(True) if state.steps_path.exists() else []
+        for line in lines:
+            try:
+                state.steps.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+        # a partial last line would swallow the next appended step, write the file back without it
+        if len(state.steps) < len(lines) or (lines and not lines[-1].endswith("\n")):
+            state.save()
+        return state
+
+    # settings and all steps, atomically; appending a step does not rewrite anything
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self.path, {"CONFIG": self.config})
+        write_lines_atomic(self.steps_path, self.steps)
+
+    def append_step(self, step: dict):
+        self.steps.append(step)
+        if not self.path.exists():
+            return self.save()
+        with self.steps_path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(step, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    # generate(specs) -> responses, with the saved steps served first and every new step saved
+    def wrap(self, generate):
+        position = 0
+        def step(specs):
+            nonlocal position
+            keys = [spec_key(s) for s in specs]
+            if position < len(self.steps) and self.steps[position]["KEYS"] == keys:
+                responses = self.steps[position]["RESPONSES"]
+                self.replayed += 1
+            else:
+                if position < len(self.steps):
+                    print(f"[resume] step {position + 1} no longer matches the saved state, generating from here")
+                    del self.steps[position:]
+                    self.save()
+                responses = generate(specs)
+                self.append_step({"KEYS": keys, "RESPONSES": list(responses)})
+            position += 1
+            return responses
+        return step
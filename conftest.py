@@ -0,0 +1,2 @@
+# test_qwen3.py is a script that loads the full model, not a test
+collect_ignore = ["test_qwen3.py", "runs"]
@@ -0,0 +1,38 @@
+import re
+
+from history_compact import STATE_KEYS, state_text
+
+# a track whose consolidated state (style brief / object list) changed by less than this between two rounds
+# has converged (--converge default)
+DRIFT_THRESHOLD = 0.15
+# ... as long as it also lists at most this many CHANGES_SINCE_PREV items (tracks without the key only use the drift)
+MAX_CHANGES = 2
+
+
+def token_set(text: str) -> set:
+    return set(re.findall(r"\w+", text.lower()))
+
+
+# 1 - Jaccard similarity of the two token sets: 0.0 identical wording, 1.0 nothing in common
+def drift(prev_text: str, text: str) -> float:
+    a, b = token_set(prev_text), token_set(text)
+    if not a and not b:
+        return 0.0
+    return 1.0 - len(a & b) / len(a | b)
+
+
+# how much a track moved between its last two records (records.RoundRecord), compared on the parsed
+# UPDATE_STYLE_BRIEF / UPDATE_OBJECTS (raw text when a response does not parse)
+def track_change(prev_rec, rec) -> dict:
+    state_keys = STATE_KEYS[rec.track]
+    changes = rec.response.get("CHANGES_SINCE_PREV")
+    return {
+        "DRIFT": drift(state_text(prev_rec.response, state_keys), state_text(rec.response, state_keys)),
+        "CHANGES": len(changes) if isinstance(changes, list) else None,
+    }
+
+
+def converged(change: dict, threshold: float = DRIFT_THRESHOLD, max_changes: int = MAX_CHANGES) -> bool:
+    if change["DRIFT"] >= threshold:
+        return False
+    return change["CHANGES"] is None or change["CHANGES"] <= max_changes
@@ -0,0 +1,151 @@
+"""
+python debate_batch.py \
+  --requests debates.jsonl \
+  --outdir runs
+
+one JSON object per line, rounds / outdir fall back to the command line values:
+{"prompt": "Fauvism, Miyazaki Hayao, a girl and a dragon in the cave", "rounds": 3, "outdir": "runs/1"}
+{"prompt": "Impressionism, Ukiyo-e, a fox and a paper lantern on a misty bridge", "rounds": 3, "outdir": "runs/2"}
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from backends import BACKEND_NAMES, RemoteBackend, make_backend, run_specs
+from convergence import DRIFT_THRESHOLD
+from debate_rounds_new_pipe import debate_steps, make_run_dir
+from metrics import METRICS_FILE, attach, write_summary
+from quantize import QUANT_MODES
+from run_log import EventLog
+from response_cache import CachedBackend, ResponseCache
+from setting_new_pipe import MODEL_NAME
+
+
+def load_requests(path: Path, rounds: int, outdir: str) -> list:
+    jobs = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        req = json.loads(line)
+        jobs.append({
+            "prompt": req["prompt"],
+            "rounds": int(req.get("rounds", rounds)),
+            "outdir": req.get("outdir", outdir),
+        })
+    return jobs
+
+
+# debates started in the same second would share <outdir>/<date>/<time>, suffix them instead
+def unique_run_dir(outdir, used: set) -> Path:
+    base = run_dir = make_run_dir(outdir)
+    n = 1
+    while run_dir in used or run_dir.exists():
+        run_dir = base.with_name(f"{base.name}_{n}")
+        n += 1
+    used.add(run_dir)
+    return run_dir
+
+
+# advance every debate together: each step collects the calls all live debates are waiting on,
+# runs them through the backend (at most max_batch calls per generate call)
+# and hands every debate its own responses back. seed goes to every agent call.
+# metrics_logs: one run_log.EventLog per debate for its per-call metrics (metrics.py)
+def run_debates(backend, debates: list, max_batch: int = 16, seed: int = None, metrics_logs: list = None) -> list:
+    defaults = {"seed": seed} if seed is not None else None
+    histories = [None] * len(debates)
+    pending = {}
+    for i, steps in enumerate(debates):
+        pending[i] = next(steps)
+
+    while pending:
+        order = list(pending.items())
+        specs = [spec for _, calls in order for spec in calls]
+        owners = [i for i, calls in order for _ in calls]
+        outs = []
+        for k in range(0, len(specs), max_batch):
+            chunk, records = attach(specs[k:k + max_batch])
+            t0 = time.perf_counter()
+            outs.extend(run_specs(backend, chunk, defaults))
+            wall = time.perf_counter() - t0
+            if metrics_logs is not None:
+                for i, rec in zip(owners[k:k + max_batch], records):
+                    metrics_logs[i].append({**rec, "BATCH": len(chunk), "WALL_S": wall})
+
+        k = 0
+        for i, calls in order:
+            responses = outs[k:k + len(calls)]
+            k += len(calls)
+            try:
+                pending[i] = debates[i].send(responses)
+            except StopIteration as e:
+                histories[i] = e.value
+                del pending[i]
+    return histories
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=str, required=True, help="JSONL, one debate per line")
+    parser.add_argument("--outdir", type=str, default="logs_run", help="輸出資料夾 (default for every debate)")
+    parser.add_argument("--rounds", type=int, default=3, help="debating rounds (default for every debate)")
+    parser.add_argument("--max-batch", type=int, default=16, help="max agent calls per generate call")
+    parser.add_argument("--independent-tracks", action="store_true",
+                        help="style/object tracks only see their own history and run side by side as a batch")
+    parser.add_argument("--constrained", action="store_true",
+                        help="constrain the JSON agents to their schema, outputs always parse")
+    parser.add_argument("--backend", choices=BACKEND_NAMES, default="hf",
+                        help="generation engine: hf (transformers), vllm (offline engine, GPU or CPU build), stub (fake, for tests)")
+    parser.add_argument("--server", type=str, default=None,
+                        help="send agent calls to a running inference_server.py (e.g. http://127.0.0.1:8765) instead of loading the model")
+    parser.add_argument("--history-budget", type=int, default=None,
+                        help="token budget of the HISTORY block; older rounds collapse into their CHANGES_SINCE_PREV (default: full history)")
+    parser.add_argument("--converge", type=float, nargs="?", const=DRIFT_THRESHOLD, default=None,
+                        help=f"stop a track once its brief / object list drifts less than this between rounds (default {DRIFT_THRESHOLD}), --rounds becomes the cap")
+    parser.add_argument("--quant", choices=QUANT_MODES, default=None,
+                        help="CPU execution mode of the hf backend: int8 (dynamic int8 Linear layers) or bf16")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="fixed sampling seed for every agent call, makes sampled runs reproducible and cacheable")
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help="on-disk response cache shared by all runs (e.g. .cache/responses), unchanged calls are not generated again")
+    parser.add_argument("--cache-size-mb", type=int, default=1024, help="size cap of --cache-dir, least recently used answers go first")
+    parser.add_argument("--cache-sampled", action="store_true",
+                        help="also cache sampled calls without --seed (replays the first answer drawn)")
+    args = parser.parse_args()
+    if args.server and (args.quant or args.backend != "hf"):
+        parser.error("--server runs the server's model, --quant / --backend do not apply")
+
+    jobs = load_requests(Path(args.requests), args.rounds, args.outdir)
+    backend = RemoteBackend(args.server) if args.server else \
+        make_backend(args.backend, MODEL_NAME, **({"quant": args.quant} if args.quant else {}))
+    if args.cache_dir:
+        backend = CachedBackend(backend, ResponseCache(args.cache_dir, args.cache_size_mb << 20),
+                                MODEL_NAME, sampled=args.cache_sampled)
+
+    used = set()
+    debates = []
+    outdirs = []
+    for job in jobs:
+        outdir = unique_run_dir(job["outdir"], used)
+        print(f"{outdir}: {job['prompt']}")
+        outdirs.append(outdir)
+        debates.append(debate_steps(job["prompt"], job["rounds"], outdir,
+                                    independent_tracks=args.independent_tracks,
+                                    constrained=args.constrained,
+                                    history_budget=args.history_budget,
+                                    count_tokens=backend.count_tokens,
+                                    converge=args.converge))
+
+    metrics_logs = [EventLog(outdir / METRICS_FILE) for outdir in outdirs]
+    run_debates(backend, debates, max_batch=args.max_batch, seed=args.seed, metrics_logs=metrics_logs)
+    for outdir, log in zip(outdirs, metrics_logs):
+        log.close()
+        write_summary(outdir)
+    if isinstance(backend, CachedBackend):
+        print(backend.report())
+    print("Done.")
+
+if __name__ == "__main__":
+    main()
@@ -7,12 +7,11 @@ python debate_rounds.py \
 
 import argparse
 import json
-import re
 import time
 from pathlib import Path
 
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from debate_rounds_new_pipe import run_agent
+from model_loader import load_model
 
 from setting import (
     MODEL_NAME,
@@ -21,53 +20,6 @@ from setting import (
     SYS_MSG_FINAL_STYLE, SYS_MSG_FINAL_OBJECT
 )
 
-# generator
-def build_model_and_tokenizer(model_name: str):
-    tok = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(
-        model_name,
-        torch_dtype = "auto",
-        device_map = "auto"
-    )
-    return tok, model
-
-def apply_chat(tok, messages):
-    return tok.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-
-# make the respone content clean, delete redundant text (Ex. |assistant|, |thinking content|)
-def decode_without_think(tok, output_ids):
-    text = tok.decode(output_ids, skip_special_tokens=False)
-    text = re.sub(r"analysis.*?assistantfinal", "", text, flags=re.S | re.I)
-    text = re.sub(r"<think>.*?</think>", "", text, flags=re.S | re.I).strip()
-    
-    if "</think>" in text:
-        text = text.split("</think>", 1)[-1]
-    
-    text = tok.decode(tok.encode(text), skip_special_tokens=True).strip()
-    return text
-
-def run_agent(tok, model, system_prompt: str, user_prompt: str,
-              max_new_tokens=4096, temperature=0.7, top_p=0.9):
-    messages = []
-    if isinstance(system_prompt,str):
-        messages.append({"role": "system", "content": system_prompt})
-    messages.append({"role": "user", "content": user_prompt})
-
-    text = apply_chat(tok, messages)
-    inputs = tok([text], return_tensors="pt").to(model.device)
-
-    gen_ids = model.generate(
-        **inputs,
-        max_new_tokens = max_new_tokens,
-        temperature = temperature,
-        top_p = top_p,
-    )[0]
-
-    # get new tokens
-    new_ids = gen_ids[len(inputs.input_ids[0]):]
-    content = decode_without_think(tok, new_ids)
-    return content
-
 def dump_json(obj, path: Path):
     path.parent.mkdir(parents=True, exist_ok=True)
     s = json.dumps(obj, ensure_ascii=False, indent=2)
@@ -260,7 +212,7 @@ def main():
     time_str = time.strftime("%H%M%S")
     outdir = Path(args.outdir) / date_str / time_str
 
-    tok, model = build_model_and_tokenizer(MODEL_NAME)
+    tok, model = load_model(MODEL_NAME)
 
     history = run_rounds(
         tok, model,
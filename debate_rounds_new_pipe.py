@@ -19,238 +19,851 @@ python debate_rounds_new_pipe.py \
 """
 
 import argparse
-import json
-import re
 import time
 from pathlib import Path
 
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
-
+# torch / transformers are only imported by the functions that run the model,
+# so the client mode (--server) starts without loading them
+from backends import (
+    BACKEND_NAMES, Backend, RemoteBackend, build_messages, generation_params, make_backend, per_chat_params, run_specs,
+)
+from checkpoint import STATE_FILE, DebateState
+from convergence import DRIFT_THRESHOLD, converged, track_change
+from history_compact import approx_tokens
+from kv_cache import ConversationCache, PrefixCache
+from metrics import METRICS_FILE, with_metrics, write_summary
+from model_loader import load_model
+from prompt_builder import PromptBuilder
+from quantize import QUANT_MODES
+from records import RoundRecord, make_record
+from response_cache import CachedBackend, ResponseCache
+from run_log import EVENTS_FILE, EventLog, write_views
+from think import ThinkStream, split_think, split_think_batch
 from setting_new_pipe import (
     MODEL_NAME,
     SYS_MSG_STYLE, SYS_MSG_OBJECT, SYS_MSG_STY_ASK, SYS_MSG_OBJ_ASK,
     USER_MSG_STY_ROUND, USER_MSG_OBJ_ROUND, USER_MSG_STY_ASK_ROUND, USER_MSG_OBJ_ASK_ROUND,
     SYS_MSG_FINAL_STYLE, SYS_MSG_FINAL_OBJECT,
-    SYS_MSG_STY_ASK_FIRST, SYS_MSG_OBJ_ASK_FIRST
+    SYS_MSG_STY_ASK_FIRST, SYS_MSG_OBJ_ASK_FIRST,
+    SCHEMA_STYLE, SCHEMA_OBJECT, SCHEMA_STY_ASK, SCHEMA_OBJ_ASK, SCHEMA_STY_ROUND, SCHEMA_OBJ_ROUND,
+    PROMPT_BUDGETS, ROLE_PROFILES, PROFILE_DEFAULT, DRAFT_MODEL_NAME, ASSISTED_ROLES
 )
 
-# generator
-def build_model_and_tokenizer(model_name: str):
-    tok = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(
-        model_name,
-        torch_dtype = "auto",
-        device_map = "auto"
-    )
-    return tok, model
-
-def apply_chat(tok, messages):
-    return tok.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-
-# make the respone content clean, delete redundant text (Ex. |assistant|, |thinking content|)
-def decode_without_think(tok, output_ids):
-    text = tok.decode(output_ids, skip_special_tokens=False)
-    text = re.sub(r"analysis.*?assistantfinal", "", text, flags=re.S | re.I)
-    text = re.sub(r"<think>.*?</think>", "", text, flags=re.S | re.I).strip()
-    
-    if "</think>" in text:
-        text = text.split("</think>", 1)[-1]
-    
-    text = tok.decode(tok.encode(text), skip_special_tokens=True).strip()
+# per-call stop condition of the JSON agents: they are done once their top-level object is closed
+# (the final writers' END_OF_PROMPT comes with their profile)
+JSON_STOP = {"stop_json": True}
+
+# per-call options of an agent: the generation profile of its role (setting_new_pipe.ROLE_PROFILES:
+# token cap, sampling, stop strings, thinking) plus role / round, which also label the call in metrics.jsonl.
+# role names the agent (ask_style / style / ask_object / object ...), backends may configure it per role
+def role_opts(role: str, r: int):
+    return {**ROLE_PROFILES.get(role, PROFILE_DEFAULT), "role": role, "round": r}
+
+# per-call options of a JSON agent: with constrained decoding its output is forced to follow schema
+def json_opts(schema, constrained: bool, role: str, r: int):
+    opts = {**role_opts(role, r), **JSON_STOP}
+    return {**opts, "schema": schema} if constrained else opts
+
+# past_key_values of the static system prompts, shared by every run_agent call in this process
+PREFIX_CACHE = PrefixCache()
+
+# generator, one per process (model_loader.py)
+# quant: None (checkpoint dtype, device_map auto) or a CPU mode from quantize.py, "int8" / "bf16"
+def build_model_and_tokenizer(model_name: str, quant: str = None):
+    return load_model(model_name, quant=quant)
+
+# small model of the same family for assisted (speculative) decoding: it drafts tokens, the main model verifies them.
+# drafts are exchanged as token ids, so both models must share the tokenizer
+def build_draft_model(draft_name: str, tok):
+    draft_tok, draft = load_model(draft_name, warmup=False)
+    if draft_tok.get_vocab() != tok.get_vocab():
+        raise ValueError(f"draft model {draft_name} does not share the main model's tokenizer")
+    return draft
+
+# thinking: None leaves the template's default, False renders with enable_thinking=False and closes the
+# <think> span right away where the template still opens it (thinking-only models)
+def apply_chat(tok, messages, thinking=None):
+    kwargs = {} if thinking is None else {"enable_thinking": thinking}
+    text = tok.apply_chat_template(messages, tokenize=False, add_generation_prompt=True, **kwargs)
+    if thinking is False and prompt_is_thinking(text):
+        text += "</think>\n\n"
     return text
 
-def run_agent(tok, model, system_prompt: str, user_prompt: str,
-              max_new_tokens=4096, temperature=0.7, top_p=0.9):
-    messages = []
-    if isinstance(system_prompt,str):
-        messages.append({"role": "system", "content": system_prompt})
-    messages.append({"role": "user", "content": user_prompt})
-
-    text = apply_chat(tok, messages)
+# make the respone content clean: only the tokens after the last </think> are decoded, once
+def decode_without_think(tok, output_ids):
+    return split_think(tok, output_ids)[1]
+
+# token ids of the rendered system message, i.e. the part of the prompt shared by every call with this system prompt
+def system_prefix_ids(tok, system_prompt: str):
+    text = tok.apply_chat_template([{"role": "system", "content": system_prompt}], tokenize=False)
+    return tok(text).input_ids
+
+# thinking models open <think> in the generation prompt, the answer only starts after </think>
+def prompt_is_thinking(text: str) -> bool:
+    return text.rstrip().endswith("<think>")
+
+# JSON constraint for one call; a thinking model gets its <think> span closed right away
+def build_constraint(tok, model, schema, text: str):
+    from json_constrained import JsonSchemaConstraint
+    prefix = "</think>\n\n" if prompt_is_thinking(text) else ""
+    return JsonSchemaConstraint(tok, schema, model.config.vocab_size, prefix=prefix)
+
+# stop: stop strings (e.g. ["END_OF_PROMPT"]), stop_json: stop once the top-level JSON object is closed
+# schema: JSON schema for constrained decoding, the output then always parses
+def run_agent(tok, model, system_prompt: str, user_prompt: str, **kwargs):
+    return run_chat(tok, model, build_messages(system_prompt, user_prompt), **generation_params(kwargs))
+
+# rendered prompt, its input tensors, the KV cache to start from for one chat and what it reused, for metrics.jsonl:
+# {"CACHED_TOKENS", "CACHE": "conv" / "prefix" / None, "PREFIX_PREFILL_S": time spent prefilling a prefix cache miss}
+def prepare_chat(tok, model, messages: list, prefix_cache=PREFIX_CACHE, conv_cache=None, thinking=None):
+    system_prompt = messages[0]["content"] if messages and messages[0]["role"] == "system" else None
+
+    text = apply_chat(tok, messages, thinking)
     inputs = tok([text], return_tensors="pt").to(model.device)
 
-    gen_ids = model.generate(
-        **inputs,
-        max_new_tokens = max_new_tokens,
-        temperature = temperature,
-        top_p = top_p,
-    )[0]
+    # the role's own conversation cache first (it covers the system prompt and the old history),
+    # otherwise reuse the prefilled system prompt when the rendered chat starts with exactly its tokens
+    prefix_ids = []
+    if prefix_cache is not None and isinstance(system_prompt, str):
+        prefix_ids = system_prefix_ids(tok, system_prompt)
+        if not (len(prefix_ids) < inputs.input_ids.shape[1]
+                and inputs.input_ids[0, :len(prefix_ids)].tolist() == prefix_ids):
+            prefix_ids = []
+
+    # a conversation cache that does not even cover the system prompt is worse than the prefix cache
+    past = conv_cache.take(inputs.input_ids[0], min_reuse=len(prefix_ids)) if conv_cache is not None else None
+    reuse = {"CACHED_TOKENS": 0, "CACHE": None, "PREFIX_PREFILL_S": 0.0}
+    if past is not None:
+        reuse.update(CACHED_TOKENS=past.get_seq_length(), CACHE="conv")
+    elif prefix_ids:
+        t0 = time.perf_counter()
+        past, hit = prefix_cache.get(model, prefix_ids)
+        if hit:
+            reuse.update(CACHED_TOKENS=len(prefix_ids), CACHE="prefix")
+        else:
+            # a miss prefills the system prompt here, it belongs to the prefill time of this call
+            if model.device.type == "cuda":
+                import torch
+                torch.cuda.synchronize(model.device)
+            reuse["PREFIX_PREFILL_S"] = time.perf_counter() - t0
+    return text, inputs, past, reuse
+
+# measure() starts after prepare_chat, add the prefill of a prefix cache miss to the call's prefill time
+def add_prefix_prefill(metrics, reuse: dict):
+    if metrics is not None and metrics.get("PREFILL_S") is not None:
+        metrics["PREFILL_S"] += reuse["PREFIX_PREFILL_S"]
+
+# one chat (list of messages); a leading system message is served from the prefix cache.
+# assistant_model: draft model for assisted decoding, assist_config its num_assistant_tokens (/ _schedule ...)
+# for this call; acceptance counts go to assist_stats under role. constrained calls never use the draft.
+# metrics: dict that receives the timings / token counts of this call (metrics.py)
+# max_new_tokens and the sampling kwargs come from the role's profile (backends.generation_params),
+# what a call leaves unset falls back to the model's generation_config
+def run_chat(tok, model, messages: list,
+             max_new_tokens=None,
+             prefix_cache=PREFIX_CACHE, conv_cache=None,
+             stop=None, stop_json=False, schema=None,
+             role=None, assistant_model=None, assist_config=None, assist_stats=None, seed=None,
+             round=None, metrics=None, thinking=None, **gen_kwargs):
+    from contextlib import nullcontext
+    from transformers import set_seed
+    from json_constrained import generate_constrained
+    from metrics import count, measure
+    from stopping import build_stopping
+
+    text, inputs, past, reuse = prepare_chat(tok, model, messages, prefix_cache, conv_cache, thinking)
+    # a fixed seed makes a sampled call reproducible (and cacheable, see response_cache.py)
+    if seed is not None:
+        set_seed(seed)
+    if schema is None:
+        gen_kwargs.update(build_stopping(tok, model, inputs.input_ids.shape[1],
+                                         [stop], [stop_json], [prompt_is_thinking(text)]))
+
+    if schema is not None:
+        config = model.generation_config
+        with measure(model, metrics):
+            new_ids, past = generate_constrained(
+                model, build_constraint(tok, model, schema, text), inputs.input_ids,
+                max_new_tokens = max_new_tokens,
+                do_sample = gen_kwargs.get("do_sample", config.do_sample),
+                temperature = gen_kwargs.get("temperature", config.temperature),
+                top_p = gen_kwargs.get("top_p", config.top_p),
+                top_k = gen_kwargs.get("top_k", config.top_k),
+                past_key_values = past,
+            )
+        add_prefix_prefill(metrics, reuse)
+        count(metrics, inputs.input_ids.shape[1], len(new_ids), reuse["CACHED_TOKENS"], reuse["CACHE"])
+        if conv_cache is not None:
+            conv_cache.store(inputs.input_ids[0].tolist() + new_ids, past)
+        return decode_without_think(tok, new_ids)
+
+    if past is not None:
+        gen_kwargs["past_key_values"] = past
+
+    tracking = nullcontext({})
+    if assistant_model is not None:
+        gen_kwargs["assistant_model"] = assistant_model
+        if assist_stats is not None:
+            tracking = assist_stats.track(role, model, assistant_model, assist_config)
+
+    with tracking as call, measure(model, metrics):
+        out = model.generate(
+            **inputs,
+            max_new_tokens = max_new_tokens,
+            return_dict_in_generate = True,
+            **gen_kwargs,
+        )
+        gen_ids = out.sequences[0]
+        # get new tokens
+        new_ids = gen_ids[len(inputs.input_ids[0]):]
+        call["TOKENS"] = len(new_ids)
+    add_prefix_prefill(metrics, reuse)
+    count(metrics, inputs.input_ids.shape[1], len(new_ids), reuse["CACHED_TOKENS"], reuse["CACHE"])
+    if conv_cache is not None:
+        conv_cache.store(gen_ids, out.past_key_values)
 
-    # get new tokens
-    new_ids = gen_ids[len(inputs.input_ids[0]):]
     content = decode_without_think(tok, new_ids)
     return content
 
-def dump_json(obj, path: Path):
-    path.parent.mkdir(parents=True, exist_ok=True)
-    s = json.dumps(obj, ensure_ascii=False, indent=2)
-    s = s.replace("\\n", "\n")  # 把字串中的 \n 展開為真正換行
-    path.write_text(s, encoding="utf-8")
+# streaming variant of run_chat: a generator of answer text pieces as tokens arrive, the think span suppressed.
+# stats (a dict) receives TTFT_S (time to first token), TOKENS, TOKENS_PER_S (decode rate after the first token)
+# and STOPPED_EARLY. close the generator (or set stop_event) to stop generation early.
+def stream_chat(tok, model, messages: list, stats: dict = None, stop_event=None,
+                max_new_tokens=None,
+                prefix_cache=PREFIX_CACHE, conv_cache=None,
+                stop=None, stop_json=False, schema=None, role=None, seed=None,
+                round=None, metrics=None, thinking=None, **gen_kwargs):
+    import threading
+    from transformers import LogitsProcessorList, StoppingCriteriaList, set_seed
+    from json_constrained import JsonSchemaLogitsProcessor
+    from metrics import count, peak_host_mb
+    from stopping import build_stopping
+    from streaming import EventStop, TokenStreamer
+
+    t0 = time.perf_counter()
+    stats = {} if stats is None else stats
+    stop_event = stop_event or threading.Event()
+    text, inputs, past, reuse = prepare_chat(tok, model, messages, prefix_cache, conv_cache, thinking)
+    prompt_len = inputs.input_ids.shape[1]
+    if seed is not None:
+        set_seed(seed)
+
+    gen_kwargs.update(build_stopping(tok, model, prompt_len, [stop], [stop_json and schema is None],
+                                     [prompt_is_thinking(text)]))
+    criteria = gen_kwargs.pop("stopping_criteria", None) or StoppingCriteriaList()
+    criteria.append(EventStop(stop_event))
+    if schema is not None:
+        gen_kwargs["logits_processor"] = LogitsProcessorList([
+            JsonSchemaLogitsProcessor([build_constraint(tok, model, schema, text)], prompt_len,
+                                      tok.eos_token_id, max_new_tokens)
+        ])
+    if past is not None:
+        gen_kwargs["past_key_values"] = past
+
+    streamer = TokenStreamer()
+    result = {}
+    def target():
+        try:
+            result["out"] = model.generate(
+                **inputs,
+                max_new_tokens = max_new_tokens,
+                streamer = streamer,
+                stopping_criteria = criteria,
+                return_dict_in_generate = True,
+                **gen_kwargs,
+            )
+        except Exception as e:
+            result["error"] = e
+            streamer.end()
+    worker = threading.Thread(target=target, daemon=True)
+    worker.start()
+
+    think = ThinkStream(tok, thinking=prompt_is_thinking(text))
+    n = 0
+    t_first = t_last = None
+    finished = False
+    try:
+        for ids in streamer:
+            t_last = time.perf_counter()
+            if t_first is None:
+                t_first = t_last
+            n += len(ids)
+            piece = think.feed(ids)
+            if piece:
+                yield piece
+        finished = True
+    finally:
+        stats["STOPPED_EARLY"] = not finished or stop_event.is_set()
+        stop_event.set()
+        worker.join()
+        stats["TTFT_S"] = (t_first - t0) if t_first is not None else None
+        stats["TOKENS"] = n
+        stats["TOKENS_PER_S"] = (n - 1) / (t_last - t_first) if n > 1 and t_last > t_first else None
+        stats["ANSWER"] = think.answer
+        stats["THINKING"] = think.thinking
+        if metrics is not None:
+            metrics["PREFILL_S"] = stats["TTFT_S"]
+            metrics["DECODE_S"] = (t_last - t_first) if t_first is not None else None
+            metrics["PEAK_DEVICE_MB"] = None
+            metrics["PEAK_HOST_MB"] = peak_host_mb()
+            count(metrics, prompt_len, n, reuse["CACHED_TOKENS"], reuse["CACHE"])
+    if "error" in result:
+        raise result["error"]
+    if conv_cache is not None and "out" in result:
+        conv_cache.store(result["out"].sequences[0], result["out"].past_key_values)
+
+# run independent agent calls side by side in one left-padded generate call
+# specs: [(system_prompt, user_prompt, sampling), ...], sampling is a dict of
+# generate kwargs (max_new_tokens / temperature / top_p / do_sample ...) or None.
+def run_agents_batch(tok, model, specs):
+    return generate_chats(tok, model, [build_messages(s, u) for s, u, _ in specs], [p for _, _, p in specs])
+
+# chats: list of message lists, params: one sampling dict (or None) per chat, see backends.py.
+# calls with different sampling params can not share one generate call, so they are grouped.
+def generate_chats(tok, model, chats: list, params=None):
+    from transformers import LogitsProcessorList, set_seed
+    from json_constrained import JsonSchemaLogitsProcessor
+    from metrics import count, measure
+    from stopping import build_stopping
+    groups = {}
+    per_call = {}
+    gen_params = {}
+    for i, sampling in enumerate(per_chat_params(params, len(chats))):
+        gen = generation_params(sampling)
+        # per-call options, not sampling params: rows with different stops still share one generate call.
+        # conv_cache is only used when the call ends up running alone.
+        per_call[i] = {
+            "conv_cache": gen.pop("conv_cache", None),
+            "stop": gen.pop("stop", None),
+            "stop_json": gen.pop("stop_json", False),
+            "schema": gen.pop("schema", None),
+            "role": gen.pop("role", None),
+            "round": gen.pop("round", None),
+            "metrics": gen.pop("metrics", None),
+            "thinking": gen.pop("thinking", None),
+        }
+        # assisted decoding only runs one sequence at a time, such calls get a group of their own
+        assist = {k: gen.pop(k) for k in ("assistant_model", "assist_config", "assist_stats") if k in gen}
+        per_call[i].update(assist)
+        gen_params[i] = gen
+        key = tuple(sorted(gen.items()))
+        groups.setdefault(key + (("assisted call", i),) if assist.get("assistant_model") is not None else key,
+                          []).append(i)
+
+    results = [None] * len(chats)
+    for key, idxs in groups.items():
+        # a single call gains nothing from padding, and run_chat can reuse the prefix cache
+        if len(idxs) == 1:
+            results[idxs[0]] = run_chat(tok, model, chats[idxs[0]], **per_call[idxs[0]], **gen_params[idxs[0]])
+            continue
+
+        texts = [apply_chat(tok, chats[i], per_call[i]["thinking"]) for i in idxs]
+        gen = dict(key)
+        seed = gen.pop("seed", None)
+
+        # decoder-only models need the padding on the left so every row ends at the prompt
+        padding_side = tok.padding_side
+        tok.padding_side = "left"
+        if tok.pad_token is None:
+            tok.pad_token = tok.eos_token
+        try:
+            inputs = tok(texts, return_tensors="pt", padding=True).to(model.device)
+        finally:
+            tok.padding_side = padding_side
+
+        stopping = build_stopping(tok, model, inputs.input_ids.shape[1],
+                                  [per_call[i]["stop"] for i in idxs],
+                                  [per_call[i]["stop_json"] for i in idxs],
+                                  [prompt_is_thinking(t) for t in texts])
+
+        # constrained rows are masked per row; forced tokens cost a step each in a batched generate
+        constraints = [build_constraint(tok, model, per_call[i]["schema"], t) if per_call[i]["schema"] is not None
+                       else None for i, t in zip(idxs, texts)]
+        if any(c is not None for c in constraints):
+            stopping["logits_processor"] = LogitsProcessorList([
+                JsonSchemaLogitsProcessor(constraints, inputs.input_ids.shape[1], tok.eos_token_id,
+                                          gen["max_new_tokens"])
+            ])
+
+        if seed is not None:
+            set_seed(seed)
+        timing = {} if any(per_call[i]["metrics"] is not None for i in idxs) else None
+        with measure(model, timing):
+            gen_ids = model.generate(
+                **inputs,
+                pad_token_id = tok.pad_token_id,
+                **stopping,
+                **gen,
+            )
+
+        # every row shares the same padded prompt length
+        new_ids = gen_ids[:, inputs.input_ids.shape[1]:]
+        for i, (_, answer) in zip(idxs, split_think_batch(tok, new_ids)):
+            results[i] = answer
+        if timing is not None:
+            # the rows share one generate call: its prefill time is split by prompt tokens and its decode time
+            # by new tokens, so the rows add up to the call instead of each counting all of it
+            prompt_lens = inputs.attention_mask.sum(dim=1).tolist()
+            new_lens = (new_ids != tok.pad_token_id).sum(dim=1).tolist()
+            for i, p_len, n_len in zip(idxs, prompt_lens, new_lens):
+                rec = per_call[i]["metrics"]
+                if rec is not None:
+                    rec.update(timing)
+                    rec["PREFILL_S"] = timing["PREFILL_S"] * p_len / max(sum(prompt_lens), 1)
+                    rec["DECODE_S"] = timing["DECODE_S"] * n_len / max(sum(new_lens), 1)
+                    rec["GEN_BATCH"] = len(idxs)
+                    count(rec, p_len, n_len)
+    return results
+
+# transformers in-process: the batched generate above plus the prefix / conversation KV caches.
+# on_text(text) turns on streaming: every call then runs on its own through stream_chat,
+# its answer is handed to on_text piece by piece and its timing lands in stream_stats.
+# draft turns on assisted decoding for the roles that have a config in assisted_roles
+# (setting_new_pipe.ASSISTED_ROLES), acceptance rates per role are collected in assist_stats.
+class HFBackend(Backend):
+    name = "hf"
+
+    def __init__(self, tok, model, on_text=None, draft=None, assisted_roles=None):
+        from assisted import AssistStats
+        self.tok = tok
+        self.model = model
+        self.on_text = on_text
+        self.stream_stats = []
+        self.draft = draft
+        self.assisted_roles = ASSISTED_ROLES if assisted_roles is None else assisted_roles
+        self.assist_stats = AssistStats()
+
+    @classmethod
+    def load(cls, model_name: str, draft_name: str = None, quant: str = None, **kwargs):
+        tok, model = build_model_and_tokenizer(model_name, quant=quant)
+        draft = build_draft_model(draft_name, tok) if draft_name else None
+        return cls(tok, model, draft=draft, **kwargs)
+
+    # the draft goes to the calls of roles with an assisted config, constrained (schema) calls decode without it
+    def assisted_params(self, params: dict) -> dict:
+        config = self.assisted_roles.get(params.get("role"))
+        if self.draft is None or config is None or params.get("schema") is not None:
+            return params
+        return {**params, "assistant_model": self.draft, "assist_config": config, "assist_stats": self.assist_stats}
+
+    def generate(self, chats: list, params=None) -> list:
+        if self.on_text is None:
+            params = [self.assisted_params(p) for p in per_chat_params(params, len(chats))]
+            return generate_chats(self.tok, self.model, chats, params)
+        results = []
+        for chat, p in zip(chats, per_chat_params(params, len(chats))):
+            stats = {}
+            for piece in stream_chat(self.tok, self.model, chat, stats=stats, **generation_params(p)):
+                self.on_text(piece)
+            self.on_text("\n")
+            print(f"[stream] ttft {stats['TTFT_S'] or 0:.2f}s, {stats['TOKENS']} tokens, "
+                  f"{stats['TOKENS_PER_S'] or 0:.1f} tok/s")
+            self.stream_stats.append({k: v for k, v in stats.items() if k not in ("ANSWER", "THINKING")})
+            results.append(stats["ANSWER"])
+        return results
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tok.encode(text, add_special_tokens=False))
+
+    def render(self, chat: list) -> str:
+        return apply_chat(self.tok, chat)
+
+# the two turns of a finished history record, one event each; the history views are rebuilt from these
+def log_record(log: EventLog, rec: RoundRecord):
+    for turn in rec.turns():
+        log.append(turn.to_event())
+
+
+# one segment per agent output, in prompt order; fmt_hist joins them, the prompt builder drops the oldest first
+def hist_segments(history: list) -> list:
+    lines = []
+    for h in history:
+        tag = f"[Round {h.round}]"
+        lines.append(f"{tag}[{h.track.upper()}]\n{h.response.text}")
+        lines.append(f"{tag}[ASK_{h.track.upper()}]\n{h.ask.text}")
+    return lines
 
 
 def fmt_hist(history: list) -> str:
-    lines = []
-    for h in history:
-        tag = f"[Round {h.get('ROUND', '?')}]"
-        if 'STYLE_RESPONSE' in h:
-            lines.append(f"{tag}[STYLE]\n{h['STYLE_RESPONSE']}")
-        if 'OBJECT_RESPONSE' in h:
-            lines.append(f"{tag}[OBJECT]\n{h['OBJECT_RESPONSE']}")
-        if 'ASK_STYLE' in h:
-            lines.append(f"{tag}[ASK_STYLE]\n{h['ASK_STYLE']}")
-        if 'ASK_OBJECT' in h:
-            lines.append(f"{tag}[ASK_OBJECT]\n{h['ASK_OBJECT']}")
-        if 'ASK_RESPONSE' in h:
-            lines.append(f"{tag}[ASK]\n{h['ASK_RESPONSE']}")
-    return "\n\n".join(lines)
+    return "\n\n".join(hist_segments(history))
+
+
+# The debate is written as a generator of agent calls: every `yield` hands a list of independent
+# (system, user, opts) specs to the driver and gets their responses back in the same order.
+# run_rounds drives one debate through a backend (backends.py), debate_batch.py drives many debates
+# at once and batches whatever calls are ready across them.
+# every user prompt is assembled by a PromptBuilder (prompt_builder.py) under its role's token budget.
+def round_one_lockstep(style_description: str, object_description: str,
+                       history: list, history_style: list, history_object: list, log: EventLog,
+                       builder: PromptBuilder, constrained: bool = False):
+    print("-----Style & Object agent start.-----")
+    response_sty_this_round, response_obj_this_round = yield [
+        (SYS_MSG_STYLE, builder.build(1, "style", SYS_MSG_STYLE, f"【USER PROMPT (STYLE)】\n{style_description}"),
+         json_opts(SCHEMA_STYLE, constrained, "style", 1)),
+        (SYS_MSG_OBJECT, builder.build(1, "object", SYS_MSG_OBJECT, f"【USER PROMPT (OBJECT)】\n{object_description}"),
+         json_opts(SCHEMA_OBJECT, constrained, "object", 1)),
+    ]
+    rec_sty = make_record(1, "style", style_description, response_sty_this_round)
+    rec_obj = make_record(1, "object", object_description, response_obj_this_round)
+    history.extend([rec_sty, rec_obj])
+    history_style.append(rec_sty)
+    history_object.append(rec_obj)
+    log_record(log, rec_sty)
+    log_record(log, rec_obj)
+    print("-----Style & Object agent finished.-----")
+
+
+# ask agent (system prompt, role, schema) and answer agent (system prompt, schema) of each track in lockstep rounds
+LOCKSTEP_ASK = {"style": (SYS_MSG_STY_ASK, "ask_style", SCHEMA_STY_ASK), "object": (SYS_MSG_OBJ_ASK, "ask_object", SCHEMA_OBJ_ASK)}
+LOCKSTEP_ANSWER = {"style": (USER_MSG_STY_ROUND, SCHEMA_STY_ROUND), "object": (USER_MSG_OBJ_ROUND, SCHEMA_OBJ_ROUND)}
+
+# one round of the tracks in lockstep: their ask agents run as one batch, then their answer agents.
+# each track only reads its own history, so the object track no longer waits on the style track.
+# tracks: the tracks still debating (convergence stops the others)
+def round_lockstep(r: int, init_prompt: str,
+                   history: list, history_style: list, history_object: list, log: EventLog,
+                   builder: PromptBuilder, constrained: bool = False, tracks: tuple = ("style", "object")):
+    track_history = {"style": history_style, "object": history_object}
+    names = " & ".join(t.capitalize() for t in tracks)
+    print(f"-----{names} agent start.-----")
+    asks = yield [
+        (system_prompt, builder.build(r, role, system_prompt, f"【USER INITIAL PROMPT】\n {init_prompt}", track_history[t]),
+         json_opts(schema, constrained, role, r))
+        for t in tracks for system_prompt, role, schema in [LOCKSTEP_ASK[t]]
+    ]
+
+    answers = yield [
+        (system_prompt, builder.build(r, t, system_prompt, f"【QUESTIONS ({t})】\n{ask}", track_history[t]),
+         json_opts(schema, constrained, t, r))
+        for t, ask in zip(tracks, asks) for system_prompt, schema in [LOCKSTEP_ANSWER[t]]
+    ]
+
+    recs = [make_record(r, t, ask, answer) for t, ask, answer in zip(tracks, asks, answers)]
+    history.extend(recs)
+    for rec in recs:
+        track_history[rec.track].append(rec)
+    for rec in recs:
+        log_record(log, rec)
+    print(f"-----{names} agent finished.-----")
+
+
+# one round of the shared-history flow: style asks and answers, then object, each reading the whole history.
+# active: tracks still debating (convergence stops the others)
+def round_sequential(r: int, init_prompt: str,
+                     history: list, history_style: list, history_object: list, log: EventLog,
+                     builder: PromptBuilder, constrained: bool, conv: dict, active: dict):
+    # Style agent
+    if active["style"]:
+        print("-----Style agent start.-----")
 
+        hist_prompt = builder.build(r, "ask_style", SYS_MSG_STY_ASK, f"【USER INITIAL PROMPT】\n {init_prompt}", history)
+        response_ask_sty_this_round, = yield [(SYS_MSG_STY_ASK, hist_prompt,
+                                               {"conv_cache": conv["ask_style"], **json_opts(SCHEMA_STY_ASK, constrained, "ask_style", r)})]
 
-def run_rounds(tok, model,
-               sys_sty: str, sys_ask_sty: str, sys_ask_obj: str,
-               response_sty: str, response_ask_sty: str,
-               response_obj: str, response_ask_obj: str,
-               init_prompt:str, 
-               rounds: int, outdir: Path):
+        sty_prompt = builder.build(r, "style", USER_MSG_STY_ROUND, f"【QUESTIONS (style)】\n{response_ask_sty_this_round}", history)
+
+        response_sty_this_round, = yield [(USER_MSG_STY_ROUND, sty_prompt,
+                                           {"conv_cache": conv["style"], **json_opts(SCHEMA_STY_ROUND, constrained, "style", r)})]
+
+        history.append(make_record(r, "style", response_ask_sty_this_round, response_sty_this_round))
+        history_style.append(history[-1])
+        log_record(log, history[-1])
+
+        print("-----Style agent finished.-----")
+
+    # Object agent
+    if active["object"]:
+        print("-----Object agent start.-----")
+        hist_prompt = builder.build(r, "ask_object", SYS_MSG_OBJ_ASK, f"【USER INITIAL PROMPT】\n {init_prompt}", history)
+        response_ask_obj_this_round, = yield [(SYS_MSG_OBJ_ASK, hist_prompt,
+                                               {"conv_cache": conv["ask_object"], **json_opts(SCHEMA_OBJ_ASK, constrained, "ask_object", r)})]
+
+        obj_prompt = builder.build(r, "object", USER_MSG_OBJ_ROUND, f"【QUESTIONS (object)】\n{response_ask_obj_this_round}", history)
+
+        response_obj_this_round, = yield [(USER_MSG_OBJ_ROUND, obj_prompt,
+                                           {"conv_cache": conv["object"], **json_opts(SCHEMA_OBJ_ROUND, constrained, "object", r)})]
+
+        history.append(make_record(r, "object", response_ask_obj_this_round, response_obj_this_round))
+        history_object.append(history[-1])
+        log_record(log, history[-1])
+
+        print("-----Object agent finished.-----")
+
+
+# convergence (convergence.py): a track whose state barely moved in its last round stops debating,
+# one "converge" event per checked track
+def converge_tracks(r: int, active: dict, track_history: dict, log: EventLog, threshold: float):
+    for track, hist in track_history.items():
+        if not active[track] or len(hist) < 2:
+            continue
+        change = track_change(hist[-2], hist[-1])
+        stop = converged(change, threshold)
+        log.append({"ROUND": r, "ROLE": "converge", "TRACK": track, **change, "STOPPED": stop})
+        changes = "" if change["CHANGES"] is None else f", {change['CHANGES']} changes"
+        print(f"[converge] {track} round {r}: drift {change['DRIFT']:.2f}{changes}" + (" -> stopped" if stop else ""))
+        if stop:
+            active[track] = False
+
+
+# constrained: the JSON agents decode under their schema from setting_new_pipe.py
+# history_budget: token budget of every HISTORY block (history_compact.py), None keeps the full history
+# as far as the role's PROMPT_BUDGETS allows; count_tokens measures prompts, pass the backend's
+# count_tokens for exact numbers
+# independent_tracks: the style track only sees history_style and the object track only
+# sees history_object, so both tracks can run side by side as one batch every step.
+# converge: drift threshold (convergence.py) from round 2 on, a track that moved less stops early and
+# rounds is only the cap; None runs every track for all rounds
+# returns the history as records.RoundRecord, JSON payloads already parsed
+def debate_steps(init_prompt: str, rounds: int, outdir: Path,
+                 independent_tracks: bool = False, constrained: bool = False,
+                 history_budget: int = None, count_tokens=approx_tokens, converge: float = None):
     history = []
     history_style = []
     history_object = []
-    hist_path_all = outdir / "history.json"
-    hist_path_style = outdir / "history_style.json"
-    hist_path_object = outdir / "history_object.json"
+    # live KV cache per agent role, so each round only prefills the newly appended history and questions
+    conv = {role: ConversationCache() for role in ("ask_style", "style", "ask_object", "object")}
+    # one JSONL line per agent call; history*.json are built from it once the debate is done
+    log = EventLog(outdir / EVENTS_FILE)
+    builder = PromptBuilder(count_tokens, PROMPT_BUDGETS, hist_segments, log=log, history_budget=history_budget)
 
     # first ask agent divide user prompt into style and object
     print("-----ask agent analyzing.-----")
-    style_description = run_agent(tok, model, SYS_MSG_STY_ASK_FIRST, init_prompt)
-    object_description = run_agent(tok, model, SYS_MSG_OBJ_ASK_FIRST, init_prompt)
+    style_description, object_description = yield [
+        (SYS_MSG_STY_ASK_FIRST, builder.build(1, "split_style", SYS_MSG_STY_ASK_FIRST, init_prompt), role_opts("split_style", 1)),
+        (SYS_MSG_OBJ_ASK_FIRST, builder.build(1, "split_object", SYS_MSG_OBJ_ASK_FIRST, init_prompt), role_opts("split_object", 1)),
+    ]
     # first round
     print("-----Round 1 started.-----")
-    # style agent and asking agent
-    print("-----Style agent start.-----")
-
-    prompt_sty1 = f"【USER PROMPT (STYLE)】\n{style_description}"
-    response_sty_this_round = run_agent(tok, model, SYS_MSG_STYLE, prompt_sty1)
-    history.append({"ROUND": 1, "ASK_STYLE": style_description, "STYLE_RESPONSE": response_sty_this_round})
-    history_style.append({"ROUND": 1, "ASK_STYLE": style_description, "STYLE_RESPONSE": response_sty_this_round})
-
-    dump_json(history, hist_path_all)
-    dump_json(history_style, hist_path_style)
-
-    print("-----Style agent finished.-----")
-
-    # object agent and asking agent
-    print("-----Object agent start.-----")
-    
-    prompt_obj1 = f"【USER PROMPT (OBJECT)】\n{object_description}"
-    response_obj_this_round = run_agent(tok, model, SYS_MSG_OBJECT, prompt_obj1)
-    history.append({"ROUND": 1, "ASK_OBJECT": object_description, "OBJECT_RESPONSE": response_obj_this_round})
-    history_object.append({"ROUND": 1, "ASK_OBJECT": object_description, "OBJECT_RESPONSE": response_obj_this_round})
-    dump_json(history, hist_path_all)
-    dump_json(history_object, hist_path_object)
-
-    print("-----Object agent finished.-----")
-    print("-----Round 1 finished.-----")
-
-    for r in range(2, rounds + 1):
-        print(f"-----Round {r} started.-----")
-        # Style agent
+    if independent_tracks:
+        yield from round_one_lockstep(style_description, object_description,
+                                      history, history_style, history_object, log, builder, constrained)
+    else:
+        # style agent and asking agent
         print("-----Style agent start.-----")
-        
-        hist_txt = fmt_hist(history)
-        hist_prompt = (
-            (f"【HISTORY】\n{hist_txt}\n\n" if hist_txt else "") +
-            (f"【USER INITIAL PROMPT】\n {init_prompt}")
-        )
-        response_ask_sty_this_round = run_agent(tok, model, SYS_MSG_STY_ASK, hist_prompt)
-
-        sty_prompt = (
-            (f"【HISTORY】\n{hist_txt}\n\n" if hist_txt else "") +
-            f"【QUESTIONS (style)】\n{response_ask_sty_this_round}"
-        )
-
-        response_sty_this_round = run_agent(tok, model, USER_MSG_STY_ROUND, sty_prompt)
 
-        history.append({"ROUND": r, "ASK_STYLE": response_ask_sty_this_round, "STYLE_RESPONSE": response_sty_this_round})
-        history_style.append({"ROUND": r, "ASK_STYLE": response_ask_sty_this_round, "STYLE_RESPONSE": response_sty_this_round})
-        dump_json(history, hist_path_all)
-        dump_json(history_style, hist_path_style)
+        prompt_sty1 = builder.build(1, "style", SYS_MSG_STYLE, f"【USER PROMPT (STYLE)】\n{style_description}")
+        response_sty_this_round, = yield [(SYS_MSG_STYLE, prompt_sty1,
+                                           {"conv_cache": conv["style"], **json_opts(SCHEMA_STYLE, constrained, "style", 1)})]
+        history.append(make_record(1, "style", style_description, response_sty_this_round))
+        history_style.append(history[-1])
+        log_record(log, history[-1])
 
         print("-----Style agent finished.-----")
-        # Object agent
-        print("-----Object agent start.-----")
-        hist_txt = fmt_hist(history)
-        hist_prompt = (
-            (f"【HISTORY】\n{hist_txt}\n\n" if hist_txt else "") +
-            (f"【USER INITIAL PROMPT】\n {init_prompt}")
-        )
-        response_ask_obj_this_round = run_agent(tok, model, SYS_MSG_OBJ_ASK, hist_prompt)
-
-        obj_prompt = (
-            (f"【HISTORY】\n{hist_txt}\n\n" if hist_txt else "") +
-            f"【QUESTIONS (object)】\n{response_ask_obj_this_round}"
-        )
 
-        response_obj_this_round = run_agent(tok, model, USER_MSG_OBJ_ROUND, obj_prompt)
+        # object agent and asking agent
+        print("-----Object agent start.-----")
 
-        history.append({"ROUND": r, "ASK_OBJECT": response_ask_obj_this_round, "OBJECT_RESPONSE": response_obj_this_round})
-        history_object.append({"ROUND": r, "ASK_OBJECT": response_ask_obj_this_round, "OBJECT_RESPONSE": response_obj_this_round})
-        dump_json(history, hist_path_all)
-        dump_json(history_object, hist_path_object)
+        prompt_obj1 = builder.build(1, "object", SYS_MSG_OBJECT, f"【USER PROMPT (OBJECT)】\n{object_description}")
+        response_obj_this_round, = yield [(SYS_MSG_OBJECT, prompt_obj1,
+                                           {"conv_cache": conv["object"], **json_opts(SCHEMA_OBJECT, constrained, "object", 1)})]
+        history.append(make_record(1, "object", object_description, response_obj_this_round))
+        history_object.append(history[-1])
+        log_record(log, history[-1])
 
         print("-----Object agent finished.-----")
+    log.flush()
+    print("-----Round 1 finished.-----")
 
+    active = {"style": True, "object": True}
+    last_round = 1
+    for r in range(2, rounds + 1):
+        last_round = r
+        print(f"-----Round {r} started.-----")
+        if independent_tracks:
+            yield from round_lockstep(r, init_prompt, history, history_style, history_object, log, builder,
+                                      constrained, tracks=tuple(t for t in active if active[t]))
+        else:
+            yield from round_sequential(r, init_prompt, history, history_style, history_object, log, builder,
+                                        constrained, conv, active)
+        log.flush()
         print(f"-----Round {r} finished.-----")
-
-    hist_txt_style = fmt_hist(history_style)  
-    user_prompt_style = (
-        f"USER INITIAL PROMPT: {init_prompt}\n"
-        f"HISTORY:\n{hist_txt_style}\n\n"
-        f"Study HISTORY and produce one precise English prompt that clearly and specifically describes the painting style implied by the USER PROMPT."
+        if converge is not None:
+            converge_tracks(r, active, {"style": history_style, "object": history_object}, log, converge)
+            if not any(active.values()):
+                print(f"-----All tracks converged after round {r}.-----")
+                break
+
+    # the final writers read the whole track history (fmt_hist): every answer and every ASK turn
+    user_prompt_style = builder.build(
+        last_round, "final_style", SYS_MSG_FINAL_STYLE,
+        f"Study HISTORY and produce one precise English prompt that clearly and specifically describes the painting style implied by the USER PROMPT.",
+        history_style, head=f"USER INITIAL PROMPT: {init_prompt}\nHISTORY:\n", wrap="{}\n\n",
     )
-    final_prompt_style = run_agent(tok, model, SYS_MSG_FINAL_STYLE, user_prompt_style)
-    (outdir / f"final_style_prompt.json").write_text(final_prompt_style, encoding="utf-8")
-
-    hist_txt_object = fmt_hist(history_object)  
-    user_prompt_object = (
-        f"USER INITIAL PROMPT: {init_prompt}\n"
-        f"HISTORY:\n{hist_txt_object}\n\n"
-        f"Study HISTORY and produce one precise English prompt line that clearly specifies the key objects/motifs characteristic of the style(s), adding only essential cues (form, color palette, lighting, composition role) when critical."
+    user_prompt_object = builder.build(
+        last_round, "final_object", SYS_MSG_FINAL_OBJECT,
+        f"Study HISTORY and produce one precise English prompt line that clearly specifies the key objects/motifs characteristic of the style(s), adding only essential cues (form, color palette, lighting, composition role) when critical.",
+        history_object, head=f"USER INITIAL PROMPT: {init_prompt}\nHISTORY:\n", wrap="{}\n\n",
     )
-    final_prompt_object = run_agent(tok, model, SYS_MSG_FINAL_OBJECT, user_prompt_object)
+    # both final writers are independent, run them as one batch
+    final_prompt_style, final_prompt_object = yield [
+        (SYS_MSG_FINAL_STYLE, user_prompt_style, role_opts("final_style", last_round)),
+        (SYS_MSG_FINAL_OBJECT, user_prompt_object, role_opts("final_object", last_round)),
+    ]
+    (outdir / f"final_style_prompt.json").write_text(final_prompt_style, encoding="utf-8")
     (outdir / f"final_object_prompt.json").write_text(final_prompt_object, encoding="utf-8")
+    log.append({"ROUND": last_round, "ROLE": "final_style", "TEXT": final_prompt_style})
+    log.append({"ROUND": last_round, "ROLE": "final_object", "TEXT": final_prompt_object})
+    log.close()
+    write_views(outdir)
 
+    return history
+
+
+# run one debate generator to the end, generate(specs) -> responses answers every step
+def drive(steps, generate):
+    try:
+        calls = next(steps)
+        while True:
+            calls = steps.send(generate(calls))
+    except StopIteration as e:
+        return e.value
 
+
+# backend: any backends.Backend, defaults to transformers on (tok, model); seed goes to every agent call
+# state: checkpoint.DebateState, every step is saved to it and the steps it already holds are replayed
+# converge: stop tracks early once they converge (debate_steps), rounds is then the cap
+# every generated call lands in <outdir>/metrics.jsonl, summarised by role and round at the end
+def run_rounds(tok, model,
+               sys_sty: str, sys_ask_sty: str, sys_ask_obj: str,
+               response_sty: str, response_ask_sty: str,
+               response_obj: str, response_ask_obj: str,
+               init_prompt:str, 
+               rounds: int, outdir: Path,
+               independent_tracks: bool = False,
+               constrained: bool = False,
+               backend: Backend = None,
+               history_budget: int = None,
+               seed: int = None,
+               state: DebateState = None,
+               converge: float = None):
+    backend = backend or HFBackend(tok, model)
+    defaults = {"seed": seed} if seed is not None else None
+    metrics_log = EventLog(Path(outdir) / METRICS_FILE)
+    generate = with_metrics(lambda specs: run_specs(backend, specs, defaults), metrics_log)
+    if state is not None:
+        # the replay logs every saved call again, start the event log over
+        if state.steps:
+            (Path(outdir) / EVENTS_FILE).unlink(missing_ok=True)
+        generate = state.wrap(generate)
+    steps = debate_steps(init_prompt, rounds, outdir,
+                         independent_tracks=independent_tracks, constrained=constrained,
+                         history_budget=history_budget, count_tokens=backend.count_tokens, converge=converge)
+    history = drive(steps, generate)
+    metrics_log.close()
+    print(write_summary(outdir))
+    if state is not None and state.replayed:
+        print(f"[resume] {state.replayed} of {len(state.steps)} steps came from {state.path}")
     return history
 
 
+# runs/<outdir>/<date>/<time>, the layout every debate writes to
+def make_run_dir(outdir) -> Path:
+    date_str = time.strftime("%Y%m%d")
+    time_str = time.strftime("%H%M%S")
+    return Path(outdir) / date_str / time_str
+
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--prompt", type=str, required=True, help="user prompt K 給 agent A")
+    parser.add_argument("--prompt", type=str, default=None, help="user prompt K 給 agent A")
     parser.add_argument("--outdir", type=str, default="logs_run", help="輸出資料夾")
     parser.add_argument("--rounds", type=int, default="3", help="debating rounds")
+    parser.add_argument("--independent-tracks", action="store_true",
+                        help="style/object tracks only see their own history and run side by side as a batch")
+    parser.add_argument("--constrained", action="store_true",
+                        help="constrain the JSON agents to their schema, outputs always parse")
+    parser.add_argument("--backend", choices=BACKEND_NAMES, default="hf",
+                        help="generation engine: hf (transformers), vllm (offline engine, GPU or CPU build), stub (fake, for tests)")
+    parser.add_argument("--server", type=str, default=None,
+                        help="send agent calls to a running inference_server.py (e.g. http://127.0.0.1:8765) instead of loading the model")
+    parser.add_argument("--history-budget", type=int, default=None,
+                        help="token budget of the HISTORY block; older rounds collapse into their CHANGES_SINCE_PREV (default: full history)")
+    parser.add_argument("--stream", action="store_true",
+                        help="print every agent answer live as it is generated, with time to first token and tok/s (hf backend)")
+    parser.add_argument("--assisted", action="store_true",
+                        help=f"assisted decoding with the draft model {DRAFT_MODEL_NAME} for the roles in ASSISTED_ROLES (hf backend)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="fixed sampling seed for every agent call, makes sampled runs reproducible and cacheable")
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help="on-disk response cache shared by all runs (e.g. .cache/responses), unchanged calls are not generated again")
+    parser.add_argument("--cache-size-mb", type=int, default=1024, help="size cap of --cache-dir, least recently used answers go first")
+    parser.add_argument("--cache-sampled", action="store_true",
+                        help="also cache sampled calls without --seed (replays the first answer drawn)")
+    parser.add_argument("--quant", choices=QUANT_MODES, default=None,
+                        help="CPU execution mode of the hf backend: int8 (dynamic int8 Linear layers) or bf16")
+    parser.add_argument("--converge", type=float, nargs="?", const=DRIFT_THRESHOLD, default=None,
+                        help=f"stop a track once its brief / object list drifts less than this between rounds (default {DRIFT_THRESHOLD}), --rounds becomes the cap")
+    parser.add_argument("--resume", type=str, default=None,
+                        help="continue a crashed run from its run dir (e.g. runs/20250907/153000), settings come from its state.json")
     args = parser.parse_args()
-
-    ts = time.strftime("%Y%m%d-%H%M%S")
-    date_str = time.strftime("%Y%m%d")
-    time_str = time.strftime("%H%M%S")
-    outdir = Path(args.outdir) / date_str / time_str
-
-    tok, model = build_model_and_tokenizer(MODEL_NAME)
+    # options the chosen engine would silently ignore
+    if args.stream and (args.server or args.backend != "hf"):
+        parser.error("--stream needs the in-process hf backend (--backend hf, no --server)")
+    if args.assisted and (args.server or args.backend != "hf"):
+        parser.error("--assisted needs the in-process hf backend (--backend hf, no --server)")
+    if args.stream and args.assisted:
+        parser.error("--stream and --assisted can not be combined, streamed calls decode without the draft")
+    if args.server and (args.quant or args.backend != "hf"):
+        parser.error("--server runs the server's model, --quant / --backend do not apply")
+
+    # the debate settings live in <run dir>/state.json, the answers of every finished step in steps.jsonl next to it
+    if args.resume:
+        outdir = Path(args.resume)
+        state = DebateState.load(outdir / STATE_FILE)
+        cfg = state.config
+        print(f"[resume] {outdir}: {len(state.steps)} saved steps")
+    elif args.prompt is None:
+        parser.error("--prompt is required (or --resume <run dir>)")
+    else:
+        outdir = make_run_dir(args.outdir)
+        cfg = {"PROMPT": args.prompt, "ROUNDS": args.rounds, "INDEPENDENT_TRACKS": args.independent_tracks,
+               "CONSTRAINED": args.constrained, "HISTORY_BUDGET": args.history_budget, "SEED": args.seed,
+               "CONVERGE": args.converge}
+        state = DebateState(outdir / STATE_FILE, cfg)
+        state.save()
+
+    # hf stays in this module (it is __main__ here), other engines come from backends.py
+    tok = model = backend = None
+    if args.server:
+        backend = RemoteBackend(args.server)
+    elif args.backend == "hf" and args.stream:
+        backend = HFBackend.load(MODEL_NAME, quant=args.quant, on_text=lambda piece: print(piece, end="", flush=True))
+    elif args.backend == "hf" and args.assisted:
+        backend = HFBackend.load(MODEL_NAME, draft_name=DRAFT_MODEL_NAME, quant=args.quant)
+    elif args.backend == "hf":
+        tok, model = build_model_and_tokenizer(MODEL_NAME, quant=args.quant)
+    else:
+        backend = make_backend(args.backend, MODEL_NAME)
+    hf_backend = backend if isinstance(backend, HFBackend) else None
+    if args.cache_dir:
+        backend = CachedBackend(backend or HFBackend(tok, model), ResponseCache(args.cache_dir, args.cache_size_mb << 20),
+                                MODEL_NAME, sampled=args.cache_sampled)
 
     history = run_rounds(
         tok, model,
         sys_sty=SYS_MSG_STYLE,
         sys_ask_sty=SYS_MSG_STY_ASK,
         sys_ask_obj=SYS_MSG_OBJ_ASK,
-        init_prompt=args.prompt,
+        init_prompt=cfg["PROMPT"],
         response_sty=USER_MSG_STY_ROUND,
         response_ask_sty=USER_MSG_STY_ASK_ROUND,
         response_obj=USER_MSG_OBJ_ROUND,
         response_ask_obj=USER_MSG_OBJ_ASK_ROUND,
-        rounds=args.rounds,
-        outdir=outdir
+        rounds=cfg["ROUNDS"],
+        outdir=outdir,
+        independent_tracks=cfg["INDEPENDENT_TRACKS"],
+        constrained=cfg["CONSTRAINED"],
+        backend=backend,
+        history_budget=cfg["HISTORY_BUDGET"],
+        seed=cfg["SEED"],
+        state=state,
+        converge=cfg.get("CONVERGE")
     )
 
+    if hf_backend is not None and hf_backend.draft is not None:
+        print(hf_backend.assist_stats.report())
+    if isinstance(backend, CachedBackend):
+        print(backend.report())
     print("Done.")
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+import json
+
+# keys holding the consolidated state of a track, newest first
+STATE_KEYS = {
+    "style": ("UPDATE_STYLE_BRIEF", "STYLE_BRIEF"),
+    "object": ("UPDATE_OBJECTS", "OBJECTS"),
+}
+SNIPPET_KEYS = ("PROMPT_SNIPPET", "PROMPT_SNIPPETS", "UPDATE_PROMPT")
+DELTA_CHARS = 300
+
+
+# rough count for backends without a tokenizer at hand, ~4 characters per token
+def approx_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False)
+
+
+# latest consolidated state of a track: the newest brief / object list plus its prompt snippet
+def state_text(turn, state_keys) -> str:
+    obj = turn.data
+    if obj is None:
+        return turn.text
+    state = {}
+    for k in state_keys:
+        if k in obj:
+            state[k] = obj[k]
+            break
+    state.update({k: obj[k] for k in SNIPPET_KEYS if k in obj})
+    return dumps(state) if state else dumps(obj)
+
+
+# what an older round changed: its CHANGES_SINCE_PREV, else its prompt snippet, else the head of the raw text
+def delta_text(turn) -> str:
+    obj = turn.data
+    if obj is not None:
+        for k in ("CHANGES_SINCE_PREV",) + SNIPPET_KEYS:
+            v = obj.get(k)
+            if v:
+                return "\n".join(f"- {c}" for c in v) if isinstance(v, list) else str(v)
+    text = turn.text if isinstance(turn.text, str) else dumps(turn.text)
+    return text[:DELTA_CHARS] + ("..." if len(text) > DELTA_CHARS else "")
+
+
+# head of text that fits budget tokens including its "..."
+def clip(text: str, budget: int, count_tokens) -> str:
+    n = count_tokens(text)
+    if n <= budget:
+        return text
+    cut = len(text) * budget // n
+    while cut > 0 and count_tokens(text[:cut] + "...") > budget:
+        cut -= max(1, cut // 10)
+    return text[:cut] + "..." if cut > 0 else ""
+
+
+# history (records.RoundRecord list) as text that fits budget tokens: per track the latest state and the latest ASK stay in full,
+# older rounds collapse into short deltas, and the oldest deltas are dropped first when over budget.
+# if the latest blocks alone are still too long, each of them is clipped to an equal share.
+def compact_history(history: list, budget: int, count_tokens=approx_tokens) -> str:
+    latest = []
+    deltas = []
+    for track, state_keys in STATE_KEYS.items():
+        records = [h for h in history if h.track == track]
+        if not records:
+            continue
+        tag = track.upper()
+        last = records[-1]
+        latest.append(f"[Round {last.round}][{tag}]\n{state_text(last.response, state_keys)}")
+        if last.ask.text:
+            latest.append(f"[Round {last.round}][ASK_{tag}]\n{last.ask.text}")
+        for h in records[:-1]:
+            deltas.append((h.round, f"[Round {h.round}][{tag} CHANGES]\n{delta_text(h.response)}"))
+    deltas.sort(key=lambda d: d[0])
+    deltas = [text for _, text in deltas]
+
+    # "\n\n" between blocks is counted as one token
+    used = sum(count_tokens(b) + 1 for b in latest)
+    kept = []
+    for text in reversed(deltas):
+        n = count_tokens(text) + 1
+        if used + n > budget:
+            break
+        kept.append(text)
+        used += n
+    kept.reverse()
+
+    if used > budget and latest:
+        share = budget // len(latest) - 1
+        latest = [clip(b, share, count_tokens) for b in latest]
+    return "\n\n".join(kept + latest)
@@ -0,0 +1,143 @@
+"""
+CUDA_VISIBLE_DEVICES=4
+python inference_server.py --port 8765
+
+python debate_rounds_new_pipe.py \
+  --prompt "Fauvism, Miyazaki Hayao, a girl and a dragon in the cave" \
+  --rounds 3 \
+  --outdir runs \
+  --server http://127.0.0.1:8765
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backends import BACKEND_NAMES, make_backend, per_chat_params
+from quantize import QUANT_MODES
+from setting_new_pipe import MODEL_NAME
+
+
+# one thread owns the model: requests of concurrent clients are queued, whatever arrives within
+# max_wait seconds (up to max_batch chats) goes into one backend.generate call,
+# and every client gets its own slice of the outputs back.
+class BatchingWorker(threading.Thread):
+    def __init__(self, backend, max_batch: int = 16, max_wait: float = 0.02):
+        super().__init__(daemon=True)
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.jobs = queue.Queue()
+        self.calls = 0
+        self.chats = 0
+
+    # called from the HTTP threads, blocks until the batch holding these chats is done
+    def submit(self, chats: list, params=None) -> list:
+        job = {"chats": chats, "params": per_chat_params(params, len(chats)),
+               "done": threading.Event(), "outputs": None, "error": None}
+        self.jobs.put(job)
+        job["done"].wait()
+        if job["error"] is not None:
+            raise RuntimeError(job["error"])
+        return job["outputs"]
+
+    def run(self):
+        while True:
+            batch = [self.jobs.get()]
+            size = len(batch[0]["chats"])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    job = self.jobs.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(job)
+                size += len(job["chats"])
+            self.run_batch(batch)
+
+    def run_batch(self, batch: list):
+        chats = [c for job in batch for c in job["chats"]]
+        params = [p for job in batch for p in job["params"]]
+        try:
+            outputs = self.backend.generate(chats, params)
+        except Exception as e:
+            for job in batch:
+                job["error"] = f"{type(e).__name__}: {e}"
+                job["done"].set()
+            return
+        self.calls += 1
+        self.chats += len(chats)
+        k = 0
+        for job in batch:
+            job["outputs"] = outputs[k:k + len(job["chats"])]
+            k += len(job["chats"])
+            job["done"].set()
+
+
+def make_handler(worker: BatchingWorker, info: dict):
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, code: int, obj):
+            body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self.send_json(404, {"error": f"unknown path {self.path}"})
+            self.send_json(200, {**info, "batches": worker.calls, "chats": worker.chats})
+
+        def do_POST(self):
+            if self.path != "/generate":
+                return self.send_json(404, {"error": f"unknown path {self.path}"})
+            try:
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+                outputs = worker.submit(req["chats"], req.get("params"))
+            except (ValueError, KeyError) as e:
+                return self.send_json(400, {"error": f"bad request: {e}"})
+            except RuntimeError as e:
+                return self.send_json(500, {"error": str(e)})
+            self.send_json(200, {"outputs": outputs})
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="only bind to localhost unless you mean it")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--backend", choices=BACKEND_NAMES, default="hf", help="generation engine kept resident")
+    parser.add_argument("--max-batch", type=int, default=16, help="max chats per generate call")
+    parser.add_argument("--max-wait", type=float, default=0.02, help="seconds to wait for more clients before a batch starts")
+    parser.add_argument("--quant", choices=QUANT_MODES, default=None,
+                        help="CPU execution mode of the hf backend: int8 (dynamic int8 Linear layers) or bf16")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    backend = make_backend(args.backend, MODEL_NAME, **({"quant": args.quant} if args.quant else {}))
+    print(f"{args.backend} backend ({MODEL_NAME}) loaded in {time.time() - t0:.1f}s")
+
+    worker = BatchingWorker(backend, max_batch=args.max_batch, max_wait=args.max_wait)
+    worker.start()
+    server = ThreadingHTTPServer((args.host, args.port),
+                                 make_handler(worker, {"model": MODEL_NAME, "backend": args.backend}))
+    print(f"serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+if __name__ == "__main__":
+    main()
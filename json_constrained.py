@@ -0,0 +1,394 @@
+import json
+from collections import deque
+
+import torch
+from transformers import LogitsProcessor
+
+
+# decoded text of every token plus the masks the constraint needs, built once per (tokenizer, vocab size)
+class _Vocab:
+    def __init__(self, tok, size: int):
+        n = min(size, len(tok))
+        texts = tok.batch_decode([[i] for i in range(n)])
+        banned = set(tok.added_tokens_decoder) | set(tok.all_special_ids)
+
+        self.size = size
+        self.texts = texts + [""] * (size - n)
+        self.ids = {}   # text -> first token id decoding to exactly that text
+        self.string_body = torch.zeros(size, dtype=torch.bool)
+        for i, t in enumerate(texts):
+            if i in banned or not t:
+                continue
+            self.ids.setdefault(t, i)
+            if '"' in t or "\\" in t or "\ufffd" in t or any(ord(c) < 32 for c in t):
+                continue
+            self.string_body[i] = True
+
+_VOCABS = {}
+
+def _vocab(tok, size: int) -> _Vocab:
+    key = (id(tok), size)
+    if key not in _VOCABS:
+        _VOCABS[key] = _Vocab(tok, size)
+    return _VOCABS[key]
+
+
+# number grammar -?(0|[1-9][0-9]*)(.[0-9]+)? as a char DFA; states in _NUM_END may be followed by the next char
+_NUM = {
+    "start": {"-": "sign", "0": "zero", **{d: "int" for d in "123456789"}},
+    "sign": {"0": "zero", **{d: "int" for d in "123456789"}},
+    "zero": {".": "dot"},
+    "int": {".": "dot", **{d: "int" for d in "0123456789"}},
+    "dot": {d: "frac" for d in "0123456789"},
+    "frac": {d: "frac" for d in "0123456789"},
+}
+_NUM_END = {"zero", "int", "frac"}
+_NUM_MAX_CHARS = 12
+
+
+def _first_char(schema) -> str:
+    t = schema.get("type")
+    if "enum" in schema or t not in ("object", "array", "string"):
+        raise ValueError(f"array items must be object / array / string, got {schema}")
+    return {"object": "{", "array": "[", "string": '"'}[t]
+
+
+# smallest value valid for schema, its compact length bounds the tokens needed to close a value in a hurry
+def _minimal(schema):
+    if "enum" in schema:
+        return schema["enum"][0]
+    t = schema.get("type")
+    if t == "object":
+        return {k: _minimal(v) for k, v in schema.get("properties", {}).items()}
+    if t == "array":
+        return [_minimal(schema["items"])] * schema.get("minItems", 0)
+    return {"string": "", "number": 0, "integer": 0, "boolean": True}.get(t)
+
+
+# walk a JSON schema and yield the decoding steps of one compact JSON value:
+#   ("lit", text)                   fixed text (keys, punctuation), fast-forwarded without sampling
+#   ("choice", [texts])             one of several fixed texts, the index of the pick is sent back
+#   ("str", max_chars, follow)      free string body, closed by '"' (or '"' + one char of follow)
+#   ("num", integer, follow)        free number, ended by one char of follow
+# follow holds the chars that may come right after the value; opened means its first char is already emitted.
+def _walk(schema, follow: str, opened: bool = False):
+    if "enum" in schema:
+        yield ("choice", [json.dumps(v, ensure_ascii=False) for v in schema["enum"]])
+        return
+
+    t = schema.get("type")
+    if t == "object":
+        props = list(schema.get("properties", {}).items())
+        if not opened:
+            yield ("lit", "{")
+        for i, (key, sub) in enumerate(props):
+            end = "}" if i == len(props) - 1 else ","
+            yield ("lit", json.dumps(key, ensure_ascii=False) + ":")
+            yield from _walk(sub, end)
+            yield ("lit", end)
+        if not props:
+            yield ("lit", "}")
+    elif t == "array":
+        items = schema["items"]
+        lo, hi = schema.get("minItems", 0), schema.get("maxItems", 64)
+        start = _first_char(items)
+        if not opened:
+            yield ("lit", "[")
+        n = 0
+        while True:
+            # "]" first so that running out of budget closes the array
+            options = (["]"] if n >= lo else []) + ([start if n == 0 else ","] if n < hi else [])
+            idx = yield ("choice", options)
+            if options[idx] == "]":
+                return
+            item_follow = ("," if n + 1 < hi else "") + ("]" if n + 1 >= lo else "")
+            yield from _walk(items, item_follow, opened=(n == 0))
+            n += 1
+    elif t == "string":
+        if not opened:
+            yield ("lit", '"')
+        yield ("str", schema.get("maxLength", 512), follow)
+    elif t in ("number", "integer"):
+        if not follow:
+            raise ValueError("a number can not be the top-level value")
+        yield ("num", t == "integer", follow)
+    elif t == "boolean":
+        yield ("choice", ["true", "false"])
+    elif t == "null":
+        yield ("lit", "null")
+    else:
+        raise ValueError(f"unsupported schema: {schema}")
+
+
+# token-level state machine that only allows tokens keeping the output valid for a JSON schema.
+# fixed text is queued as forced tokens (see pop_forced) so a decode loop can prefill it without a model step.
+# prefix is forced text emitted before the JSON value (e.g. closing the <think> span of a thinking model).
+class JsonSchemaConstraint:
+    def __init__(self, tok, schema, vocab_size: int, prefix: str = ""):
+        self.tok = tok
+        self.vocab = _vocab(tok, vocab_size)
+        self.queue = deque()    # forced token ids, in order
+        self.buf = prefix       # forced text not tokenized yet
+        self.pending = ""       # text already emitted past the finished step (the ',' of a '",' token)
+        self.step = None
+        self.done = False
+        self.closing = False    # out of token budget: close every open value as fast as possible
+        self.forced_count = 0
+        self.schema = schema
+        self.prefix = prefix
+        # tokens to keep in hand for closing everything (a token is at least one char)
+        self.reserve = len(prefix) + len(json.dumps(_minimal(schema), separators=(",", ":"), ensure_ascii=False))
+        self._steps = _walk(schema, "")
+        self._reply = None
+        self._close_cache = {}
+        self._next()
+
+    def _encode(self, text: str):
+        return self.tok.encode(text, add_special_tokens=False)
+
+    def _flush(self):
+        if self.buf:
+            self.queue.extend(self._encode(self.buf))
+            self.buf = ""
+
+    def _consume(self, text: str) -> str:
+        k = min(len(self.pending), len(text))
+        self.pending = self.pending[k:]
+        return text[k:]
+
+    # run the walker up to the next step that needs the model, collecting fixed text on the way
+    def _next(self):
+        while True:
+            try:
+                step = self._steps.send(self._reply)
+            except StopIteration:
+                self._flush()
+                self.step = None
+                self.done = True
+                return
+            self._reply = None
+
+            if step[0] == "lit":
+                self.buf += self._consume(step[1])
+                continue
+            if step[0] == "choice":
+                options = step[1]
+                if self.pending:
+                    idx = next(i for i, o in enumerate(options) if o.startswith(self.pending[:1]))
+                elif len(options) == 1:
+                    idx = 0
+                else:
+                    self._flush()
+                    self.step = step
+                    self._options = [self._encode(o) for o in options]
+                    self._alive = list(range(len(options)))
+                    self._k = 0
+                    return
+                self.buf += self._consume(options[idx])
+                self._reply = idx
+                continue
+
+            self._flush()
+            self.step = step
+            self._chars = 0
+            self._num_state = "start"
+            return
+
+    def _close_ids(self, follow: str):
+        if follow not in self._close_cache:
+            texts = ['"'] + ['"' + c for c in follow]
+            self._close_cache[follow] = [self.vocab.ids[t] for t in texts if t in self.vocab.ids]
+        return self._close_cache[follow]
+
+    # forced tokens that can be emitted right now without sampling
+    def pop_forced(self):
+        forced = list(self.queue)
+        self.queue.clear()
+        self.forced_count += len(forced)
+        return forced
+
+    # bool mask over the vocabulary of the tokens allowed next; None once the value is complete
+    def allowed(self):
+        mask = torch.zeros(self.vocab.size, dtype=torch.bool)
+        if self.queue:
+            mask[self.queue[0]] = True
+            return mask
+        if self.done:
+            return None
+
+        kind = self.step[0]
+        if kind == "choice":
+            alive = self._alive[:1] if self.closing else self._alive
+            for i in alive:
+                mask[self._options[i][self._k]] = True
+        elif kind == "str":
+            _, max_chars, follow = self.step
+            if self.closing:
+                # one way out: the quote plus the char that closes the enclosing value (last in follow)
+                mask[self._close_ids(follow[-1:])[-1]] = True
+                return mask
+            if self._chars < max_chars:
+                mask |= self.vocab.string_body
+            mask[self._close_ids(follow)] = True
+        else:
+            _, integer, follow = self.step
+            can_end = self._num_state in _NUM_END
+            if can_end and self.closing:
+                chars = list(follow[-1:])
+            elif can_end and self._chars >= _NUM_MAX_CHARS:
+                chars = list(follow)
+            elif self.closing:
+                chars = ["0"]
+            else:
+                chars = [c for c in _NUM[self._num_state] if not (integer and c == ".")]
+                chars += list(follow) if can_end else []
+            for c in chars:
+                if c in self.vocab.ids:
+                    mask[self.vocab.ids[c]] = True
+        return mask
+
+    # feed back the token that was emitted
+    def advance(self, t: int):
+        if self.queue:
+            self.queue.popleft()
+            return
+
+        kind = self.step[0]
+        text = self.vocab.texts[t]
+        if kind == "choice":
+            self._alive = [i for i in self._alive
+                           if len(self._options[i]) > self._k and self._options[i][self._k] == t]
+            self._k += 1
+            finished = [i for i in self._alive if len(self._options[i]) == self._k]
+            if finished or len(self._alive) == 1:
+                idx = finished[0] if finished else self._alive[0]
+                self.queue.extend(self._options[idx][self._k:])
+                self._reply = idx
+                self._next()
+        elif kind == "str":
+            if text.startswith('"'):
+                self.pending = text[1:]
+                self._next()
+            else:
+                self._chars += len(text)
+        else:
+            if text in self.step[2]:
+                self.pending = text
+                self._next()
+            else:
+                self._num_state = _NUM[self._num_state][text]
+                self._chars += 1
+
+
+_MIN_TOKENS = {}
+
+# tokens of the shortest valid output of constraint's schema, forced tokens included (each one is a step of
+# model.generate): a fresh copy is walked in closing mode, where every step allows a single token.
+# a smaller max_new_tokens can only truncate the value.
+def min_tokens(constraint: JsonSchemaConstraint) -> int:
+    key = (id(constraint.tok), constraint.vocab.size, constraint.prefix,
+           json.dumps(constraint.schema, sort_keys=True, ensure_ascii=False))
+    if key not in _MIN_TOKENS:
+        probe = JsonSchemaConstraint(constraint.tok, constraint.schema, constraint.vocab.size, constraint.prefix)
+        probe.closing = True
+        n = 0
+        while True:
+            n += len(probe.pop_forced())
+            if probe.done:
+                break
+            probe.advance(int(probe.allowed().nonzero()[0]))
+            n += 1
+        _MIN_TOKENS[key] = n
+    return _MIN_TOKENS[key]
+
+
+def check_budget(constraint: JsonSchemaConstraint, max_new_tokens: int):
+    need = min_tokens(constraint)
+    if max_new_tokens < need:
+        raise ValueError(f"max_new_tokens={max_new_tokens} is too small for this schema: "
+                         f"its shortest valid JSON needs {need} tokens")
+
+
+# LogitsProcessor for model.generate: every row of the batch has its own constraint (None = unconstrained).
+# batched constrained calls decode forced tokens one at a time: model.generate advances all rows by one
+# token per step, so keys and punctuation each cost a full step here. Only the single-sequence
+# generate_constrained fast-forwards them.
+# generate can not run past max_new_tokens, so rows start closing their value reserve tokens early.
+class JsonSchemaLogitsProcessor(LogitsProcessor):
+    def __init__(self, constraints: list, prompt_len: int, eos_token_id: int, max_new_tokens: int):
+        for c in constraints:
+            if c is not None:
+                check_budget(c, max_new_tokens)
+        self.constraints = constraints
+        self.prompt_len = prompt_len
+        self.eos_token_id = eos_token_id
+        self.max_new_tokens = max_new_tokens
+        self.finished = [False] * len(constraints)
+
+    def __call__(self, input_ids, scores):
+        generated = input_ids.shape[1] - self.prompt_len
+        started = generated > 0
+        for i, c in enumerate(self.constraints):
+            if c is None:
+                continue
+            if generated >= self.max_new_tokens - c.reserve - 1:
+                c.closing = True
+            if self.finished[i]:
+                mask = torch.zeros(scores.shape[1], dtype=torch.bool)
+                mask[self.eos_token_id] = True
+            else:
+                if started:
+                    c.advance(int(input_ids[i, -1]))
+                mask = c.allowed()
+                if mask is None:
+                    # the JSON value is complete, end the row
+                    self.finished[i] = True
+                    mask = torch.zeros(scores.shape[1], dtype=torch.bool)
+                    mask[self.eos_token_id] = True
+            scores[i, ~mask.to(scores.device)] = -float("inf")
+        return scores
+
+
+def _sample(logits, do_sample: bool, temperature, top_p, top_k=None) -> int:
+    if not do_sample or not temperature:
+        return int(logits.argmax())
+    if top_k:
+        logits = logits.masked_fill(logits < logits.topk(min(top_k, logits.shape[-1])).values[-1], -float("inf"))
+    probs = torch.softmax(logits / temperature, dim=-1)
+    if top_p is not None and top_p < 1.0:
+        sorted_probs, order = probs.sort(descending=True)
+        sorted_probs[sorted_probs.cumsum(0) - sorted_probs >= top_p] = 0
+        probs = torch.zeros_like(probs).scatter(0, order, sorted_probs)
+    return int(torch.multinomial(probs, 1))
+
+
+# single-sequence constrained decode loop. forced tokens (keys, punctuation, the rest of an enum value)
+# are appended to the next forward call as one prefill chunk instead of being sampled one step at a time.
+# input_ids: [1, L] prompt; past_key_values may already cover a prefix of it.
+# returns (new token ids, past_key_values covering all but the last forced tokens).
+@torch.no_grad()
+def generate_constrained(model, constraint: JsonSchemaConstraint, input_ids, max_new_tokens=4096,
+                         do_sample=True, temperature=0.7, top_p=0.9, top_k=None, past_key_values=None):
+    check_budget(constraint, max_new_tokens)
+    past = past_key_values
+    feed = input_ids[:, past.get_seq_length():] if past is not None else input_ids
+    out = []
+    while True:
+        forced = constraint.pop_forced()
+        out.extend(forced)
+        if constraint.done:
+            break
+        if forced:
+            feed = torch.cat([feed, torch.tensor([forced], device=feed.device)], dim=1)
+        if len(out) >= max_new_tokens - constraint.reserve - 1:
+            constraint.closing = True
+
+        res = model(input_ids=feed, past_key_values=past, use_cache=True)
+        past = res.past_key_values
+        logits = res.logits[0, -1].float()
+        logits[~constraint.allowed().to(logits.device)] = -float("inf")
+        t = _sample(logits, do_sample, temperature, top_p, top_k)
+        constraint.advance(t)
+        out.append(t)
+        feed = torch.tensor([[t]], device=input_ids.device)
+    return out, past
@@ -0,0 +1,99 @@
+import copy
+from collections import OrderedDict
+
+
+# LRU cache of past_key_values for static prompt prefixes (the system prompt after apply_chat_template).
+# entries are keyed by token IDs (not strings), so any two prompts rendering to the same tokens share one entry.
+# the cache is bounded both by number of entries and by total cached tokens.
+class PrefixCache:
+    def __init__(self, max_entries: int = 16, max_tokens: int = 32768):
+        self.max_entries = max_entries
+        self.max_tokens = max_tokens
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # (model id, prefix ids) -> past_key_values
+        self._tokens = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    # (private copy of the cached past_key_values for prefix_ids, hit) - computed on a miss.
+    # generate() extends the cache in place, so callers must never get the stored object itself.
+    def get(self, model, prefix_ids):
+        key = (id(model), tuple(int(i) for i in prefix_ids))
+        past = self._entries.get(key)
+        if past is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return copy.deepcopy(past), True
+
+        self.misses += 1
+        past = self._prefill(model, key[1])
+        if len(key[1]) <= self.max_tokens:
+            self._entries[key] = past
+            self._tokens += len(key[1])
+            self._evict()
+        return copy.deepcopy(past), False
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens = 0
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._tokens > self.max_tokens):
+            (_, ids), _ = self._entries.popitem(last=False)
+            self._tokens -= len(ids)
+
+    def _prefill(self, model, ids):
+        import torch
+        with torch.no_grad():
+            input_ids = torch.tensor([ids], device=model.device)
+            return model(input_ids=input_ids, use_cache=True).past_key_values
+
+
+# live KV cache of one agent role across debate rounds.
+# the prompt of a role is append-only between rounds (system prompt + growing 【HISTORY】 + new question block),
+# so the next call only has to prefill the tokens after the longest common prefix with the cached ids.
+# if the new prompt shares less than min_reuse tokens with the cached one, the cache is dropped.
+class ConversationCache:
+    def __init__(self, min_reuse: int = 1):
+        self.min_reuse = min_reuse
+        self.ids = []
+        self.past = None
+        self.reused_tokens = 0
+
+    # hand the cache to generate() for input_ids, cropped to the shared prefix; None if nothing can be reused.
+    # the cache is given away (generate extends it in place), call store() afterwards to keep it alive.
+    def take(self, input_ids, min_reuse: int = None):
+        min_reuse = self.min_reuse if min_reuse is None else max(min_reuse, self.min_reuse)
+        input_ids = [int(i) for i in input_ids]
+        n = 0
+        for a, b in zip(self.ids, input_ids):
+            if a != b:
+                break
+            n += 1
+        # generate needs at least one uncached token to produce the next logits
+        n = min(n, len(input_ids) - 1)
+
+        past = self.past
+        self.reset()
+        if past is None or n < min_reuse:
+            return None
+        try:
+            past.crop(n)
+        except (AttributeError, ValueError):
+            return None
+        self.reused_tokens += n
+        return past
+
+    # keep the cache returned by generate(); ids is the full sequence (prompt + new tokens)
+    def store(self, ids, past):
+        if past is None:
+            return self.reset()
+        n = past.get_seq_length()
+        self.ids = [int(i) for i in ids[:n]]
+        self.past = past
+
+    def reset(self):
+        self.ids = []
+        self.past = None
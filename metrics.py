@@ -0,0 +1,133 @@
+"""
+per-call metrics of a run (metrics.jsonl), summarised by role and by round (also printed at the end of a debate):
+python metrics.py runs/20250907/153000
+"""
+
+import argparse
+import json
+import resource
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from run_log import EventLog, read_events
+
+METRICS_FILE = "metrics.jsonl"
+SUMMARY_FILE = "metrics_summary.json"
+
+
+# every call gets its own metrics dict (params["metrics"]) for the backend to fill in, labelled with its role / round
+def attach(specs: list) -> tuple:
+    records = [{"ROLE": (opts or {}).get("role"), "ROUND": (opts or {}).get("round")} for _, _, opts in specs]
+    specs = [(system_prompt, user_prompt, {**(opts or {}), "metrics": rec})
+             for (system_prompt, user_prompt, opts), rec in zip(specs, records)]
+    return specs, records
+
+
+# the records of a step go to log once it is answered. WALL_S is the time of the whole step (shared by batched calls).
+def with_metrics(generate, log: EventLog):
+    def step(specs):
+        specs, records = attach(specs)
+        t0 = time.perf_counter()
+        responses = generate(specs)
+        wall = time.perf_counter() - t0
+        for rec in records:
+            log.append({**rec, "BATCH": len(specs), "WALL_S": wall})
+        return responses
+    return step
+
+
+def peak_host_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# times one generate call of model into rec (None: nothing is measured).
+# the first forward pass is the prefill, a forward hook notes when it ends; everything after it is decode.
+# device memory peaks are per call (CUDA only), the host peak is the process-wide peak RSS so far.
+@contextmanager
+def measure(model, rec: dict):
+    if rec is None:
+        yield
+        return
+    import torch
+    cuda = model.device.type == "cuda"
+    if cuda:
+        torch.cuda.reset_peak_memory_stats(model.device)
+    first = []
+    def hook(module, args, output):
+        if not first:
+            if cuda:
+                torch.cuda.synchronize(model.device)
+            first.append(time.perf_counter())
+    handle = model.register_forward_hook(hook)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        handle.remove()
+    if cuda:
+        torch.cuda.synchronize(model.device)
+    t1 = time.perf_counter()
+    t_first = first[0] if first else t1
+    rec["PREFILL_S"] = t_first - t0
+    rec["DECODE_S"] = t1 - t_first
+    rec["PEAK_DEVICE_MB"] = torch.cuda.max_memory_allocated(model.device) / 2 ** 20 if cuda else None
+    rec["PEAK_HOST_MB"] = peak_host_mb()
+
+
+# token counts of a measured call; the first new token comes out of the prefill, the rest are decode steps
+def count(rec: dict, prompt_tokens: int, new_tokens: int, cached_tokens: int = 0, cache: str = None):
+    if rec is None:
+        return
+    rec["PROMPT_TOKENS"] = prompt_tokens
+    rec["CACHED_TOKENS"] = cached_tokens
+    rec["NEW_TOKENS"] = new_tokens
+    rec["CACHE"] = cache
+    decode_s = rec.get("DECODE_S")
+    rec["TOKENS_PER_S"] = (new_tokens - 1) / decode_s if decode_s and new_tokens > 1 else None
+
+
+def rollup(records: list, key: str) -> dict:
+    table = {}
+    for rec in records:
+        row = table.setdefault(str(rec.get(key)), {"CALLS": 0, "PROMPT_TOKENS": 0, "NEW_TOKENS": 0, "PREFILL_S": 0.0,
+                                                   "DECODE_S": 0.0, "WALL_S": 0.0, "CACHE_HITS": 0})
+        row["CALLS"] += 1
+        for k in ("PROMPT_TOKENS", "NEW_TOKENS", "PREFILL_S", "DECODE_S"):
+            row[k] += rec.get(k) or 0
+        # batched calls share one step, count its wall time once per call share
+        row["WALL_S"] += (rec.get("WALL_S") or 0) / (rec.get("BATCH") or 1)
+        row["CACHE_HITS"] += rec.get("CACHE") is not None
+    for row in table.values():
+        row["TOKENS_PER_S"] = row["NEW_TOKENS"] / row["DECODE_S"] if row["DECODE_S"] else None
+    return table
+
+
+def format_table(title: str, table: dict) -> str:
+    cols = ("CALLS", "PROMPT_TOKENS", "NEW_TOKENS", "PREFILL_S", "DECODE_S", "WALL_S", "TOKENS_PER_S", "CACHE_HITS")
+    lines = [f"{title:<14}" + "".join(f"{c:>15}" for c in cols)]
+    for name, row in table.items():
+        cells = "".join(f"{row[c]:>15.2f}" if isinstance(row[c], float) else f"{str(row[c]):>15}" for c in cols)
+        lines.append(f"{name:<14}" + cells)
+    return "\n".join(lines)
+
+
+# metrics_summary.json (by role / by round) next to metrics.jsonl, returns the printable tables
+def write_summary(outdir: Path) -> str:
+    outdir = Path(outdir)
+    records = read_events(outdir / METRICS_FILE)
+    summary = {"BY_ROLE": rollup(records, "ROLE"), "BY_ROUND": rollup(records, "ROUND")}
+    with (outdir / SUMMARY_FILE).open("w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return format_table("ROLE", summary["BY_ROLE"]) + "\n\n" + format_table("ROUND", summary["BY_ROUND"])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("run_dir", type=str, help="run directory holding metrics.jsonl")
+    args = parser.parse_args()
+    print(write_summary(Path(args.run_dir)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import json
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+
+# Shared model loading for every script. torch / transformers are only imported inside load_model,
+# so importing this module (and `--help` of the scripts using it) costs nothing.
+# On CPU the safetensors files are memory-mapped and the weights point straight into the mapping
+# (copy-on-write), so sibling worker processes loading the same checkpoint share its page cache.
+# One tokenizer / model per (model name, quant) per process.
+
+_LOADED = {}
+# startup-time breakdown of every load_model call, in seconds: IMPORT_S / TOKENIZER_S / WEIGHTS_S / FIRST_TOKEN_S
+STARTUP = {}
+
+# safetensors header dtype -> torch dtype name
+SAFETENSORS_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+
+# local checkpoint directory of model_name: the name itself when it is a directory, otherwise the hub snapshot
+def checkpoint_dir(model_name: str) -> Path:
+    if Path(model_name).is_dir():
+        return Path(model_name)
+    from huggingface_hub import snapshot_download
+    return Path(snapshot_download(model_name, allow_patterns=["*.json", "*.safetensors", "*.txt", "*.model"]))
+
+
+def safetensors_files(ckpt: Path) -> list:
+    index = ckpt / "model.safetensors.index.json"
+    if index.exists():
+        with index.open(encoding="utf-8") as f:
+            return sorted({ckpt / name for name in json.load(f)["weight_map"].values()})
+    return sorted(ckpt.glob("*.safetensors"))
+
+
+# name -> tensor backed by a private (copy-on-write) mapping of path, nothing is read until a page is touched
+def mmap_safetensors(path: Path) -> dict:
+    import torch
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    (header_len,) = struct.unpack("<Q", mm[:8])
+    header = json.loads(mm[8:8 + header_len])
+    base = 8 + header_len
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = getattr(torch, SAFETENSORS_DTYPES[info["dtype"]])
+        start, end = info["data_offsets"]
+        count = (end - start) // torch.empty((), dtype=dtype).element_size()
+        if count == 0:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        tensors[name] = torch.frombuffer(mm, dtype=dtype, offset=base + start, count=count).reshape(info["shape"])
+    return tensors
+
+
+# the model skeleton without allocating weights, then the mapped tensors assigned in place of its parameters
+def load_mmap_model(ckpt: Path, dtype=None):
+    from accelerate import init_empty_weights
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    config = AutoConfig.from_pretrained(ckpt)
+    state = {}
+    for path in safetensors_files(ckpt):
+        state.update(mmap_safetensors(path))
+    if not state:
+        raise FileNotFoundError(f"no safetensors weights in {ckpt}")
+    with init_empty_weights(include_buffers=False):
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=next(iter(state.values())).dtype)
+    model.load_state_dict(state, strict=False, assign=True)
+    model.tie_weights()
+    missing = [name for name, p in model.named_parameters() if p.device.type == "meta"]
+    if missing:
+        raise ValueError(f"{ckpt}: weights missing from the checkpoint: {missing[:5]}")
+    if dtype is not None:
+        model = model.to(dtype)
+    try:
+        from transformers import GenerationConfig
+        model.generation_config = GenerationConfig.from_pretrained(ckpt)
+    except OSError:
+        pass
+    return model.eval()
+
+
+# (tokenizer, model) of model_name, loaded once per process.
+# quant: None or a CPU mode from quantize.py. On CPU (no CUDA, or a quant mode) the weights are mmap'd,
+# on GPU from_pretrained places them with device_map="auto".
+# warmup generates one token, so the first agent call does not pay for lazy initialisation.
+def load_model(model_name: str, quant: str = None, warmup: bool = True, verbose: bool = True):
+    key = (model_name, quant)
+    if key in _LOADED:
+        return _LOADED[key]
+
+    t0 = time.perf_counter()
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from quantize import apply_quant, load_kwargs
+    t_import = time.perf_counter()
+
+    tok = AutoTokenizer.from_pretrained(model_name)
+    t_tok = time.perf_counter()
+
+    mmapped = quant is not None or not torch.cuda.is_available()
+    if mmapped:
+        kwargs = load_kwargs(quant)
+        dtype = kwargs["torch_dtype"] if quant is not None else None
+        model = load_mmap_model(checkpoint_dir(model_name), dtype)
+    else:
+        model = AutoModelForCausalLM.from_pretrained(model_name, **load_kwargs(quant))
+    model = apply_quant(model, quant)
+    t_weights = time.perf_counter()
+
+    t_first = t_weights
+    if warmup:
+        inputs = tok(["Hi"], return_tensors="pt").to(model.device)
+        with torch.no_grad():
+            model.generate(**inputs, max_new_tokens=1, do_sample=False, pad_token_id=tok.pad_token_id or tok.eos_token_id)
+        t_first = time.perf_counter()
+
+    STARTUP[key] = {
+        "IMPORT_S": t_import - t0,
+        "TOKENIZER_S": t_tok - t_import,
+        "WEIGHTS_S": t_weights - t_tok,
+        "FIRST_TOKEN_S": (t_first - t_weights) if warmup else None,
+        "MMAP": mmapped,
+        "PID": os.getpid(),
+    }
+    if verbose:
+        s = STARTUP[key]
+        first = f", first token {s['FIRST_TOKEN_S']:.2f}s" if warmup else ""
+        print(f"[loader] {model_name}{f' ({quant})' if quant else ''}: import {s['IMPORT_S']:.2f}s, "
+              f"tokenizer {s['TOKENIZER_S']:.2f}s, weights {s['WEIGHTS_S']:.2f}s{' (mmap)' if mmapped else ''}{first}")
+    _LOADED[key] = (tok, model)
+    return tok, model
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+
+from history_compact import approx_tokens, compact_history
+
+# chat template tokens around the system + user messages and the generation prompt (Qwen: <|im_start|>role\n ... <|im_end|>\n)
+TEMPLATE_TOKENS = 16
+
+
+# memoized token counter: history segments are re-sent every round unchanged, so each one is tokenized once
+class TokenCounter:
+    def __init__(self, count_tokens=approx_tokens, max_entries: int = 4096):
+        self.count_tokens = count_tokens
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._counts = OrderedDict()
+
+    def __call__(self, text: str) -> int:
+        if not text:
+            return 0
+        n = self._counts.get(text)
+        if n is not None:
+            self.hits += 1
+            self._counts.move_to_end(text)
+            return n
+        self.misses += 1
+        n = self._counts[text] = self.count_tokens(text)
+        if len(self._counts) > self.max_entries:
+            self._counts.popitem(last=False)
+        return n
+
+
+# assembles every agent prompt as head + history block + tail under the role's token budget
+# (system + user message). the fixed parts are counted first, the history gets what is left:
+# compacted to fit when history_budget is set (history_compact.py), otherwise the oldest segments are dropped.
+# segments turns the history into text blocks, build can override it per call.
+# every call is reported as an event (ROUND, ROLE, PROMPT_TOKENS, BUDGET, HISTORY_TOKENS, DROPPED_SEGMENTS).
+class PromptBuilder:
+    def __init__(self, count_tokens, budgets: dict, segments, log=None, history_budget: int = None,
+                 default_budget: int = 32768):
+        self.count = count_tokens if isinstance(count_tokens, TokenCounter) else TokenCounter(count_tokens)
+        self.budgets = budgets
+        self.segments = segments
+        self.log = log
+        self.history_budget = history_budget
+        self.default_budget = default_budget
+
+    # history text within budget tokens, plus how many of its segments did not fit
+    def render_history(self, history: list, budget: int, segments=None):
+        if not history:
+            return "", 0
+        if self.history_budget is not None:
+            return compact_history(history, max(0, min(self.history_budget, budget)), self.count), 0
+        segments = (segments or self.segments)(history)
+        kept = []
+        used = 0
+        for seg in reversed(segments):
+            n = self.count(seg) + 1
+            if used + n > budget:
+                break
+            kept.append(seg)
+            used += n
+        kept.reverse()
+        return "\n\n".join(kept), len(segments) - len(kept)
+
+    def build(self, r: int, role: str, system_prompt, tail: str, history: list = None,
+              head: str = "", wrap: str = "【HISTORY】\n{}\n\n", segments=None) -> str:
+        budget = self.budgets.get(role, self.default_budget)
+        fixed = (TEMPLATE_TOKENS + self.count(system_prompt if isinstance(system_prompt, str) else "")
+                 + self.count(head) + self.count(tail))
+        hist, dropped = self.render_history(history, budget - fixed - self.count(wrap.format("")), segments)
+        hist_tokens = self.count(hist) + self.count(wrap.format("")) if hist else 0
+        prompt_tokens = fixed + hist_tokens
+
+        report = {"ROUND": r, "ROLE": role, "PROMPT_TOKENS": prompt_tokens, "BUDGET": budget,
+                  "HISTORY_TOKENS": hist_tokens, "DROPPED_SEGMENTS": dropped}
+        if self.log is not None:
+            self.log.append(report)
+        print(f"[{role}] prompt {prompt_tokens} / budget {budget} tokens"
+              + (f", {dropped} old history segments dropped" if dropped else ""))
+        return head + (wrap.format(hist) if hist else "") + tail
@@ -0,0 +1,57 @@
+# CPU execution modes of the HF backend (--quant):
+#   bf16: weights and activations in bfloat16, half the memory of float32, fast on CPUs with AVX512-BF16 / AMX
+#   int8: dynamic quantization of every nn.Linear, int8 weights with activations quantized per call,
+#         about a quarter of the float32 weight memory; embeddings and norms stay float32
+QUANT_MODES = ("int8", "bf16")
+
+
+# from_pretrained kwargs for a quant mode; None keeps the checkpoint dtype on whatever device_map picks
+def load_kwargs(quant: str = None) -> dict:
+    import torch
+    if quant is None:
+        return {"torch_dtype": "auto", "device_map": "auto"}
+    if quant == "bf16":
+        return {"torch_dtype": torch.bfloat16, "device_map": "cpu"}
+    if quant == "int8":
+        # dynamic quantization starts from float32 weights
+        return {"torch_dtype": torch.float32, "device_map": "cpu"}
+    raise ValueError(f"unknown quant mode: {quant}")
+
+
+# the loaded model in its quant mode, ready for generate()
+def apply_quant(model, quant: str = None):
+    import torch
+    if quant == "bf16":
+        model = model.to(torch.bfloat16)
+    elif quant == "int8":
+        # torch.ao eager-mode API; torchao's quantize_ is the successor once it is a dependency here
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model.eval()
+
+
+# quality check of a quant mode: greedy outputs of model against ref_model on the same chats.
+# a chat agrees up to the first token where the two greedy continuations differ.
+def greedy_agreement(tok, ref_model, model, chats: list, max_new_tokens: int = 64) -> dict:
+    rows = []
+    for chat in chats:
+        text = tok.apply_chat_template(chat, tokenize=False, add_generation_prompt=True)
+        inputs = tok([text], return_tensors="pt")
+        outs = []
+        for m in (ref_model, model):
+            ids = m.generate(**inputs.to(m.device), max_new_tokens=max_new_tokens, do_sample=False)
+            outs.append(ids[0, inputs.input_ids.shape[1]:].tolist())
+        ref, got = outs
+        same = 0
+        for a, b in zip(ref, got):
+            if a != b:
+                break
+            same += 1
+        rows.append({"REF_TOKENS": len(ref), "TOKENS": len(got), "AGREE_TOKENS": same,
+                     "EXACT": ref == got, "REF_TEXT": tok.decode(ref, skip_special_tokens=True),
+                     "TEXT": tok.decode(got, skip_special_tokens=True)})
+    return {
+        "CHATS": len(rows),
+        "EXACT_MATCHES": sum(r["EXACT"] for r in rows),
+        "PREFIX_AGREEMENT": sum(r["AGREE_TOKENS"] / max(r["REF_TOKENS"], 1) for r in rows) / max(len(rows), 1),
+        "ROWS": rows,
+    }
@@ -1,17 +1,12 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
-import torch
 import json
 import re
 
+from model_loader import load_model
+
 # 使用 Qwen3-4B-Thinking-2507
 model_name = "Qwen/Qwen3-4B-Thinking-2507"
 
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForCausalLM.from_pretrained(
-    model_name,
-    torch_dtype="auto",
-    device_map="auto"
-)
+tokenizer, model = load_model(model_name)
 
 # 訊息
 messages = [
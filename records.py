@@ -0,0 +1,82 @@
+import json
+
+ASK_FIELDS = {"style": "ASK_STYLE", "object": "ASK_OBJECT"}
+RESPONSE_FIELDS = {"style": "STYLE_RESPONSE", "object": "OBJECT_RESPONSE"}
+
+
+# the JSON object of an agent response, None if it does not parse
+def parse_json(text):
+    if not isinstance(text, str):
+        return None
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        obj = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+# one agent turn: the text as generated plus its JSON payload, parsed once (None for free text).
+# to_event / from_event is the only on-disk form (events.jsonl).
+class Turn:
+    __slots__ = ("round", "role", "track", "field", "text", "data")
+
+    def __init__(self, round: int, role: str, track: str, field: str, text: str):
+        self.round = round
+        self.role = role
+        self.track = track
+        self.field = field
+        self.text = text
+        self.data = parse_json(text)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default) if self.data is not None else default
+
+    def to_event(self) -> dict:
+        return {"ROUND": self.round, "ROLE": self.role, "TRACK": self.track, "FIELD": self.field, "TEXT": self.text}
+
+    @classmethod
+    def from_event(cls, e: dict):
+        return cls(e["ROUND"], e["ROLE"], e["TRACK"], e["FIELD"], e["TEXT"])
+
+
+# one history entry: what a track was asked in a round and what it answered
+class RoundRecord:
+    __slots__ = ("round", "track", "ask", "response")
+
+    def __init__(self, round: int, track: str, ask: Turn, response: Turn):
+        self.round = round
+        self.track = track
+        self.ask = ask
+        self.response = response
+
+    def turns(self) -> tuple:
+        return (self.ask, self.response)
+
+    # the history.json entry, e.g. {"ROUND": 2, "ASK_STYLE": ..., "STYLE_RESPONSE": ...}
+    def as_dict(self) -> dict:
+        return {"ROUND": self.round, self.ask.field: self.ask.text, self.response.field: self.response.text}
+
+
+# the round 1 questions come from the first-pass extractors, later ones from the ask agents
+def make_record(r: int, track: str, ask_text: str, response_text: str) -> RoundRecord:
+    ask_role = f"split_{track}" if r == 1 else f"ask_{track}"
+    return RoundRecord(r, track,
+                       Turn(r, ask_role, track, ASK_FIELDS[track], ask_text),
+                       Turn(r, track, track, RESPONSE_FIELDS[track], response_text))
+
+
+# history records back from events.jsonl, in call order; track keeps only that track
+def records_from_events(events: list, track: str = None) -> list:
+    turns = {}
+    for e in events:
+        if "FIELD" not in e or (track is not None and e["TRACK"] != track):
+            continue
+        turns.setdefault((e["ROUND"], e["TRACK"]), {})[e["FIELD"]] = Turn.from_event(e)
+    records = []
+    for (r, t), fields in turns.items():
+        if ASK_FIELDS[t] in fields and RESPONSE_FIELDS[t] in fields:
+            records.append(RoundRecord(r, t, fields[ASK_FIELDS[t]], fields[RESPONSE_FIELDS[t]]))
+    return records
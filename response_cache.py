@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from backends import Backend, per_chat_params
+
+# per-call options that do not change the answer text
+NON_KEY_PARAMS = ("conv_cache", "role", "round", "metrics", "assistant_model", "assist_config", "assist_stats")
+
+
+# content-addressed store of agent answers on disk: <root>/<key[:2]>/<key>.json.
+# files are written to a temp file and renamed into place, so processes sharing the directory
+# only ever see complete entries; a hit touches the file, eviction deletes the least recently used
+# entries (by mtime) until the directory is back under max_bytes. a file another process
+# evicted in between is simply a miss.
+# the size of the directory is kept as a running total: measured once here, grown by every put, and only
+# re-measured (a walk of the directory) when it goes over max_bytes, which also picks up other processes' entries.
+class ResponseCache:
+    def __init__(self, root, max_bytes: int = 1 << 30):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self.entries())
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str):
+        path = self.path(key)
+        try:
+            with path.open(encoding="utf-8") as f:
+                text = json.load(f)["TEXT"]
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return text
+
+    def put(self, key: str, text: str, meta: dict = None):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        blob = json.dumps({"TEXT": text, **(meta or {})}, ensure_ascii=False).encode("utf-8")
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        self.total_bytes += len(blob)
+
+    # (mtime, size, path) of every entry on disk
+    def entries(self) -> list:
+        entries = []
+        for path in self.root.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self.total_bytes = total
+
+
+# wraps any backend: answers of cacheable calls come from the ResponseCache, only the misses are generated.
+# the key hashes backend + model name, the chat as the backend renders it (chat template) and the sampling params.
+# greedy calls (do_sample=False or temperature 0) and calls with a fixed seed are cacheable;
+# other sampled calls only with sampled=True, they then replay the first answer ever drawn.
+class CachedBackend(Backend):
+    def __init__(self, backend: Backend, cache: ResponseCache, model_name: str, sampled: bool = False):
+        self.backend = backend
+        self.cache = cache
+        self.model_name = model_name
+        self.sampled = sampled
+        self.name = backend.name
+
+    def cacheable(self, params: dict) -> bool:
+        greedy = params.get("do_sample") is False or params.get("temperature") == 0
+        return greedy or params.get("seed") is not None or self.sampled
+
+    def key(self, chat: list, params: dict) -> str:
+        payload = {
+            "BACKEND": self.backend.name,
+            "MODEL": self.model_name,
+            "PROMPT": self.backend.render(chat),
+            "PARAMS": {k: v for k, v in params.items() if k not in NON_KEY_PARAMS},
+        }
+        blob = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def generate(self, chats: list, params=None) -> list:
+        params = per_chat_params(params, len(chats))
+        keys = [self.key(c, p) if self.cacheable(p) else None for c, p in zip(chats, params)]
+        results = [self.cache.get(k) if k is not None else None for k in keys]
+        for p, r in zip(params, results):
+            if r is not None and p.get("metrics") is not None:
+                p["metrics"]["CACHE"] = "response"
+
+        todo = [i for i, r in enumerate(results) if r is None]
+        if todo:
+            outs = self.backend.generate([chats[i] for i in todo], [params[i] for i in todo])
+            for i, text in zip(todo, outs):
+                results[i] = text
+                if keys[i] is not None:
+                    self.cache.put(keys[i], text, {"MODEL": self.model_name, "ROLE": params[i].get("role")})
+            self.cache.evict()
+        return results
+
+    def count_tokens(self, text: str) -> int:
+        return self.backend.count_tokens(text)
+
+    def render(self, chat: list) -> str:
+        return self.backend.render(chat)
+
+    def report(self) -> str:
+        return f"[cache] {self.cache.hits} hits, {self.cache.misses} misses ({self.cache.root})"
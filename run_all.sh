@@ -2,28 +2,18 @@
 set -u
 
 PY=python
-SCRIPT=debate_rounds_new_pipe.py
+# one JSON debate per line, see debate_batch.py
+PROMPTS=prompts.jsonl
+DEVICES=(0 2 4)   # 一張卡一個 worker；同一張卡可以重複列出（注意顯存），CPU 用 cpu:<threads>
+# opt-in: CACHE_DIR=.cache/responses serves re-runs of unchanged prompts from the response cache,
+# SEED=42 fixes the sampling seed (sampled calls are only cached with one)
+CACHE_ARGS=()
+[ -n "${CACHE_DIR:-}" ] && CACHE_ARGS+=(--cache-dir "$CACHE_DIR")
+[ -n "${SEED:-}" ] && CACHE_ARGS+=(--seed "$SEED")
 
-PROMPTS=(
-  "Fauvism, Miyazaki Hayao, a girl and a dragon in the cave"
-  "Impressionism, Ukiyo-e, a fox and a paper lantern on a misty bridge"
-  "Van Gogh, Studio Ghibli, a windmill and a bicycle under swirling stars"
-)
-ROUNDS=(3 3 3)
-OUTDIRS=(runs/1 runs/2 runs/3)
-GPUS=(0 2 4)   # 只有一張卡就全改成同一個值（注意顯存）
-
-mkdir -p runs/logs
-
-for i in "${!PROMPTS[@]}"; do
-  (
-    export CUDA_VISIBLE_DEVICES="${GPUS[$i]:-0}"
-    "$PY" "$SCRIPT" \
-      --prompt "${PROMPTS[$i]}" \
-      --rounds "${ROUNDS[$i]}" \
-      --outdir "${OUTDIRS[$i]}"
-  ) >"runs/logs/job_$i.log" 2>&1 &
-done
-
-wait
-echo "All jobs done."
+# each debate goes to whichever worker is free, crashed workers are restarted; logs in runs/logs/job_<run dir>.log
+"$PY" scheduler.py \
+  --requests "$PROMPTS" \
+  --devices "${DEVICES[@]}" \
+  --log-dir runs/logs \
+  ${CACHE_ARGS[@]+"${CACHE_ARGS[@]}"}
@@ -0,0 +1,71 @@
+"""
+rebuild the JSON views of a run from its event log (also done automatically at the end of a debate):
+python run_log.py runs/20250907/153000
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from records import records_from_events
+
+EVENTS_FILE = "events.jsonl"
+
+
+# append-only event log of one run, one JSON line per agent call.
+# records are buffered and written flush_every at a time, the file is never rewritten,
+# so writing a debate costs O(total output) and `tail -f` shows progress.
+class EventLog:
+    def __init__(self, path: Path, flush_every: int = 8):
+        self.path = Path(path)
+        self.flush_every = flush_every
+        self.buffer = []
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    # ROUND / ROLE / TEXT of one agent call (records.Turn.to_event); TRACK + FIELD place it in the history views
+    def append(self, record: dict):
+        self.buffer.append({"TIME": time.time(), **record})
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self.buffer))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+
+# a run killed mid-write can leave a partial last line, everything before it is still usable
+def read_events(path: Path) -> list:
+    events = []
+    with Path(path).open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return events
+
+
+# history.json / history_style.json / history_object.json, plain JSON that json.load reads back
+def write_views(outdir: Path):
+    outdir = Path(outdir)
+    events = read_events(outdir / EVENTS_FILE)
+    for name, track in (("history.json", None), ("history_style.json", "style"), ("history_object.json", "object")):
+        with (outdir / name).open("w", encoding="utf-8") as f:
+            json.dump([rec.as_dict() for rec in records_from_events(events, track)], f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("run_dir", type=str, help="run directory holding events.jsonl")
+    args = parser.parse_args()
+    write_views(Path(args.run_dir))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+one persistent worker per device (the model is loaded once per worker), every debate goes to whichever worker is free:
+python scheduler.py \
+  --requests prompts.jsonl \
+  --devices 0 2 4 \
+  --outdir runs
+
+CPU workers, N torch threads each:
+python scheduler.py --requests prompts.jsonl --devices cpu:8 cpu:8 --quant bf16
+
+same JSONL as debate_batch.py; each debate logs to <log dir>/job_<run dir>.log, e.g. job_runs_20250907_153000.log.
+a worker that crashes is restarted and its debate resumes from the run dir's state.json.
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import re
+import sys
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+
+from backends import BACKEND_NAMES, make_backend
+from checkpoint import STATE_FILE, DebateState
+from convergence import DRIFT_THRESHOLD
+from debate_batch import load_requests, unique_run_dir
+from debate_rounds_new_pipe import run_rounds
+from quantize import QUANT_MODES
+from response_cache import CachedBackend, ResponseCache
+from setting_new_pipe import (
+    MODEL_NAME,
+    SYS_MSG_STYLE, SYS_MSG_STY_ASK, SYS_MSG_OBJ_ASK,
+    USER_MSG_STY_ROUND, USER_MSG_STY_ASK_ROUND, USER_MSG_OBJ_ROUND, USER_MSG_OBJ_ASK_ROUND,
+)
+
+
+# "0" / "cuda:2" / "0,1" (one worker over both GPUs, device_map auto) or "cpu" / "cpu:8" (8 torch threads)
+def parse_device(spec: str) -> dict:
+    if spec == "cpu" or spec.startswith("cpu:"):
+        threads = int(spec.split(":", 1)[1]) if ":" in spec else None
+        return {"DEVICE": spec, "CUDA_VISIBLE_DEVICES": "", "THREADS": threads}
+    return {"DEVICE": spec, "CUDA_VISIBLE_DEVICES": spec.removeprefix("cuda:"), "THREADS": None}
+
+
+# job log named after the run dir, so runs sharing a --log-dir never write into each other's logs
+def job_log(log_dir, run_dir) -> Path:
+    name = re.sub(r"[^\w.-]+", "_", str(run_dir)).strip("_")
+    return Path(log_dir) / f"job_{name}.log"
+
+
+# fds 1 / 2 of this process go to path for the duration: catches prints, warnings and native library output alike.
+# mode "w" starts the file over, "a" appends (retries of a job, restarts of a worker)
+@contextmanager
+def redirect_fds(path: Path, mode: str = "a"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    with path.open(mode, encoding="utf-8") as f:
+        os.dup2(f.fileno(), 1)
+        os.dup2(f.fileno(), 2)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            for fd in saved:
+                os.close(fd)
+
+
+# the device is pinned through the environment before torch is imported (model_loader imports it lazily)
+def load_worker_backend(device: dict, opts: dict):
+    os.environ["CUDA_VISIBLE_DEVICES"] = device["CUDA_VISIBLE_DEVICES"]
+    if device["THREADS"]:
+        os.environ["OMP_NUM_THREADS"] = os.environ["MKL_NUM_THREADS"] = str(device["THREADS"])
+    backend = make_backend(opts["backend"], opts["model"], **({"quant": opts["quant"]} if opts["quant"] else {}))
+    if opts["cache_dir"]:
+        backend = CachedBackend(backend, ResponseCache(opts["cache_dir"], opts["cache_size_mb"] << 20),
+                                opts["model"], sampled=opts["cache_sampled"])
+    return backend
+
+
+# one debate; a run dir that already holds a state.json (earlier attempt) is resumed
+def run_job(backend, job: dict):
+    path = Path(job["RUN_DIR"]) / STATE_FILE
+    if path.exists():
+        state = DebateState.load(path)
+        print(f"[resume] {job['RUN_DIR']}: {len(state.steps)} saved steps")
+    else:
+        state = DebateState(path, job["CONFIG"])
+        state.save()
+    cfg = state.config
+    run_rounds(
+        None, None,
+        sys_sty=SYS_MSG_STYLE,
+        sys_ask_sty=SYS_MSG_STY_ASK,
+        sys_ask_obj=SYS_MSG_OBJ_ASK,
+        init_prompt=cfg["PROMPT"],
+        response_sty=USER_MSG_STY_ROUND,
+        response_ask_sty=USER_MSG_STY_ASK_ROUND,
+        response_obj=USER_MSG_OBJ_ROUND,
+        response_ask_obj=USER_MSG_OBJ_ASK_ROUND,
+        rounds=cfg["ROUNDS"],
+        outdir=Path(job["RUN_DIR"]),
+        independent_tracks=cfg["INDEPENDENT_TRACKS"],
+        constrained=cfg["CONSTRAINED"],
+        backend=backend,
+        history_budget=cfg["HISTORY_BUDGET"],
+        seed=cfg["SEED"],
+        state=state,
+        converge=cfg.get("CONVERGE")
+    )
+
+
+# worker process: load the backend once, then answer jobs until it gets None.
+# messages to the scheduler: ("ready", wid, load seconds) / ("done", wid, job id, seconds, error or None).
+# restart: 0 on the first start, whose log replaces the one of an earlier run
+def worker(wid: int, device: dict, opts: dict, jobs, results, restart: int = 0):
+    t0 = time.perf_counter()
+    with redirect_fds(Path(opts["log_dir"]) / f"worker_{wid}.log", "a" if restart else "w"):
+        if restart:
+            print(f"[worker {wid}] restart {restart}", flush=True)
+        print(f"[worker {wid}] device {device['DEVICE']}, pid {os.getpid()}", flush=True)
+        try:
+            backend = load_worker_backend(device, opts)
+        except Exception:
+            traceback.print_exc()
+            sys.exit(1)
+    results.put(("ready", wid, time.perf_counter() - t0))
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        t0 = time.perf_counter()
+        error = None
+        with redirect_fds(Path(job["LOG"]), "w" if job["ATTEMPT"] == 1 else "a"):
+            print(f"[job {job['ID']}] attempt {job['ATTEMPT']} on worker {wid} ({device['DEVICE']}): {job['CONFIG']['PROMPT']}",
+                  flush=True)
+            try:
+                run_job(backend, job)
+                print("Done.")
+            except Exception:
+                error = traceback.format_exc()
+                print(error)
+        results.put(("done", wid, job["ID"], time.perf_counter() - t0, error))
+
+
+class Scheduler:
+    def __init__(self, devices: list, opts: dict, retries: int = 2, max_restarts: int = 3):
+        self.ctx = mp.get_context("spawn")
+        self.devices = [parse_device(d) for d in devices]
+        self.opts = opts
+        self.retries = retries
+        self.max_restarts = max_restarts
+        self.results = self.ctx.Queue()
+        self.procs = {}
+        self.inboxes = {}
+        self.ready = set()
+        self.busy = {}
+        self.restarts = {wid: 0 for wid in range(len(self.devices))}
+
+    def start(self, wid: int):
+        self.inboxes[wid] = self.ctx.Queue()
+        p = self.ctx.Process(target=worker, args=(wid, self.devices[wid], self.opts, self.inboxes[wid], self.results,
+                                                  self.restarts[wid]), daemon=True)
+        p.start()
+        self.procs[wid] = p
+
+    # dead workers: their job goes back to the front of the queue (it resumes from its state.json), the worker restarts
+    def reap(self, pending: list, failed: dict):
+        for wid, p in list(self.procs.items()):
+            if p.is_alive():
+                continue
+            del self.procs[wid]
+            self.ready.discard(wid)
+            job = self.busy.pop(wid, None)
+            print(f"[scheduler] worker {wid} ({self.devices[wid]['DEVICE']}) exited with code {p.exitcode}"
+                  + (f" during job {job['ID']}" if job else f", see worker_{wid}.log"))
+            if job is not None:
+                self.retry(job, f"worker exited with code {p.exitcode}", pending, failed)
+            if self.restarts[wid] < self.max_restarts:
+                self.restarts[wid] += 1
+                print(f"[scheduler] restarting worker {wid} ({self.restarts[wid]}/{self.max_restarts})")
+                self.start(wid)
+
+    def retry(self, job: dict, error: str, pending: list, failed: dict):
+        if job["ATTEMPT"] <= self.retries:
+            pending.insert(0, {**job, "ATTEMPT": job["ATTEMPT"] + 1})
+        else:
+            failed[job["ID"]] = error
+
+    def run(self, jobs: list) -> dict:
+        pending = list(jobs)
+        done, failed = {}, {}
+        for wid in range(len(self.devices)):
+            self.start(wid)
+        try:
+            while pending or self.busy:
+                self.reap(pending, failed)
+                if not self.procs:
+                    print("[scheduler] no workers left")
+                    failed.update({job["ID"]: "no workers left" for job in pending})
+                    break
+                for wid in sorted(self.ready - set(self.busy)):
+                    if not pending:
+                        break
+                    job = pending.pop(0)
+                    self.busy[wid] = job
+                    self.inboxes[wid].put(job)
+                try:
+                    msg = self.results.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                if msg[0] == "ready":
+                    _, wid, load_s = msg
+                    self.ready.add(wid)
+                    print(f"[scheduler] worker {wid} ({self.devices[wid]['DEVICE']}) ready in {load_s:.1f}s")
+                    continue
+                _, wid, job_id, seconds, error = msg
+                job = self.busy.get(wid)
+                if job is None or job["ID"] != job_id:
+                    # sent just before its worker died, the job is already queued again
+                    continue
+                del self.busy[wid]
+                if error is None:
+                    done[job_id] = {"WORKER": wid, "DEVICE": self.devices[wid]["DEVICE"], "SECONDS": seconds,
+                                    "ATTEMPTS": job["ATTEMPT"], "RUN_DIR": job["RUN_DIR"]}
+                    print(f"[scheduler] job {job_id} done on worker {wid} in {seconds:.1f}s: {job['RUN_DIR']}")
+                else:
+                    print(f"[scheduler] job {job_id} failed on worker {wid} (attempt {job['ATTEMPT']}), "
+                          f"see {job['LOG']}")
+                    self.retry(job, error.strip().splitlines()[-1], pending, failed)
+        finally:
+            self.stop()
+        return {"DONE": done, "FAILED": failed}
+
+    def stop(self):
+        for wid, p in self.procs.items():
+            if p.is_alive():
+                self.inboxes[wid].put(None)
+        for p in self.procs.values():
+            p.join(timeout=30)
+            if p.is_alive():
+                p.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=str, required=True, help="JSONL, one debate per line (see debate_batch.py)")
+    parser.add_argument("--devices", type=str, nargs="+", default=["0"],
+                        help="one worker per entry: GPU index (0, cuda:2, 0,1) or cpu / cpu:<threads>; repeat a device for several workers")
+    parser.add_argument("--outdir", type=str, default="runs", help="輸出資料夾 (default for every debate)")
+    parser.add_argument("--log-dir", type=str, default="runs/logs", help="job_<run dir>.log / worker_<i>.log go here")
+    parser.add_argument("--rounds", type=int, default=3, help="debating rounds (default for every debate)")
+    parser.add_argument("--independent-tracks", action="store_true",
+                        help="style/object tracks only see their own history and run side by side as a batch")
+    parser.add_argument("--constrained", action="store_true",
+                        help="constrain the JSON agents to their schema, outputs always parse")
+    parser.add_argument("--history-budget", type=int, default=None,
+                        help="token budget of the HISTORY block; older rounds collapse into their CHANGES_SINCE_PREV (default: full history)")
+    parser.add_argument("--converge", type=float, nargs="?", const=DRIFT_THRESHOLD, default=None,
+                        help=f"stop a track once its brief / object list drifts less than this between rounds (default {DRIFT_THRESHOLD}), --rounds becomes the cap")
+    parser.add_argument("--backend", choices=BACKEND_NAMES, default="hf",
+                        help="generation engine: hf (transformers), vllm (offline engine, GPU or CPU build), stub (fake, for tests)")
+    parser.add_argument("--model", type=str, default=MODEL_NAME, help="checkpoint every worker loads")
+    parser.add_argument("--quant", choices=QUANT_MODES, default=None,
+                        help="CPU execution mode of the hf backend: int8 (dynamic int8 Linear layers) or bf16")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="fixed sampling seed for every agent call, makes sampled runs reproducible and cacheable")
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help="on-disk response cache shared by all workers (e.g. .cache/responses)")
+    parser.add_argument("--cache-size-mb", type=int, default=1024, help="size cap of --cache-dir, least recently used answers go first")
+    parser.add_argument("--cache-sampled", action="store_true",
+                        help="also cache sampled calls without --seed (replays the first answer drawn)")
+    parser.add_argument("--retries", type=int, default=2, help="extra attempts of a debate whose worker crashed or raised")
+    parser.add_argument("--max-restarts", type=int, default=3, help="restarts of each worker before its device is dropped")
+    args = parser.parse_args()
+
+    used = set()
+    jobs = []
+    for i, req in enumerate(load_requests(Path(args.requests), args.rounds, args.outdir)):
+        run_dir = unique_run_dir(req["outdir"], used)
+        config = {"PROMPT": req["prompt"], "ROUNDS": req["rounds"], "INDEPENDENT_TRACKS": args.independent_tracks,
+                  "CONSTRAINED": args.constrained, "HISTORY_BUDGET": args.history_budget, "SEED": args.seed,
+                  "CONVERGE": args.converge}
+        jobs.append({"ID": i, "RUN_DIR": str(run_dir), "LOG": str(job_log(args.log_dir, run_dir)), "CONFIG": config,
+                     "ATTEMPT": 1})
+        print(f"job {i} -> {run_dir}: {req['prompt']}")
+
+    opts = {"backend": args.backend, "model": args.model, "quant": args.quant, "log_dir": args.log_dir,
+            "cache_dir": args.cache_dir, "cache_size_mb": args.cache_size_mb, "cache_sampled": args.cache_sampled}
+    t0 = time.perf_counter()
+    result = Scheduler(args.devices, opts, retries=args.retries, max_restarts=args.max_restarts).run(jobs)
+    wall = time.perf_counter() - t0
+
+    print(f"[scheduler] {len(result['DONE'])}/{len(jobs)} debates in {wall:.1f}s on {len(args.devices)} workers")
+    for job_id, error in sorted(result["FAILED"].items()):
+        print(f"[scheduler] job {job_id} failed: {error}")
+    if result["FAILED"]:
+        sys.exit(1)
+    print("All jobs done.")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,20 @@
 # MODEL_NAME = "Qwen/Qwen3-4B-Thinking-2507"
 MODEL_NAME = "Qwen/Qwen3-4B-Instruct-2507"
 
+# JSON schemas for constrained decoding (--constrained), one per JSON agent, mirroring its REQUIRED OUTPUT.
+# only object / array / string / number / integer / enum are used; properties are emitted in the listed order.
+_STR = {"type": "string", "maxLength": 600}
+_STR_LIST = {"type": "array", "items": _STR, "maxItems": 6}
+_CONFIDENCE = {"type": "number"}
+
+# generation profile of each agent role (ROLE_PROFILES below), declared next to its prompt, the only place
+# generation settings come from: max_new_tokens caps the answer (and the KV cache a batched call reserves),
+# do_sample / temperature / top_p / top_k the sampling (greedy profiles carry no sampling keys), stop the stop strings,
+# thinking False closes the <think> span of thinking models up front (enable_thinking=False in the chat template).
+# JSON agents also stop once their object is closed. The style and object agent of each pair (ask / answer) share
+# one generation profile, so with --independent-tracks their calls still run as one batched generate call.
+# sampled JSON agents use Qwen3's recommended non-thinking settings (0.7 / 0.8 / 20), MODEL_NAME is the Instruct model.
+
 # system message that is used in the first round
 SYS_MSG_STYLE = """
 You are the STYLE Agent. Given a USER PROMPT about painting style(s) and optional HISTORY, produce a precise, operational style analysis. If multiple styles are present, propose a concrete merge and synthesize a unified brief. Output ENGLISH JSON ONLY. Do NOT include explanations, system text, reasoning, or <think>.
@@ -34,6 +48,18 @@ RULES
 - Ground claims in widely recognized features; avoid obscure inventions.
 """
 
+SCHEMA_STYLE = {"type": "object", "properties": {
+    "STYLE_BRIEF": {"type": "object", "properties": {
+        k: _STR for k in ("FORM_COMPOSITION", "COLOR_TONALITY", "BRUSHWORK_TECHNIQUE",
+                          "EXPRESSION_THEME", "HISTORICAL_CONTEXT")}},
+    "MERGE_STRATEGY": _STR,
+    "EVALUATION_CRITERIA": _STR_LIST,
+    "CONFIDENCE": _CONFIDENCE,
+}}
+
+# shared with PROFILE_OBJECT: a full brief is ~1k tokens, 4096 leaves room for an 8-12 item object list
+PROFILE_STYLE = {"max_new_tokens": 4096, "do_sample": True, "temperature": 0.7, "top_p": 0.8, "top_k": 20, "thinking": True}
+
 
 SYS_MSG_OBJECT = """
 You are the Object Agent. 
@@ -73,6 +99,21 @@ REQUIRED OUTPUT (JSON ONLY)
 - Never output chain-of-thought or hidden analysis.
 """
 
+SCHEMA_OBJECT = {"type": "object", "properties": {
+    "OBJECTS": {"type": "array", "minItems": 1, "maxItems": 12, "items": {"type": "object", "properties": {
+        "NAME": _STR,
+        "WHY": _STR,
+        "ATTRIBUTES": {"type": "object", "properties": {
+            k: _STR for k in ("FORM", "COLOR_PALETTE", "CONTEXT", "COMPOSITION_ROLE")}},
+        "ICONOGRAPHY": _STR,
+        "VARIANTS": {"type": "array", "items": _STR, "maxItems": 3},
+        "CONFIDENCE": _CONFIDENCE,
+    }}},
+    "OPEN_QUESTIONS": {"type": "array", "items": _STR, "maxItems": 3},
+}}
+
+PROFILE_OBJECT = PROFILE_STYLE
+
 SYS_MSG_STY_ASK = """
 You are the Asking Agent. 
 After reading the latest RESPONSE from either the STYLE Agent or the OBJECT Agent (and optional HISTORY + USER PROMPT), your goal is to surface missing details, edge cases, ambiguities, and alternate angles. 
@@ -122,6 +163,29 @@ RULES
 
 """
 
+def _ask_schema(dimensions):
+    return {"type": "object", "properties": {
+        "QUESTIONS": {"type": "array", "minItems": 1, "maxItems": 5, "items": {"type": "object", "properties": {
+            "Q": _STR,
+            "DIMENSION": {"enum": list(dimensions)},
+            "WHY": _STR,
+            "PRIORITY": {"enum": [1, 2, 3]},
+            "ANSWER_FORMAT": _STR,
+            "DEPENDENCIES": {"type": "array", "items": _STR, "maxItems": 4},
+        }}},
+        "COUNT": {"type": "integer"},
+        "NEGATIVE_CHECKS": _STR_LIST,
+        "FOLLOWUP_TRIGGERS": _STR_LIST,
+    }}
+
+SCHEMA_STY_ASK = _ask_schema((
+    "FORM_COMPOSITION", "COLOR_TONALITY", "BRUSHWORK_TECHNIQUE", "EXPRESSION_THEME", "HISTORICAL_CONTEXT",
+    "SUBJECT_MATTER", "COMPOSITIONAL_DEVICES", "LIGHTING_CAMERA", "NEGATIVE_CONSTRAINTS", "EVALUATION_CRITERIA",
+))
+
+# at most 5 questions; shared with PROFILE_ASK_OBJECT
+PROFILE_ASK_STYLE = {"max_new_tokens": 2048, "do_sample": True, "temperature": 0.7, "top_p": 0.8, "top_k": 20, "thinking": False}
+
 SYS_MSG_OBJ_ASK = """
 You are the Asking Agent.
 After reading the latest RESPONSE from the OBJECT Agent (and optional HISTORY + USER PROMPT), your goal is to uncover missing objects, finer attributes, edge cases, ambiguities, and alternate angles specific to objects typical of the target style(s).
@@ -177,6 +241,13 @@ RULES
 - When uncertain, add a NEGATIVE_CHECK or FOLLOWUP_TRIGGER rather than guessing.
 """
 
+SCHEMA_OBJ_ASK = _ask_schema((
+    "FORM", "MATERIAL", "COLOR_PALETTE", "SCALE_POSE", "TEXTURE", "LIGHTING", "CONTEXT",
+    "COMPOSITION_ROLE", "CAMERA", "ICONOGRAPHY", "VARIANTS", "CONSTRAINTS", "NEGATIVE_OBJECTS", "COVERAGE_GAPS",
+))
+
+PROFILE_ASK_OBJECT = PROFILE_ASK_STYLE
+
 # message that is used from second rounds
 USER_MSG_STY_ROUND = """
 You will revise and extend the STYLE analysis using: 
@@ -215,6 +286,21 @@ RULES
 - Keep outputs terse but complete. No chain-of-thought. JSON only.
 """
 
+SCHEMA_STY_ROUND = {"type": "object", "properties": {
+    "ANSWER_ASK": {"type": "array", "maxItems": 5, "items": {"type": "object", "properties": {
+        "INDEX": {"type": "integer"},
+        "DIMENSION": _STR,
+        "ANSWER": _STR,
+        "RATIONALE": _STR,
+        "CONFIDENCE": _CONFIDENCE,
+    }}},
+    "UPDATE_STYLE_BRIEF": {"type": "object", "properties": {
+        k: _STR for k in ("FORM_COMPOSITION", "COLOR_TONALITY", "EXPRESSION_THEME", "HISTORICAL_CONTEXT",
+                          "SUBJECT_MATTER", "COMPOSITIONAL_DEVICES", "EVALUATION_CRITERIA")}},
+    "PROMPT_SNIPPET": _STR,
+    "CHANGES_SINCE_PREV": _STR_LIST,
+}}
+
 USER_MSG_OBJ_ROUND = """
 You will revise and extend the OBJECT list using: 
 (1) the initial USER PROMPT, 
@@ -260,6 +346,25 @@ RULES
 - JSON only. English only. No chain-of-thought.
 """
 
+SCHEMA_OBJ_ROUND = {"type": "object", "properties": {
+    "ANSWER_ASK": {"type": "array", "maxItems": 5, "items": {"type": "object", "properties": {
+        "INDEX": {"type": "integer"},
+        "ANSWER": _STR,
+        "CONFIDENCE": _CONFIDENCE,
+    }}},
+    "UPDATE_OBJECTS": {"type": "array", "minItems": 1, "maxItems": 12, "items": {"type": "object", "properties": {
+        "NAME": _STR,
+        "WHY": _STR,
+        "ATTRIBUTES": {"type": "object", "properties": {
+            k: _STR for k in ("FORM", "COLOR_PALETTE", "SCALE_POSE", "CONTEXT", "COMPOSITION_ROLE")}},
+        "ICONOGRAPHY": _STR,
+        "VARIANTS": {"type": "array", "items": _STR, "maxItems": 3},
+        "CONFIDENCE": _CONFIDENCE,
+    }}},
+    "PROMPT_SNIPPETS": {"type": "array", "items": _STR, "maxItems": 12},
+    "UPDATE_PROMPT": _STR,
+}}
+
 USER_MSG_STY_ASK_ROUND=SYS_MSG_STY_ASK
 USER_MSG_OBJ_ASK_ROUND=SYS_MSG_OBJ_ASK
 
@@ -305,6 +410,9 @@ Use simple, everyday words; avoid complex terms or jargon.
 End the sentence with the exact token END_OF_PROMPT and nothing after it.
 """
 
+# one line of at most 60 words ending in END_OF_PROMPT
+PROFILE_FINAL_STYLE = {"max_new_tokens": 192, "do_sample": True, "temperature": 0.5, "top_p": 0.9, "stop": ["END_OF_PROMPT"], "thinking": False}
+
 SYS_MSG_FINAL_OBJECT = """
 You are the FINAL-OBJECT prompt writer.
 
@@ -343,6 +451,8 @@ SELF-CHECK (must pass before output)
 Write one clear, meaningful sentence of at most 50 words. 
 """
 
+PROFILE_FINAL_OBJECT = {"max_new_tokens": 192, "do_sample": True, "temperature": 0.5, "top_p": 0.9, "stop": ["END_OF_PROMPT"], "thinking": False}
+
 
 SYS_MSG_STY_ASK_FIRST = """
 You are the FIRST-PASS STYLE extractor.
@@ -363,6 +473,9 @@ OUTPUT
 
 """
 
+# one line of at most 50 words, extracted greedily
+PROFILE_SPLIT_STYLE = {"max_new_tokens": 192, "do_sample": False, "thinking": False}
+
 SYS_MSG_OBJ_ASK_FIRST = """
 You are the FIRST-PASS OBJECT & ENVIRONMENT extractor.
 
@@ -385,3 +498,49 @@ OUTPUT
 - If nothing concrete exists, return “(no objects)”.
 """
 
+PROFILE_SPLIT_OBJECT = {"max_new_tokens": 192, "do_sample": False, "thinking": False}
+
+
+# prompt token budget per agent role (system + user message after the chat template).
+# the prompt builder drops the oldest HISTORY segments (or compacts them, --history-budget) to stay within it.
+PROMPT_BUDGETS = {
+    "split_style": 4096,
+    "split_object": 4096,
+    "ask_style": 16384,
+    "ask_object": 16384,
+    "style": 16384,
+    "object": 16384,
+    "final_style": 16384,
+    "final_object": 16384,
+}
+
+# generation profile per agent role (PROFILE_* next to each prompt), applied to every call of the role
+ROLE_PROFILES = {
+    "split_style": PROFILE_SPLIT_STYLE,
+    "split_object": PROFILE_SPLIT_OBJECT,
+    "ask_style": PROFILE_ASK_STYLE,
+    "ask_object": PROFILE_ASK_OBJECT,
+    "style": PROFILE_STYLE,
+    "object": PROFILE_OBJECT,
+    "final_style": PROFILE_FINAL_STYLE,
+    "final_object": PROFILE_FINAL_OBJECT,
+}
+
+# calls without a role (run_agent of the older scripts, clients of inference_server.py that send no role)
+PROFILE_DEFAULT = {"max_new_tokens": 4096, "do_sample": True, "temperature": 0.7, "top_p": 0.9}
+
+# assisted (speculative) decoding with --assisted: a small draft model sharing the tokenizer proposes tokens,
+# the main model verifies several of them per forward pass. greedy outputs are unchanged.
+DRAFT_MODEL_NAME = "Qwen/Qwen3-0.6B"
+# per agent role: None decodes without the draft, otherwise the draft settings for that role
+# (num_assistant_tokens / num_assistant_tokens_schedule / assistant_confidence_threshold)
+ASSISTED_ROLES = {
+    "split_style": None,
+    "split_object": None,
+    "ask_style": {"num_assistant_tokens": 8, "num_assistant_tokens_schedule": "heuristic"},
+    "ask_object": {"num_assistant_tokens": 8, "num_assistant_tokens_schedule": "heuristic"},
+    "style": {"num_assistant_tokens": 8, "num_assistant_tokens_schedule": "heuristic"},
+    "object": {"num_assistant_tokens": 8, "num_assistant_tokens_schedule": "heuristic"},
+    "final_style": {"num_assistant_tokens": 5, "num_assistant_tokens_schedule": "heuristic"},
+    "final_object": {"num_assistant_tokens": 5, "num_assistant_tokens_schedule": "heuristic"},
+}
@@ -0,0 +1,97 @@
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+from think import think_ids
+
+
+# tracks {...} nesting of generated text, ignoring braces inside JSON strings
+class JsonScanner:
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escape = False
+
+    # feed more text, returns True once the top-level object is closed
+    def feed(self, text: str) -> bool:
+        for ch in text:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = self.started
+            elif ch == "{":
+                self.depth += 1
+                self.started = True
+            elif ch == "}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
+# per-sequence stop conditions for one (possibly batched) generate call.
+# every row has its own stop strings and its own "stop when the top-level JSON object is balanced" flag;
+# rows that are still thinking (prompt ends inside <think>) are only checked after </think>.
+class AgentStoppingCriteria(StoppingCriteria):
+    def __init__(self, tok, prompt_len: int, stop_strings: list, stop_json: list, thinking: list = None):
+        self.tok = tok
+        self.prompt_len = prompt_len
+        self.stop_strings = [list(s or []) for s in stop_strings]
+        self.stop_json = list(stop_json)
+        self.think_end_id = think_ids(tok)[1]
+        n = len(self.stop_json)
+        self.thinking = list(thinking) if thinking is not None else [False] * n
+        # a stop string of k characters never spans more than k tokens
+        self.window = [max((len(s) for s in ss), default=0) + 1 for ss in self.stop_strings]
+        self.scanners = [JsonScanner() for _ in range(n)]
+        self.answer_start = [prompt_len] * n
+        self.seen = [prompt_len] * n
+        self.done = [False] * n
+
+    def __call__(self, input_ids, scores, **kwargs):
+        for i, row in enumerate(input_ids):
+            if self.done[i]:
+                continue
+            new = row[self.seen[i]:].tolist()
+            self.seen[i] = len(row)
+
+            if self.thinking[i]:
+                if self.think_end_id not in new:
+                    continue
+                self.thinking[i] = False
+                self.answer_start[i] = len(row) - len(new) + new.index(self.think_end_id) + 1
+                new = row[self.answer_start[i]:].tolist()
+
+            if self.stop_json[i]:
+                for t in new:
+                    if self.scanners[i].feed(self.tok.decode([t], skip_special_tokens=True)):
+                        self.done[i] = True
+                        break
+
+            if not self.done[i] and self.stop_strings[i]:
+                start = max(self.answer_start[i], len(row) - self.window[i])
+                tail = self.tok.decode(row[start:], skip_special_tokens=True)
+                self.done[i] = any(s in tail for s in self.stop_strings[i])
+
+        return torch.tensor(self.done, dtype=torch.bool, device=input_ids.device)
+
+
+# build the stopping_criteria / eos_token_id generate kwargs for a batch of calls, {} when nothing is configured.
+# EOS always stops a row: the tokenizer eos is added next to the model's own generation_config eos ids.
+def build_stopping(tok, model, prompt_len: int, stop_strings: list, stop_json: list, thinking: list = None):
+    kwargs = {}
+    eos = model.generation_config.eos_token_id
+    eos = list(eos) if isinstance(eos, (list, tuple)) else ([eos] if eos is not None else [])
+    if tok.eos_token_id is not None and tok.eos_token_id not in eos:
+        kwargs["eos_token_id"] = eos + [tok.eos_token_id]
+
+    if any(stop_strings) or any(stop_json):
+        kwargs["stopping_criteria"] = StoppingCriteriaList([
+            AgentStoppingCriteria(tok, prompt_len, stop_strings, stop_json, thinking)
+        ])
+    return kwargs
@@ -0,0 +1,39 @@
+import queue
+
+import torch
+from transformers import StoppingCriteria
+from transformers.generation.streamers import BaseStreamer
+
+
+# token iterator for a generate() call running in another thread: put() receives the new ids of every step,
+# iterating yields them as python lists until generate ends. the first put() is the prompt and is skipped.
+class TokenStreamer(BaseStreamer):
+    def __init__(self, timeout: float = None):
+        self.queue = queue.Queue()
+        self.timeout = timeout
+        self.prompt_seen = False
+
+    def put(self, value):
+        if not self.prompt_seen:
+            self.prompt_seen = True
+            return
+        self.queue.put(value.reshape(-1).tolist())
+
+    def end(self):
+        self.queue.put(None)
+
+    def __iter__(self):
+        while True:
+            ids = self.queue.get(timeout=self.timeout)
+            if ids is None:
+                return
+            yield ids
+
+
+# lets the caller stop a running generate() from outside: set the event and every row stops at the next step
+class EventStop(StoppingCriteria):
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
@@ -1,14 +1,9 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from model_loader import load_model
 
 model_name = "Qwen/Qwen3-4B-Thinking-2507"
 
 # load the tokenizer and the model
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForCausalLM.from_pretrained(
-    model_name,
-    torch_dtype="auto",
-    device_map="auto"
-)
+tokenizer, model = load_model(model_name)
 
 # prepare the model input
 prompt = "Please define the meaning of \"style\" in art."
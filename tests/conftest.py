@@ -0,0 +1,10 @@
+import pytest
+
+
+# tiny random Qwen3 of the benchmark (bench/tiny_qwen3.py), built once per test session
+@pytest.fixture(scope="session")
+def tiny():
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    from bench.tiny_qwen3 import build_tiny
+    return build_tiny()
@@ -0,0 +1,36 @@
+import pytest
+
+from bench.quality import quality_chats
+
+ROLES = {"style": {"num_assistant_tokens": 4, "num_assistant_tokens_schedule": "constant"}}
+
+
+@pytest.fixture(scope="module")
+def pair():
+    pytest.importorskip("transformers")
+    from bench.tiny_qwen3 import build_pair
+    return build_pair(layers=3, draft_layers=1)
+
+
+def test_greedy_outputs_match_without_draft(pair):
+    from debate_rounds_new_pipe import HFBackend
+    tok, model, draft = pair
+    params = [{"role": "style", "max_new_tokens": 32, "do_sample": False}]
+    plain = HFBackend(tok, model, assisted_roles=ROLES)
+    assisted = HFBackend(tok, model, draft=draft, assisted_roles=ROLES)
+    for chat in quality_chats():
+        assert assisted.generate([chat], params) == plain.generate([chat], params)
+
+    stats = assisted.assist_stats.summary()["style"]
+    assert stats["CALLS"] == len(quality_chats())
+    assert stats["DRAFTED"] > 0 and 0 < stats["ACCEPTANCE_RATE"] <= 1
+    assert plain.assist_stats.summary() == {}
+
+
+def test_roles_without_config_and_constrained_calls_skip_the_draft(pair):
+    from debate_rounds_new_pipe import HFBackend
+    tok, model, draft = pair
+    backend = HFBackend(tok, model, draft=draft, assisted_roles=ROLES)
+    assert "assistant_model" not in backend.assisted_params({"role": "split_style"})
+    assert "assistant_model" not in backend.assisted_params({"role": "style", "schema": {"type": "object"}})
+    assert backend.assisted_params({"role": "style"})["assistant_model"] is draft
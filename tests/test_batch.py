@@ -0,0 +1,13 @@
+from setting_new_pipe import SYS_MSG_OBJ_ASK_FIRST, SYS_MSG_STY_ASK_FIRST
+
+
+def test_batch_matches_sequential_greedy(tiny):
+    from debate_rounds_new_pipe import run_agent, run_agents_batch
+    tok, model = tiny
+    params = {"max_new_tokens": 16, "do_sample": False}
+    # prompts of different lengths, so the shorter rows are left-padded
+    specs = [(SYS_MSG_STY_ASK_FIRST, "a girl and a dragon", params),
+             (SYS_MSG_OBJ_ASK_FIRST, "Fauvism, Miyazaki Hayao, a girl and a dragon in a cave lit by fire", params),
+             (SYS_MSG_STY_ASK_FIRST, "a fox on a bridge at dawn, ukiyo-e", params)]
+    sequential = [run_agent(tok, model, system_prompt, user_prompt, **p) for system_prompt, user_prompt, p in specs]
+    assert run_agents_batch(tok, model, specs) == sequential
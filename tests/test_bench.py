@@ -0,0 +1,29 @@
+from backends import build_messages
+
+
+def test_greedy_bench_calls_carry_no_sampling_keys(tiny, monkeypatch):
+    from bench.case import BenchBackend
+    tok, model = tiny
+    seen = []
+    generate = model.generate
+    monkeypatch.setattr(model, "generate", lambda *args, **kwargs: seen.append(kwargs) or generate(*args, **kwargs))
+
+    backend = BenchBackend(tok, model, 8)
+    chats = [build_messages("system", "a girl and a dragon"), build_messages("system", "a fox on a bridge")]
+    # one call alone (run_chat) and two batched (generate_chats), both with the profile's sampling keys
+    backend.generate(chats[:1], {"temperature": 0.7, "top_p": 0.9})
+    backend.generate(chats, {"temperature": 0.7, "top_p": 0.9})
+    assert len(seen) == 2
+    for kwargs in seen:
+        assert kwargs["do_sample"] is False and kwargs["max_new_tokens"] == 8
+        assert "temperature" not in kwargs and "top_p" not in kwargs
+
+
+def test_constrained_cap_covers_every_schema(tiny):
+    from bench.__main__ import constrained_min_tokens
+    from json_constrained import JsonSchemaConstraint, min_tokens
+    from setting_new_pipe import SCHEMA_OBJ_ROUND, SCHEMA_STYLE
+    tok, model = tiny
+    need = constrained_min_tokens(tok, model.config.vocab_size)
+    for schema in (SCHEMA_STYLE, SCHEMA_OBJ_ROUND):
+        assert min_tokens(JsonSchemaConstraint(tok, schema, model.config.vocab_size)) <= need
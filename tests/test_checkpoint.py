@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from backends import StubBackend
+from checkpoint import STATE_FILE, STEPS_FILE, DebateState, spec_key, write_json_atomic
+from debate_rounds_new_pipe import run_rounds
+
+
+class CrashingBackend(StubBackend):
+    def __init__(self, crash_after: int = None):
+        self.crash_after = crash_after
+        self.calls = 0
+
+    def generate(self, chats, params=None):
+        if self.crash_after is not None and self.calls + len(chats) > self.crash_after:
+            raise RuntimeError("worker died")
+        self.calls += len(chats)
+        return super().generate(chats, params)
+
+
+def debate(outdir, backend, state=None, independent_tracks=False):
+    return run_rounds(None, None, "", "", "", "", "", "", "", init_prompt="a girl and a dragon in the cave",
+                      rounds=3, outdir=outdir, backend=backend, state=state, constrained=True,
+                      independent_tracks=independent_tracks)
+
+
+def run_files(outdir):
+    return {name: (outdir / name).read_text(encoding="utf-8")
+            for name in ("history.json", "final_style_prompt.json", "final_object_prompt.json")}
+
+
+@pytest.mark.parametrize("independent_tracks", [False, True])
+def test_resume_after_crash_matches_clean_run(tmp_path, independent_tracks):
+    clean_dir, crash_dir = tmp_path / "clean", tmp_path / "crash"
+    clean = CrashingBackend()
+    debate(clean_dir, clean, DebateState(clean_dir / STATE_FILE, {}), independent_tracks)
+
+    with pytest.raises(RuntimeError):
+        debate(crash_dir, CrashingBackend(crash_after=7), DebateState(crash_dir / STATE_FILE, {}), independent_tracks)
+    state = DebateState.load(crash_dir / STATE_FILE)
+    saved_calls = sum(len(step["KEYS"]) for step in state.steps)
+    assert 0 < saved_calls <= 7
+
+    resumed = CrashingBackend()
+    debate(crash_dir, resumed, state, independent_tracks)
+    assert state.replayed > 0
+    assert resumed.calls == clean.calls - saved_calls
+    assert run_files(crash_dir) == run_files(clean_dir)
+
+
+def test_replay_stops_at_the_first_changed_step(tmp_path):
+    state = DebateState(tmp_path / STATE_FILE, {})
+    generated = []
+    step = state.wrap(lambda specs: generated.extend(specs) or [f"answer {s[1]}" for s in specs])
+    step([("sys", "a", {"role": "split_style"})])
+    step([("sys", "b", {"role": "style"})])
+
+    state = DebateState.load(tmp_path / STATE_FILE)
+    generated.clear()
+    step = state.wrap(lambda specs: generated.extend(specs) or ["new"] * len(specs))
+    assert step([("sys", "a", {"role": "split_style", "conv_cache": object()})]) == ["answer a"]
+    assert step([("sys", "changed", {"role": "style"})]) == ["new"]
+    assert len(state.steps) == 2 and state.replayed == 1
+    assert state.steps[1]["KEYS"] == [spec_key(("sys", "changed", {"role": "style"}))]
+
+
+def test_atomic_write_keeps_old_file_on_error(tmp_path):
+    path = tmp_path / STATE_FILE
+    write_json_atomic(path, {"STEPS": [1]})
+    with pytest.raises(TypeError):
+        write_json_atomic(path, {"STEPS": [object()]})
+    assert json.loads(path.read_text(encoding="utf-8")) == {"STEPS": [1]}
+    assert [p.name for p in tmp_path.iterdir()] == [STATE_FILE]
+
+
+def test_steps_are_appended_not_rewritten(tmp_path):
+    state = DebateState(tmp_path / STATE_FILE, {"PROMPT": "p"})
+    state.save()
+    step = state.wrap(lambda specs: [f"answer {s[1]}" for s in specs])
+    step([("sys", "a", {"role": "split_style"})])
+    config = (tmp_path / STATE_FILE).stat().st_mtime_ns
+    step([("sys", "b", {"role": "style"})])
+    assert (tmp_path / STATE_FILE).stat().st_mtime_ns == config
+    assert len((tmp_path / STEPS_FILE).read_text(encoding="utf-8").splitlines()) == 2
+
+    # a crash in the middle of a line: the step is lost, the next one is appended cleanly
+    with (tmp_path / STEPS_FILE).open("a", encoding="utf-8") as f:
+        f.write('{"KEYS": ["cut')
+    state = DebateState.load(tmp_path / STATE_FILE)
+    assert len(state.steps) == 2 and state.config == {"PROMPT": "p"}
+    step = state.wrap(lambda specs: ["c"])
+    for user, role in (("a", "split_style"), ("b", "style"), ("c", "object")):
+        step([("sys", user, {"role": role})])
+    assert state.replayed == 2
+    assert len(DebateState.load(tmp_path / STATE_FILE).steps) == 3
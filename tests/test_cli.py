@@ -0,0 +1,28 @@
+import sys
+
+import pytest
+
+
+@pytest.mark.parametrize("flags", [
+    ["--stream", "--server", "http://127.0.0.1:8765"], ["--stream", "--backend", "stub"],
+    ["--assisted", "--backend", "stub"], ["--stream", "--assisted"],
+    ["--server", "http://127.0.0.1:8765", "--quant", "int8"], ["--server", "http://127.0.0.1:8765", "--backend", "stub"],
+])
+def test_conflicting_flags_are_rejected(flags, monkeypatch, capsys, tmp_path):
+    from debate_rounds_new_pipe import main
+    monkeypatch.setattr(sys, "argv", ["debate_rounds_new_pipe.py", "--prompt", "a girl and a dragon",
+                                      "--outdir", str(tmp_path), *flags])
+    with pytest.raises(SystemExit):
+        main()
+    assert flags[0] in capsys.readouterr().err
+    # rejected before a run dir is made
+    assert not any(tmp_path.iterdir())
+
+
+def test_batch_rejects_quant_with_server(monkeypatch, capsys, tmp_path):
+    from debate_batch import main
+    monkeypatch.setattr(sys, "argv", ["debate_batch.py", "--requests", str(tmp_path / "prompts.jsonl"),
+                                      "--server", "http://127.0.0.1:8765", "--quant", "bf16"])
+    with pytest.raises(SystemExit):
+        main()
+    assert "--server" in capsys.readouterr().err
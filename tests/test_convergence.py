@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from convergence import converged, drift, track_change
+from debate_rounds_new_pipe import debate_steps, drive
+from records import make_record
+from run_log import EVENTS_FILE, read_events
+
+
+def style(r, brief, changes):
+    return make_record(r, "style", "q", json.dumps({"UPDATE_STYLE_BRIEF": brief, "CHANGES_SINCE_PREV": changes,
+                                                    "NOTES": f"reasoning of round {r}"}))
+
+
+def test_drift():
+    assert drift("Thick brushwork, warm palette", "warm palette thick BRUSHWORK") == 0.0
+    assert drift("thick brushwork", "flat pastel") == 1.0
+    assert drift("", "") == 0.0
+    assert drift("a b c", "a b d") == pytest.approx(0.5)
+
+
+def test_track_change_compares_parsed_state():
+    # NOTES differ every round, only the brief counts
+    change = track_change(style(2, "warm palette", ["a"]), style(3, "warm palette", ["a", "b"]))
+    assert change == {"DRIFT": 0.0, "CHANGES": 2}
+    obj = track_change(make_record(2, "object", "q", '{"UPDATE_OBJECTS": ["dragon", "cave"]}'),
+                       make_record(3, "object", "q", "not json at all"))
+    assert obj["CHANGES"] is None and obj["DRIFT"] == 1.0
+
+
+def test_converged():
+    assert converged({"DRIFT": 0.1, "CHANGES": 2})
+    assert converged({"DRIFT": 0.1, "CHANGES": None})
+    assert not converged({"DRIFT": 0.1, "CHANGES": 3})
+    assert not converged({"DRIFT": 0.15, "CHANGES": 0})
+    assert converged({"DRIFT": 0.3, "CHANGES": 0}, threshold=0.5)
+
+
+# the style brief settles after round 2, the object list keeps moving (or settles too)
+def answer(opts, object_settles):
+    role, r = opts["role"], opts["round"]
+    if role == "style":
+        return json.dumps({"UPDATE_STYLE_BRIEF": "thick brushwork, warm palette", "CHANGES_SINCE_PREV": []})
+    if role == "object":
+        n = 1 if object_settles else r
+        return json.dumps({"UPDATE_OBJECTS": [f"dragon{n}", f"cave{n}"]})
+    if role.startswith("final"):
+        return f"{role} prompt END_OF_PROMPT"
+    return f"{role} question {r}"
+
+
+@pytest.mark.parametrize("independent_tracks", [False, True])
+def test_converged_track_stops_asking(tmp_path, independent_tracks):
+    calls = []
+
+    def generate(specs):
+        calls.extend((opts["role"], opts["round"]) for _, _, opts in specs)
+        return [answer(opts, object_settles=False) for _, _, opts in specs]
+
+    history = drive(debate_steps("a girl and a dragon", 4, tmp_path, independent_tracks=independent_tracks,
+                                 converge=0.15), generate)
+    assert [(h.round, h.track) for h in history if h.track == "style"] == [(1, "style"), (2, "style")]
+    assert [h.round for h in history if h.track == "object"] == [1, 2, 3, 4]
+    assert ("ask_style", 3) not in calls and ("ask_object", 4) in calls
+    assert ("final_style", 4) in calls
+
+    events = [e for e in read_events(tmp_path / EVENTS_FILE) if e["ROLE"] == "converge"]
+    assert [(e["ROUND"], e["TRACK"], e["STOPPED"]) for e in events] == [
+        (2, "style", True), (2, "object", False), (3, "object", False), (4, "object", False)]
+
+
+def test_debate_ends_once_both_tracks_converged(tmp_path):
+    calls = []
+
+    def generate(specs):
+        calls.extend((opts["role"], opts["round"]) for _, _, opts in specs)
+        return [answer(opts, object_settles=True) for _, _, opts in specs]
+
+    history = drive(debate_steps("a girl and a dragon", 6, tmp_path, converge=0.15), generate)
+    assert max(h.round for h in history) == 2
+    assert ("final_style", 2) in calls and ("final_object", 2) in calls
+
+
+def test_without_converge_every_round_runs(tmp_path):
+    def generate(specs):
+        return [answer(opts, object_settles=True) for _, _, opts in specs]
+
+    history = drive(debate_steps("a girl and a dragon", 4, tmp_path), generate)
+    assert [h.round for h in history] == [1, 1, 2, 2, 3, 3, 4, 4]
+    assert not [e for e in read_events(tmp_path / EVENTS_FILE) if e["ROLE"] == "converge"]
@@ -0,0 +1,53 @@
+import json
+
+from history_compact import approx_tokens, clip, compact_history, delta_text
+from records import make_record
+
+
+def history(rounds: int) -> list:
+    recs = []
+    for r in range(1, rounds + 1):
+        recs.append(make_record(r, "style", f"style question {r}", json.dumps({
+            "UPDATE_STYLE_BRIEF": f"brief of round {r} " + "detail " * 40,
+            "CHANGES_SINCE_PREV": [f"style change {r}"], "NOTES": "reasoning " * 40})))
+        recs.append(make_record(r, "object", f"object question {r}", json.dumps({
+            "UPDATE_OBJECTS": [f"dragon {r}", "cave"], "CHANGES_SINCE_PREV": [f"object change {r}"]})))
+    return recs
+
+
+def test_delta_text():
+    rec = make_record(2, "style", "q", '{"CHANGES_SINCE_PREV": ["warmer", "thicker"]}')
+    assert delta_text(rec.response) == "- warmer\n- thicker"
+    assert delta_text(make_record(2, "style", "q", '{"PROMPT_SNIPPET": "fauvist cave"}').response) == "fauvist cave"
+    assert delta_text(make_record(2, "style", "q", "x" * 400).response) == "x" * 300 + "..."
+
+
+def test_latest_state_in_full_older_rounds_as_deltas():
+    text = compact_history(history(4), 10000)
+    assert "[Round 4][STYLE]" in text and "brief of round 4" in text and "[Round 4][ASK_OBJECT]" in text
+    assert "[Round 1][STYLE CHANGES]\n- style change 1" in text
+    assert "brief of round 3" not in text and "NOTES" not in text
+
+
+def test_oldest_deltas_dropped_first():
+    full = compact_history(history(6), 10000)
+    budget = approx_tokens(full) - 10
+    text = compact_history(history(6), budget)
+    assert sum(approx_tokens(b) + 1 for b in text.split("\n\n")) <= budget
+    assert "style change 1" not in text and "object change 5" in text
+    assert "brief of round 6" in text
+
+
+def test_latest_blocks_clipped_to_fit():
+    text = compact_history(history(2), 40)
+    assert "[Round 2][STYLE]" in text and "CHANGES]" not in text
+    assert sum(approx_tokens(b) + 1 for b in text.split("\n\n")) <= 40
+
+
+def test_clip_counts_its_ellipsis():
+    for budget in (2, 5, 9, 30):
+        clipped = clip("brushwork " * 40, budget, approx_tokens)
+        assert clipped.endswith("...") and approx_tokens(clipped) <= budget
+    # one token only holds the "..." itself, nothing of the text
+    assert clip("brushwork " * 40, 1, approx_tokens) == ""
+    assert clip("short", 5, approx_tokens) == "short"
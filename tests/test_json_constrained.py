@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from setting_new_pipe import SCHEMA_OBJ_ROUND, SCHEMA_STY_ASK, SCHEMA_STY_ROUND
+
+SCHEMA = {"type": "object", "properties": {
+    "MOOD": {"enum": ["calm", "wild"]},
+    "COLORS": {"type": "array", "items": {"type": "string", "maxLength": 12}, "minItems": 1, "maxItems": 3},
+    "NOTE": {"type": "string", "maxLength": 40},
+}}
+
+
+def check(value, schema):
+    if "enum" in schema:
+        assert value in schema["enum"]
+    elif schema["type"] == "object":
+        assert list(value) == list(schema["properties"])
+        for k, sub in schema["properties"].items():
+            check(value[k], sub)
+    elif schema["type"] == "array":
+        assert schema.get("minItems", 0) <= len(value) <= schema.get("maxItems", 64)
+        for v in value:
+            check(v, schema["items"])
+    elif schema["type"] == "string":
+        assert isinstance(value, str)
+
+
+def prompt_ids(tok, text="Describe the style of a painting."):
+    return tok.apply_chat_template([{"role": "user", "content": text}], add_generation_prompt=True,
+                                   return_tensors="pt", return_dict=True)["input_ids"]
+
+
+@pytest.mark.parametrize("schema", [SCHEMA, SCHEMA_STY_ASK])
+def test_generate_constrained_parses(tiny, schema):
+    from json_constrained import JsonSchemaConstraint, generate_constrained
+    tok, model = tiny
+    c = JsonSchemaConstraint(tok, schema, model.config.vocab_size)
+    out, _ = generate_constrained(model, c, prompt_ids(tok), max_new_tokens=256, do_sample=False)
+    check(json.loads(tok.decode(out)), schema)
+    # keys and punctuation were fast-forwarded, not sampled
+    assert c.forced_count > 0
+
+
+def test_batched_processor_parses(tiny):
+    from transformers import LogitsProcessorList
+    from json_constrained import JsonSchemaConstraint, JsonSchemaLogitsProcessor
+    tok, model = tiny
+    texts = [tok.apply_chat_template([{"role": "user", "content": t}], tokenize=False, add_generation_prompt=True)
+             for t in ("a girl and a dragon", "Fauvism, a cave lit by fire")]
+    inputs = tok(texts, return_tensors="pt", padding=True, padding_side="left")
+    constraints = [JsonSchemaConstraint(tok, SCHEMA, model.config.vocab_size) for _ in texts]
+    processor = JsonSchemaLogitsProcessor(constraints, inputs.input_ids.shape[1], tok.eos_token_id, 96)
+    out = model.generate(**inputs, logits_processor=LogitsProcessorList([processor]), max_new_tokens=96,
+                         do_sample=False, pad_token_id=tok.pad_token_id)
+    for row in out[:, inputs.input_ids.shape[1]:]:
+        check(json.loads(tok.decode(row, skip_special_tokens=True)), SCHEMA)
+
+
+@pytest.mark.parametrize("schema", [SCHEMA, SCHEMA_STY_ROUND, SCHEMA_OBJ_ROUND])
+def test_value_fits_the_smallest_cap(tiny, schema):
+    from transformers import LogitsProcessorList
+    from json_constrained import JsonSchemaConstraint, JsonSchemaLogitsProcessor, generate_constrained, min_tokens
+    tok, model = tiny
+    cap = min_tokens(JsonSchemaConstraint(tok, schema, model.config.vocab_size))
+    out, _ = generate_constrained(model, JsonSchemaConstraint(tok, schema, model.config.vocab_size), prompt_ids(tok),
+                                  max_new_tokens=cap, do_sample=False)
+    assert len(out) == cap
+    check(json.loads(tok.decode(out)), schema)
+
+    # model.generate stops hard at the cap
+    ids = prompt_ids(tok)
+    processor = JsonSchemaLogitsProcessor([JsonSchemaConstraint(tok, schema, model.config.vocab_size)],
+                                          ids.shape[1], tok.eos_token_id, cap)
+    row = model.generate(ids, logits_processor=LogitsProcessorList([processor]), max_new_tokens=cap,
+                         do_sample=False, pad_token_id=tok.pad_token_id)[0, ids.shape[1]:]
+    check(json.loads(tok.decode(row, skip_special_tokens=True)), schema)
+
+
+def test_cap_below_schema_minimum_raises(tiny):
+    from json_constrained import JsonSchemaConstraint, JsonSchemaLogitsProcessor, generate_constrained, min_tokens
+    tok, model = tiny
+    c = JsonSchemaConstraint(tok, SCHEMA_STY_ASK, model.config.vocab_size)
+    with pytest.raises(ValueError, match="too small"):
+        generate_constrained(model, c, prompt_ids(tok), max_new_tokens=min_tokens(c) - 1)
+    with pytest.raises(ValueError, match="too small"):
+        JsonSchemaLogitsProcessor([None, c], 10, tok.eos_token_id, min_tokens(c) - 1)
@@ -0,0 +1,88 @@
+from kv_cache import ConversationCache, PrefixCache
+
+
+def test_prefix_cache_evicts_least_recently_used():
+    model = object()
+    cache = PrefixCache(max_entries=2, max_tokens=10)
+    cache._prefill = lambda m, ids: list(ids)
+    assert cache.get(model, [1, 2, 3]) == ([1, 2, 3], False)
+    cache.get(model, [4, 5])
+    assert cache.get(model, [1, 2, 3]) == ([1, 2, 3], True)
+    # over max_entries: [4, 5] is the least recently used
+    cache.get(model, [6])
+    assert cache.get(model, [4, 5])[1] is False and cache.get(model, [6])[1] is True
+    assert len(cache) == 2 and (cache.hits, cache.misses) == (2, 4)
+
+    # over max_tokens: the oldest entries go until the rest fits
+    cache.get(model, [7] * 8)
+    assert len(cache) == 2 and cache._tokens == 9
+    assert cache.get(model, [6])[1] is True and cache.get(model, [4, 5])[1] is False
+
+    # a prefix longer than max_tokens is computed but never kept
+    assert cache.get(model, list(range(11))) == (list(range(11)), False)
+    assert len(cache) == 2 and cache._tokens == 3
+
+
+class Past:
+    def __init__(self, n):
+        self.n = n
+
+    def crop(self, n):
+        self.n = n
+
+    def get_seq_length(self):
+        return self.n
+
+
+def test_conversation_cache_reuses_the_shared_prefix():
+    cache = ConversationCache()
+    cache.store([1, 2, 3, 4, 5], Past(5))
+    assert cache.take([1, 2, 3, 9, 9]).n == 3
+    # generate needs one uncached token: a prompt equal to the cached ids keeps all but its last token
+    cache.store([1, 2, 3], Past(3))
+    assert cache.take([1, 2, 3]).n == 2
+    assert cache.reused_tokens == 5 and cache.past is None
+
+
+def test_conversation_cache_dropped_when_the_prefix_diverges():
+    cache = ConversationCache()
+    cache.store([1, 2, 3, 4], Past(4))
+    assert cache.take([7, 2, 3, 4, 5]) is None
+    assert (cache.ids, cache.past, cache.reused_tokens) == ([], None, 0)
+    # sharing fewer tokens than min_reuse (the system prompt) drops it too
+    cache.store([1, 2, 3, 4], Past(4))
+    assert cache.take([1, 2, 9], min_reuse=3) is None and cache.past is None
+
+
+def test_cached_debate_matches_uncached(tiny, tmp_path, monkeypatch):
+    import debate_rounds_new_pipe as pipe
+    from metrics import METRICS_FILE
+    from run_log import read_events
+    tok, model = tiny
+    generate = model.generate
+
+    # greedy and short, so both runs have to pick the same tokens
+    def greedy(*args, **kwargs):
+        kwargs = {k: v for k, v in kwargs.items() if k not in ("temperature", "top_p", "top_k")}
+        return generate(*args, **{**kwargs, "max_new_tokens": 8, "do_sample": False})
+
+    monkeypatch.setattr(model, "generate", greedy)
+
+    def debate(outdir):
+        pipe.run_rounds(tok, model, "", "", "", "", "", "", "", init_prompt="a girl and a dragon in the cave",
+                        rounds=3, outdir=outdir, backend=pipe.HFBackend(tok, model))
+        return (outdir / "history.json").read_text(encoding="utf-8")
+
+    pipe.PREFIX_CACHE.clear()
+    misses = pipe.PREFIX_CACHE.misses
+    cached = debate(tmp_path / "cached")
+    # every system prompt is new to the prefix cache, its misses still hand the prefilled past to generate
+    assert "conv" in {rec.get("CACHE") for rec in read_events(tmp_path / "cached" / METRICS_FILE)}
+    assert pipe.PREFIX_CACHE.misses > misses
+
+    run_chat = pipe.run_chat
+    monkeypatch.setattr(pipe, "run_chat", lambda *args, **kwargs: run_chat(
+        *args, **{**kwargs, "prefix_cache": None, "conv_cache": None}))
+    uncached = debate(tmp_path / "uncached")
+    assert {rec.get("CACHE") for rec in read_events(tmp_path / "uncached" / METRICS_FILE)} == {None}
+    assert cached == uncached
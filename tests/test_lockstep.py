@@ -0,0 +1,26 @@
+import json
+
+
+def test_independent_tracks_batch_every_step(tiny, tmp_path, monkeypatch):
+    from debate_rounds_new_pipe import HFBackend, run_rounds
+    tok, model = tiny
+    rows = []
+    generate = model.generate
+
+    # record the rows of every generate call, and keep the random model's answers short
+    def short_generate(*args, **kwargs):
+        rows.append(kwargs["input_ids"].shape[0])
+        return generate(*args, **{**kwargs, "max_new_tokens": 8})
+
+    monkeypatch.setattr(model, "generate", short_generate)
+    history = run_rounds(tok, model, "", "", "", "", "", "", "", init_prompt="a girl and a dragon in the cave",
+                         rounds=2, outdir=tmp_path, backend=HFBackend(tok, model), independent_tracks=True)
+
+    # split, round 1, round 2 ask and answer, final writers: one generate call with both tracks each
+    assert rows == [2, 2, 2, 2, 2]
+    assert [(h.round, h.track) for h in history] == [(1, "style"), (1, "object"), (2, "style"), (2, "object")]
+
+    saved = json.loads((tmp_path / "history.json").read_text(encoding="utf-8"))
+    assert [sorted(entry) for entry in saved] == [["ASK_STYLE", "ROUND", "STYLE_RESPONSE"],
+                                                  ["ASK_OBJECT", "OBJECT_RESPONSE", "ROUND"]] * 2
+    assert [entry["ROUND"] for entry in saved] == [1, 1, 2, 2]
@@ -0,0 +1,57 @@
+from backends import build_messages
+from metrics import METRICS_FILE, rollup, with_metrics, write_summary
+from run_log import EventLog, read_events
+
+
+def test_rollup_shares_step_wall_time():
+    records = [
+        {"ROLE": "style", "ROUND": 1, "BATCH": 2, "WALL_S": 4.0, "NEW_TOKENS": 30, "DECODE_S": 1.0, "PREFILL_S": 0.5},
+        {"ROLE": "object", "ROUND": 1, "BATCH": 2, "WALL_S": 4.0, "NEW_TOKENS": 10, "DECODE_S": 0.5, "PREFILL_S": 0.5},
+        {"ROLE": "style", "ROUND": 2, "BATCH": 1, "WALL_S": 1.0, "CACHE": "response"},
+    ]
+    by_role = rollup(records, "ROLE")
+    assert by_role["style"]["WALL_S"] == 3.0 and by_role["object"]["WALL_S"] == 2.0
+    assert by_role["style"]["TOKENS_PER_S"] == 30.0 and by_role["style"]["CACHE_HITS"] == 1
+    assert sum(row["WALL_S"] for row in rollup(records, "ROUND").values()) == 5.0
+
+
+def test_batched_rows_split_the_generate_call(tiny, tmp_path):
+    from debate_rounds_new_pipe import HFBackend
+    tok, model = tiny
+    backend = HFBackend(tok, model)
+    log = EventLog(tmp_path / METRICS_FILE)
+    generate = with_metrics(lambda specs: backend.generate([build_messages(s, u) for s, u, _ in specs],
+                                                           [opts for _, _, opts in specs]), log)
+    opts = {"max_new_tokens": 16, "do_sample": False}
+    generate([("system", "a girl and a dragon", {**opts, "role": "style", "round": 1}),
+              ("system", "Fauvism, a cave lit by fire, bright colors", {**opts, "role": "object", "round": 1})])
+    log.close()
+
+    records = read_events(tmp_path / METRICS_FILE)
+    assert [rec["GEN_BATCH"] for rec in records] == [2, 2]
+    # the rows add up to the one generate call, which fits in the step
+    assert sum(rec["PREFILL_S"] + rec["DECODE_S"] for rec in records) <= records[0]["WALL_S"]
+    assert records[0]["PROMPT_TOKENS"] < records[1]["PROMPT_TOKENS"]
+    assert records[0]["PREFILL_S"] < records[1]["PREFILL_S"]
+
+    write_summary(tmp_path)
+    by_role = rollup(records, "ROLE")
+    assert sum(row["WALL_S"] for row in by_role.values()) == records[0]["WALL_S"]
+
+
+def test_prefix_cache_miss_is_not_a_hit(tiny, monkeypatch):
+    import time
+    from debate_rounds_new_pipe import run_chat
+    from kv_cache import PrefixCache
+    tok, model = tiny
+    cache = PrefixCache()
+    prefill = cache._prefill
+    # a slow miss prefill has to show up in the call's prefill time
+    monkeypatch.setattr(cache, "_prefill", lambda m, ids: time.sleep(0.2) or prefill(m, ids))
+    chat = build_messages("You are the STYLE Agent.", "a girl and a dragon")
+    miss, hit = {}, {}
+    run_chat(tok, model, chat, max_new_tokens=4, do_sample=False, prefix_cache=cache, metrics=miss)
+    run_chat(tok, model, chat, max_new_tokens=4, do_sample=False, prefix_cache=cache, metrics=hit)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert miss["CACHE"] is None and miss["CACHED_TOKENS"] == 0 and miss["PREFILL_S"] >= 0.2
+    assert hit["CACHE"] == "prefix" and hit["CACHED_TOKENS"] > 0 and hit["PREFILL_S"] < 0.2
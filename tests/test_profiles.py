@@ -0,0 +1,51 @@
+from backends import SAMPLING_KEYS, build_messages, generation_params
+from debate_rounds_new_pipe import json_opts, role_opts
+from setting_new_pipe import (
+    PROFILE_DEFAULT, ROLE_PROFILES, SCHEMA_OBJ_ASK, SCHEMA_OBJ_ROUND, SCHEMA_STY_ASK, SCHEMA_STY_ROUND,
+)
+
+
+def test_profiles_are_complete():
+    for role, profile in ROLE_PROFILES.items():
+        assert "do_sample" in profile, role
+        if profile["do_sample"]:
+            assert "temperature" in profile, role
+        else:
+            assert not set(profile) & set(SAMPLING_KEYS), role
+
+
+# the calls generate_chats may batch differ only in per-call options (role, schema, stops ...)
+def test_paired_roles_batch_together():
+    per_call = ("role", "round", "schema", "thinking", "stop", "stop_json")
+    for style, obj in ((json_opts(SCHEMA_STY_ASK, True, "ask_style", 2), json_opts(SCHEMA_OBJ_ASK, True, "ask_object", 2)),
+                       (json_opts(SCHEMA_STY_ROUND, True, "style", 2), json_opts(SCHEMA_OBJ_ROUND, True, "object", 2))):
+        gen = [{k: v for k, v in generation_params(p).items() if k not in per_call} for p in (style, obj)]
+        assert gen[0] == gen[1]
+        assert gen[0]["max_new_tokens"] <= 4096
+
+
+def test_generation_params():
+    assert generation_params({}) == PROFILE_DEFAULT
+    # a call with a role only carries its profile, nothing is filled in
+    split = generation_params({**role_opts("split_style", 1), "temperature": 0.7})
+    assert split["max_new_tokens"] == 192 and not set(split) & set(SAMPLING_KEYS)
+    assert "max_new_tokens" not in generation_params({"role": "custom", "do_sample": True})
+
+
+def test_hf_calls_get_their_profile(tiny, monkeypatch):
+    from debate_rounds_new_pipe import HFBackend
+    tok, model = tiny
+    seen = []
+    generate = model.generate
+    monkeypatch.setattr(model, "generate", lambda *args, **kwargs: seen.append(kwargs) or generate(*args, **kwargs))
+
+    backend = HFBackend(tok, model)
+    chats = [build_messages("system", "a girl and a dragon"), build_messages("system", "a fox on a bridge")]
+    # two greedy extractors batched (generate_chats), one sampled final writer alone (run_chat)
+    backend.generate(chats, [role_opts("split_style", 1), role_opts("split_object", 1)])
+    backend.generate(chats[:1], role_opts("final_style", 2))
+    split, final = seen
+    assert split["do_sample"] is False and split["max_new_tokens"] == 192
+    assert not set(split) & set(SAMPLING_KEYS)
+    assert (final["do_sample"], final["temperature"], final["top_p"]) == (True, 0.5, 0.9)
+    assert "top_k" not in final and final["max_new_tokens"] == 192
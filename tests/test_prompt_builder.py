@@ -0,0 +1,40 @@
+from history_compact import approx_tokens
+from prompt_builder import TEMPLATE_TOKENS, PromptBuilder, TokenCounter
+from run_log import EventLog, read_events
+
+
+def segments(history: list) -> list:
+    return [f"[Round {r}]\n" + "brushwork " * 20 for r in history]
+
+
+def test_token_counter_counts_each_text_once():
+    calls = []
+    count = TokenCounter(lambda text: calls.append(text) or approx_tokens(text), max_entries=2)
+    assert [count("a b"), count("a b"), count("")] == [1, 1, 0]
+    assert calls == ["a b"] and (count.hits, count.misses) == (1, 1)
+    count("c")
+    count("d")
+    count("a b")
+    assert calls == ["a b", "c", "d", "a b"]
+
+
+def test_oldest_segments_dropped_to_fit_the_budget(tmp_path):
+    log = EventLog(tmp_path / "events.jsonl")
+    budget = 200
+    builder = PromptBuilder(approx_tokens, {"style": budget}, segments, log=log)
+    prompt = builder.build(3, "style", "system prompt", "tail", history=list(range(1, 11)))
+    log.close()
+
+    assert "[Round 10]" in prompt and "[Round 1]\n" not in prompt
+    assert prompt.startswith("【HISTORY】\n") and prompt.endswith("tail")
+    event, = read_events(tmp_path / "events.jsonl")
+    assert event["ROLE"] == "style" and event["BUDGET"] == budget and event["DROPPED_SEGMENTS"] > 0
+    assert event["PROMPT_TOKENS"] <= budget
+    assert event["PROMPT_TOKENS"] >= TEMPLATE_TOKENS + approx_tokens("system prompt") + event["HISTORY_TOKENS"]
+
+
+def test_everything_fits_under_a_large_budget():
+    builder = PromptBuilder(approx_tokens, {}, segments)
+    prompt = builder.build(2, "ask_style", "system", "tail", history=[1, 2], head="head\n")
+    assert prompt == "head\n【HISTORY】\n" + "\n\n".join(segments([1, 2])) + "\n\ntail"
+    assert builder.build(1, "split_style", "system", "tail") == "tail"
@@ -0,0 +1,47 @@
+import json
+
+from debate_rounds_new_pipe import debate_steps, drive, fmt_hist
+from records import make_record, records_from_events
+from run_log import EVENTS_FILE, read_events
+
+
+def answer(opts):
+    role, r = opts["role"], opts["round"]
+    if role == "style":
+        return json.dumps({"UPDATE_STYLE_BRIEF": f"thick brushwork round {r}",
+                           "CHANGES_SINCE_PREV": [f"change {r}"], "NOTES": "long reasoning the writers do not need"})
+    if role == "object":
+        return json.dumps({"UPDATE_OBJECTS": [f"dragon {r}", "cave"], "NOTES": "long reasoning"})
+    if role.startswith("final"):
+        return f"{role} prompt END_OF_PROMPT"
+    return f"{role} question {r}"
+
+
+def test_turn_parses_once():
+    rec = make_record(2, "style", "what palette?", '{"UPDATE_STYLE_BRIEF": "warm", "CHANGES_SINCE_PREV": []}')
+    assert rec.ask.role == "ask_style" and rec.response.field == "STYLE_RESPONSE"
+    assert rec.response.get("UPDATE_STYLE_BRIEF") == "warm"
+    assert rec.ask.data is None
+    assert make_record(1, "object", "q", "not json").response.get("UPDATE_OBJECTS") is None
+
+
+def test_final_writers_read_the_full_track_history(tmp_path):
+    prompts = {}
+
+    def generate(specs):
+        for _, user, opts in specs:
+            prompts[opts["role"]] = user
+        return [answer(opts) for _, _, opts in specs]
+
+    history = drive(debate_steps("a girl and a dragon", 2, tmp_path), generate)
+    assert [(h.round, h.track) for h in history] == [(1, "style"), (1, "object"), (2, "style"), (2, "object")]
+
+    # the baseline prompt: every answer and every ASK turn of the track
+    for track in ("style", "object"):
+        hist = fmt_hist([h for h in history if h.track == track])
+        assert prompts[f"final_{track}"].startswith(f"USER INITIAL PROMPT: a girl and a dragon\nHISTORY:\n{hist}\n\nStudy HISTORY")
+    assert "NOTES" in prompts["final_style"] and f"[Round 2][ASK_STYLE]\nask_style question 2" in prompts["final_style"]
+
+    # the history comes back from events.jsonl unchanged
+    events = read_events(tmp_path / EVENTS_FILE)
+    assert [h.as_dict() for h in records_from_events(events)] == [h.as_dict() for h in history]
@@ -0,0 +1,69 @@
+import os
+
+from backends import StubBackend, build_messages
+from response_cache import CachedBackend, ResponseCache
+
+
+class CountingBackend(StubBackend):
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, chats, params=None):
+        self.calls += len(chats)
+        return super().generate(chats, params)
+
+
+CHATS = [build_messages("system", f"question {i}") for i in range(3)]
+GREEDY = {"do_sample": False, "max_new_tokens": 64}
+
+
+def test_second_run_generates_nothing(tmp_path):
+    inner = CountingBackend()
+    backend = CachedBackend(inner, ResponseCache(tmp_path), "tiny")
+    first = backend.generate(CHATS, GREEDY)
+    assert backend.generate(CHATS, [{**GREEDY, "role": "style", "round": 2}] * 3) == first
+    assert inner.calls == 3 and backend.cache.hits == 3
+
+    # a new process sees the same entries
+    again = CachedBackend(inner, ResponseCache(tmp_path), "tiny")
+    assert again.generate(CHATS, GREEDY) == first and inner.calls == 3
+
+
+def test_key_covers_model_and_sampling(tmp_path):
+    backend = CachedBackend(StubBackend(), ResponseCache(tmp_path), "tiny")
+    base = backend.key(CHATS[0], GREEDY)
+    assert backend.key(CHATS[0], {**GREEDY, "role": "ask_style", "metrics": {}}) == base
+    assert backend.key(CHATS[0], {**GREEDY, "max_new_tokens": 32}) != base
+    assert backend.key(CHATS[1], GREEDY) != base
+    assert CachedBackend(StubBackend(), backend.cache, "other").key(CHATS[0], GREEDY) != base
+
+
+def test_sampled_calls_need_a_seed(tmp_path):
+    backend = CachedBackend(StubBackend(), ResponseCache(tmp_path), "tiny")
+    assert not backend.cacheable({"temperature": 0.7, "top_p": 0.9})
+    assert backend.cacheable({"temperature": 0.7, "seed": 42})
+    assert backend.cacheable(GREEDY)
+    assert CachedBackend(StubBackend(), backend.cache, "tiny", sampled=True).cacheable({"temperature": 0.7})
+
+
+def test_running_total_and_lru_eviction(tmp_path, monkeypatch):
+    cache = ResponseCache(tmp_path, max_bytes=10_000)
+    walks = []
+    entries = cache.entries
+    monkeypatch.setattr(cache, "entries", lambda: walks.append(1) or entries())
+
+    for i in range(5):
+        cache.put(f"{i:02d}" + "0" * 62, "x" * 1000)
+        os.utime(cache.path(f"{i:02d}" + "0" * 62), (i, i))
+    assert cache.total_bytes == sum(size for _, size, _ in entries())
+    cache.evict()
+    assert walks == []
+
+    # entry 0 was read last, so entry 1 is the least recently used
+    cache.get("00" + "0" * 62)
+    cache.max_bytes = cache.total_bytes - 1
+    cache.evict()
+    assert walks == [1]
+    assert not cache.path("01" + "0" * 62).exists()
+    assert cache.path("00" + "0" * 62).exists()
+    assert cache.total_bytes <= cache.max_bytes
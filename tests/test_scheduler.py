@@ -0,0 +1,57 @@
+import os
+from pathlib import Path
+
+from checkpoint import STATE_FILE
+from scheduler import Scheduler, job_log, parse_device, redirect_fds
+
+
+def test_parse_device():
+    assert parse_device("cpu:8") == {"DEVICE": "cpu:8", "CUDA_VISIBLE_DEVICES": "", "THREADS": 8}
+    assert parse_device("cuda:2")["CUDA_VISIBLE_DEVICES"] == "2"
+    assert parse_device("0,1")["CUDA_VISIBLE_DEVICES"] == "0,1"
+
+
+def test_job_log_named_after_run_dir(tmp_path):
+    assert job_log(tmp_path, "runs/20250907/153000").name == "job_runs_20250907_153000.log"
+    assert job_log(tmp_path, "runs/1/20250907/153000") != job_log(tmp_path, "runs/2/20250907/153000")
+
+
+def test_redirect_fds_modes(tmp_path):
+    path = tmp_path / "logs" / "job.log"
+    with redirect_fds(path, "w"):
+        os.write(1, b"first\n")
+    with redirect_fds(path, "a"):
+        os.write(2, b"retry\n")
+    assert path.read_text() == "first\nretry\n"
+    with redirect_fds(path, "w"):
+        os.write(1, b"second run\n")
+    assert path.read_text() == "second run\n"
+
+
+def jobs(outdir, log_dir):
+    config = {"PROMPT": "a girl and a dragon in the cave", "ROUNDS": 1, "INDEPENDENT_TRACKS": False,
+              "CONSTRAINED": False, "HISTORY_BUDGET": None, "SEED": None, "CONVERGE": None}
+    run_dirs = [outdir / "20250907" / "153000", outdir / "20250907" / "153000_1"]
+    return [{"ID": i, "RUN_DIR": str(d), "LOG": str(job_log(log_dir, d)), "CONFIG": config, "ATTEMPT": 1}
+            for i, d in enumerate(run_dirs)]
+
+
+def test_second_run_does_not_mix_into_old_logs(tmp_path):
+    log_dir = tmp_path / "logs"
+    opts = {"backend": "stub", "model": "stub", "quant": None, "log_dir": str(log_dir),
+            "cache_dir": None, "cache_size_mb": 1, "cache_sampled": False}
+
+    first = jobs(tmp_path / "a", log_dir)
+    assert len(Scheduler(["cpu", "cpu"], opts).run(first)["DONE"]) == 2
+    # the same log dir again, with a run dir whose log name collides with the first run's
+    second = jobs(tmp_path / "a", log_dir)[:1]
+    (Path(second[0]["RUN_DIR"]) / STATE_FILE).unlink()
+    assert len(Scheduler(["cpu"], opts).run(second)["DONE"]) == 1
+
+    text = open(second[0]["LOG"], encoding="utf-8").read()
+    assert text.count("[job 0] attempt 1") == 1
+    assert text.count("Done.") == 1
+    worker_log = (log_dir / "worker_0.log").read_text(encoding="utf-8")
+    assert worker_log.count("[worker 0] device") == 1
+    assert (log_dir / "worker_1.log").exists()
+    assert len({job["LOG"] for job in first}) == 2
@@ -0,0 +1,45 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from stopping import AgentStoppingCriteria, JsonScanner
+
+
+def test_json_scanner_ignores_braces_in_strings():
+    scanner = JsonScanner()
+    assert not scanner.feed('noise } {"A": "b}", "C": {"D": "\\"}"}')
+    assert scanner.feed("}")
+    assert not JsonScanner().feed('"{"')
+
+
+# feed the generated ids one at a time, like generate does; returns the text each row stopped after (None: never)
+def run_criteria(tok, texts, stop_strings, stop_json, thinking=None):
+    prompt = tok.encode("prompt", add_special_tokens=False)
+    rows = [tok.encode(t, add_special_tokens=False) for t in texts]
+    n = max(len(r) for r in rows)
+    rows = [r + [tok.pad_token_id] * (n - len(r)) for r in rows]
+    criteria = AgentStoppingCriteria(tok, len(prompt), stop_strings, stop_json, thinking)
+    stopped = [None] * len(rows)
+    for step in range(1, n + 1):
+        ids = torch.tensor([prompt + r[:step] for r in rows])
+        for i, done in enumerate(criteria(ids, None).tolist()):
+            if done and stopped[i] is None:
+                stopped[i] = tok.decode(rows[i][:step], skip_special_tokens=True)
+    return stopped
+
+
+def test_rows_stop_on_their_own_condition(tiny):
+    tok, _ = tiny
+    stopped = run_criteria(tok, ['{"A": "b}"} and more text', "one line END_OF_PROMPT and more", "never stops"],
+                           [None, ["END_OF_PROMPT"], ["END_OF_PROMPT"]], [True, False, False])
+    assert stopped[0] == '{"A": "b}"}'
+    assert stopped[1].endswith("END_OF_PROMPT")
+    assert stopped[2] is None
+
+
+def test_thinking_rows_only_stop_after_the_think_span(tiny):
+    tok, _ = tiny
+    stopped = run_criteria(tok, ['plan {"X": 1} END_OF_PROMPT</think>\n\n{"A": "b"} more'],
+                           [["END_OF_PROMPT"]], [True], thinking=[True])
+    assert stopped[0].endswith('{"A": "b"}')
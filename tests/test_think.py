@@ -0,0 +1,44 @@
+import pytest
+
+from think import ThinkStream, answer_start, clean_answer, split_think, split_think_batch
+
+
+def test_answer_start_and_clean_answer():
+    assert answer_start([5, 4, 7, 4, 9], 4) == 4
+    assert answer_start([5, 7], 4) == 0
+    assert clean_answer("analysis... assistantfinal  the answer ") == "the answer"
+
+
+def ids(tok, text: str) -> list:
+    return tok.encode(text, add_special_tokens=False)
+
+
+def test_split_think(tiny):
+    tok, _ = tiny
+    assert split_think(tok, ids(tok, "<think>plan the brief</think>\n\n{\"A\": 1}")) == ("plan the brief", '{"A": 1}')
+    # thinking models open the span in the prompt, only </think> is generated
+    assert split_think(tok, ids(tok, "plan</think>answer")) == ("plan", "answer")
+    assert split_think(tok, ids(tok, "no think span")) == ("", "no think span")
+
+
+def test_split_think_batch_drops_padding(tiny):
+    torch = pytest.importorskip("torch")
+    tok, _ = tiny
+    rows = [ids(tok, "<think>a</think>first"), ids(tok, "second")]
+    n = max(len(r) for r in rows)
+    padded = torch.tensor([[tok.pad_token_id] * (n - len(r)) + r for r in rows])
+    assert split_think_batch(tok, padded) == [("a", "first"), ("", "second")]
+
+
+def test_think_stream_hides_the_think_span(tiny):
+    tok, _ = tiny
+    text = "<think>plan the brief</think>\n\nthe answer: a girl and a dragon"
+    stream = ThinkStream(tok)
+    pieces = [stream.feed([t]) for t in ids(tok, text)]
+    assert "".join(pieces).strip() == "the answer: a girl and a dragon"
+    assert stream.answer == "the answer: a girl and a dragon" and stream.thinking == "plan the brief"
+
+    # prompt already inside <think>: everything before </think> is thinking
+    stream = ThinkStream(tok, thinking=True)
+    assert "".join(stream.feed([t]) for t in ids(tok, "plan</think>answer")).strip() == "answer"
+    assert stream.thinking == "plan"
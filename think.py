@@ -0,0 +1,92 @@
+# Qwen3 ids of <think> / </think>, used when the tokenizer does not know them
+THINK_START_ID = 151667
+THINK_END_ID = 151668
+
+
+def think_ids(tok) -> tuple:
+    vocab = tok.get_vocab()
+    return vocab.get("<think>", THINK_START_ID), vocab.get("</think>", THINK_END_ID)
+
+
+# index just past the last </think> in ids, 0 if the model never closed a think span
+def answer_start(ids: list, end_id: int) -> int:
+    for i in range(len(ids) - 1, -1, -1):
+        if ids[i] == end_id:
+            return i + 1
+    return 0
+
+
+def clean_answer(text: str) -> str:
+    # gpt-oss style outputs put the answer after "assistantfinal"
+    if "assistantfinal" in text:
+        text = text.rsplit("assistantfinal", 1)[-1]
+    return text.strip()
+
+
+# (thinking, answer) of one generated sequence, each span decoded exactly once
+def split_think(tok, output_ids) -> tuple:
+    return split_think_batch(tok, [output_ids])[0]
+
+
+# same for a batch of rows (list of id lists or a 2D tensor); padding / eos are special tokens and drop out,
+# all spans of the batch go through one batch_decode call
+def split_think_batch(tok, rows) -> list:
+    _, end_id = think_ids(tok)
+    spans = []
+    for row in rows:
+        ids = row.tolist() if hasattr(row, "tolist") else list(row)
+        k = answer_start(ids, end_id)
+        spans.append(ids[:max(k - 1, 0)])
+        spans.append(ids[k:])
+    texts = tok.batch_decode(spans, skip_special_tokens=True)
+    return [(texts[i].replace("<think>", "").strip(), clean_answer(texts[i + 1]))
+            for i in range(0, len(texts), 2)]
+
+
+# incremental version for streamed generation: feed() token ids as they come, get back the new answer text.
+# everything inside <think> ... </think> is kept apart in thinking_ids and never returned;
+# thinking=True when the prompt already opened the think span (thinking models).
+class ThinkStream:
+    def __init__(self, tok, thinking: bool = False):
+        self.tok = tok
+        self.start_id, self.end_id = think_ids(tok)
+        self.in_think = thinking
+        self.thinking_ids = []
+        self.answer_ids = []
+        # answer_ids[prefix_offset:read_offset] is the decoded context of the text already returned
+        self.prefix_offset = 0
+        self.read_offset = 0
+
+    def feed(self, ids) -> str:
+        for t in (ids.tolist() if hasattr(ids, "tolist") else ids):
+            t = int(t)
+            if t == self.start_id:
+                self.in_think = True
+            elif t == self.end_id:
+                # a later think span swallows whatever was taken as answer before it
+                self.in_think = False
+                self.thinking_ids.extend(self.answer_ids)
+                self.answer_ids = []
+                self.prefix_offset = self.read_offset = 0
+            elif self.in_think:
+                self.thinking_ids.append(t)
+            else:
+                self.answer_ids.append(t)
+
+        # decode only a short window, so every token costs the same however long the answer gets
+        prefix = self.tok.decode(self.answer_ids[self.prefix_offset:self.read_offset], skip_special_tokens=True)
+        text = self.tok.decode(self.answer_ids[self.prefix_offset:], skip_special_tokens=True)
+        # hold back a trailing partial UTF-8 character until its remaining bytes arrive
+        if len(text) <= len(prefix) or text.endswith("\ufffd"):
+            return ""
+        self.prefix_offset = self.read_offset
+        self.read_offset = len(self.answer_ids)
+        return text[len(prefix):]
+
+    @property
+    def answer(self) -> str:
+        return clean_answer(self.tok.decode(self.answer_ids, skip_special_tokens=True))
+
+    @property
+    def thinking(self) -> str:
+        return self.tok.decode(self.thinking_ids, skip_special_tokens=True).strip()